@@ -9,17 +9,58 @@ import tempfile
 import threading
 import queue
 import time
+import functools
+import random
+import socket
+import re
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_futures
 import betfairlightweight
 from betfairlightweight import filters
 from betfairlightweight.streaming import StreamListener
-from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timedelta, timezone
 import logging
 
+from market_view import MarketView
+from order_queue import MarketOrderQueue
+from tick_ladder import tick_offset
+from event_index import EventIndex, event_sort_key
+
 logger = logging.getLogger(__name__)
 
+# Cleared orders (settlement)
+CLEARED_PAGE_SIZE = 1000                       # max record per pagina listClearedOrders
+CLEARED_BACKFILL_DAYS = 7                      # backfill iniziale senza watermark
+CLEARED_SYNC_OVERLAP = timedelta(minutes=5)    # sovrapposizione sul watermark
+
+# Current orders
+CURRENT_ORDERS_PAGE_SIZE = 1000                # max record per pagina listCurrentOrders
+ORDERS_RESYNC_SEC = 300.0                      # snapshot REST completo (rimuove ordini spariti)
+ORDERS_DELTA_OVERLAP = 2.0                     # sovrapposizione sul watermark delta (secondi)
+
+# Market data request weight (limite Betfair: 200 punti per richiesta)
+MARKET_DATA_WEIGHT_LIMIT = 200
+CATALOGUE_PROJECTION_WEIGHTS = {'MARKET_DESCRIPTION': 1, 'RUNNER_METADATA': 1}
+BOOK_PRICE_WEIGHTS = {
+    'SP_AVAILABLE': 3, 'SP_TRADED': 7, 'EX_BEST_OFFERS': 5,
+    'EX_ALL_OFFERS': 17, 'EX_TRADED': 17,
+}
+BOOK_BASE_WEIGHT = 2            # listMarketBook senza price projection
+MARKET_FETCH_WORKERS = 4        # chunk scaricati in parallelo
+EVENT_CATALOGUE_TTL = 300.0     # seconds - catalogue mercati per evento
+EVENT_INPLAY_TTL = 30.0         # seconds - stato in-play mercati per evento
+
 # Retry configuration
 MAX_RETRIES = 3
-RETRY_DELAY = 1.0  # seconds
+RETRY_DELAY = 1.0  # seconds - base backoff esponenziale
+RETRY_MAX_DELAY = 8.0  # seconds - tetto backoff
+RETRY_BUDGET_RATIO = 0.2  # Retry consentiti per chiamata (20%)
+RETRY_BUDGET_MAX = 10.0  # Token massimi nel budget retry per endpoint
+BREAKER_FAILURE_THRESHOLD = 5  # Errori transitori consecutivi prima di aprire
+BREAKER_RESET_TIMEOUT = 30.0  # seconds - apertura prima di HALF_OPEN
 
 # ==============================================================================
 # PERFORMANCE: MARKET CACHE
@@ -87,8 +128,75 @@ def get_market_cache():
 # PERFORMANCE METRICS
 # ==============================================================================
 
+LATENCY_WINDOW = 512     # Campioni latenza per endpoint (ring buffer, memoria fissa)
+RATE_WINDOW_SEC = 60     # Finestra per calls/min (bucket da 1 secondo)
+
+
+class EndpointStats:
+    """Statistiche a memoria fissa per un singolo endpoint.
+    
+    - Ring buffer delle ultime LATENCY_WINDOW latenze (p50/p95/p99)
+    - Ring buffer esiti (error rate recente)
+    - 60 bucket da 1 secondo per calls/min (nessuna lista di timestamp)
+    """
+    
+    __slots__ = ('latencies', 'outcomes', 'calls', 'errors', '_buckets', '_bucket_sec')
+    
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self._buckets = [0] * RATE_WINDOW_SEC
+        self._bucket_sec = [0] * RATE_WINDOW_SEC
+    
+    def record(self, latency_ms, error, now):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        if latency_ms is not None:
+            self.latencies.append(latency_ms)
+        self.outcomes.append(1 if error else 0)
+        
+        sec = int(now)
+        idx = sec % RATE_WINDOW_SEC
+        if self._bucket_sec[idx] != sec:
+            self._bucket_sec[idx] = sec
+            self._buckets[idx] = 0
+        self._buckets[idx] += 1
+    
+    def calls_per_min(self, now):
+        sec = int(now)
+        return sum(
+            count for count, bucket_sec in zip(self._buckets, self._bucket_sec)
+            if sec - bucket_sec < RATE_WINDOW_SEC
+        )
+    
+    def percentiles(self, points=(50, 95, 99)):
+        if not self.latencies:
+            return {p: 0 for p in points}
+        ordered = sorted(self.latencies)
+        last = len(ordered) - 1
+        return {p: ordered[min(last, int(round(p / 100.0 * last)))] for p in points}
+    
+    def snapshot(self, now):
+        pct = self.percentiles()
+        recent = len(self.outcomes)
+        avg = sum(self.latencies) / len(self.latencies) if self.latencies else 0
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'calls_per_min': self.calls_per_min(now),
+            'error_rate': round(sum(self.outcomes) / recent * 100, 1) if recent else 0,
+            'avg_ms': round(avg, 1),
+            'p50_ms': round(pct[50], 1),
+            'p95_ms': round(pct[95], 1),
+            'p99_ms': round(pct[99], 1),
+        }
+
+
 class PerformanceMetrics:
-    """Track API performance metrics."""
+    """Track API performance metrics (memoria fissa, per endpoint)."""
     
     def __init__(self):
         self._lock = threading.Lock()
@@ -96,17 +204,34 @@ class PerformanceMetrics:
     
     def reset(self):
         with self._lock:
-            self._api_calls = []
-            self._latencies = []
+            self._total = EndpointStats()
+            self._endpoints = {}
+            self._ttfb = {}
+            self._ttfb_after_idle = EndpointStats()
             self._replace_calls = 0
             self._replace_skipped = 0
             self._start_time = time.time()
     
-    def record_api_call(self, latency_ms=None):
+    def record_api_call(self, latency_ms=None, endpoint=None, error=False):
+        now = time.time()
         with self._lock:
-            self._api_calls.append(time.time())
-            if latency_ms:
-                self._latencies.append(latency_ms)
+            self._total.record(latency_ms, error, now)
+            if endpoint:
+                stats = self._endpoints.get(endpoint)
+                if stats is None:
+                    stats = self._endpoints[endpoint] = EndpointStats()
+                stats.record(latency_ms, error, now)
+    
+    def record_ttfb(self, method, ttfb_ms, after_idle=False):
+        """Time-to-first-byte HTTP per metodo JSON-RPC (hook della sessione)."""
+        now = time.time()
+        with self._lock:
+            stats = self._ttfb.get(method)
+            if stats is None:
+                stats = self._ttfb[method] = EndpointStats()
+            stats.record(ttfb_ms, False, now)
+            if after_idle:
+                self._ttfb_after_idle.record(ttfb_ms, False, now)
     
     def record_replace(self, executed=True):
         with self._lock:
@@ -115,25 +240,35 @@ class PerformanceMetrics:
             else:
                 self._replace_skipped += 1
     
+    def get_endpoint_metrics(self):
+        """Metriche per endpoint: {nome: {calls_per_min, p50_ms, p95_ms, p99_ms, error_rate, ...}}."""
+        with self._lock:
+            now = time.time()
+            return {name: stats.snapshot(now) for name, stats in self._endpoints.items()}
+    
     def get_metrics(self):
         with self._lock:
             now = time.time()
             elapsed_min = max(1, (now - self._start_time) / 60)
-            
-            recent_calls = [t for t in self._api_calls if now - t < 60]
-            
-            avg_latency = sum(self._latencies[-100:]) / len(self._latencies[-100:]) if self._latencies else 0
+            total = self._total.snapshot(now)
             
             total_replace = self._replace_calls + self._replace_skipped
             replace_rate = (self._replace_calls / total_replace * 100) if total_replace > 0 else 0
             
             return {
-                'api_calls_per_min': round(len(recent_calls), 1),
-                'avg_latency_ms': round(avg_latency, 1),
+                'api_calls_per_min': round(total['calls_per_min'], 1),
+                'avg_latency_ms': total['avg_ms'],
+                'p50_latency_ms': total['p50_ms'],
+                'p95_latency_ms': total['p95_ms'],
+                'p99_latency_ms': total['p99_ms'],
+                'error_rate': total['error_rate'],
                 'replace_executed': self._replace_calls,
                 'replace_skipped': self._replace_skipped,
                 'replace_rate': round(replace_rate, 1),
                 'uptime_min': round(elapsed_min, 1),
+                'endpoints': {name: stats.snapshot(now) for name, stats in self._endpoints.items()},
+                'ttfb': {name: stats.snapshot(now) for name, stats in self._ttfb.items()},
+                'ttfb_after_idle': self._ttfb_after_idle.snapshot(now),
                 'cache_stats': _market_cache.get_stats()
             }
 
@@ -142,22 +277,246 @@ _perf_metrics = PerformanceMetrics()
 def get_performance_metrics():
     return _perf_metrics
 
-def with_retry(func):
-    """Decorator to add retry logic for API calls."""
+
+_instrument_state = threading.local()
+
+
+def instrumented(func=None, endpoint=None):
+    """Misura latenza ed esito di un metodo client.
+    
+    Solo la chiamata piu esterna viene registrata (es. place_bet -> place_bets
+    conta come un'unica chiamata 'place_bet').
+    Usabile anche come @instrumented(endpoint='listMarketBook').
+    """
+    if func is None:
+        return lambda f: instrumented(f, endpoint=endpoint)
+    
+    name = endpoint or func.__name__
+    
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
+        depth = getattr(_instrument_state, 'depth', 0)
+        if depth:
+            return func(*args, **kwargs)
+        _instrument_state.depth = 1
+        start = time.perf_counter()
+        error = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            _instrument_state.depth = 0
+            _perf_metrics.record_api_call(
+                (time.perf_counter() - start) * 1000, endpoint=name, error=error
+            )
+    
+    wrapper._instrumented = True
+    return wrapper
+
+
+def no_instrument(func):
+    """Esclude un metodo dalle metriche: metodi locali, o composti le cui
+    chiamate exchange sono misurate dove avvengono (es. listMarketBook)."""
+    func._instrumented = True
+    return func
+
+
+def instrument_client(cls):
+    """Class decorator: strumenta automaticamente tutti i metodi pubblici."""
+    for attr_name, attr in list(vars(cls).items()):
+        if attr_name.startswith('_') or not callable(attr):
+            continue
+        if isinstance(attr, (staticmethod, classmethod)) or getattr(attr, '_instrumented', False):
+            continue
+        setattr(cls, attr_name, instrumented(attr))
+    return cls
+
+# ==============================================================================
+# RESILIENZA: BACKOFF CON JITTER, CIRCUIT BREAKER, RETRY BUDGET
+# ==============================================================================
+
+TRANSIENT_ERROR_MARKERS = ('502', '503', '504', 'timeout', 'timed out', 'connection', 'network')
+
+
+class CircuitOpenError(Exception):
+    """Chiamata rifiutata: circuit breaker dell'endpoint aperto."""
+
+
+class CircuitBreaker:
+    """Circuit breaker per endpoint (CLOSED -> OPEN -> HALF_OPEN -> CLOSED).
+    
+    Dopo BREAKER_FAILURE_THRESHOLD errori transitori consecutivi l'endpoint
+    viene aperto per BREAKER_RESET_TIMEOUT secondi; poi una singola chiamata
+    di prova decide se richiuderlo.
+    """
+    
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+    
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow_request(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # HALF_OPEN: una sola chiamata di prova alla volta
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+    
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"[BREAKER] {self.name}: {self.state} -> CLOSED")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"[BREAKER] {self.name}: {self.state} -> OPEN ({self.failures} errori)")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+    
+    def get_stats(self):
+        with self._lock:
+            return {'state': self.state, 'failures': self.failures}
+
+
+class RetryBudget:
+    """Token bucket: ogni chiamata deposita RETRY_BUDGET_RATIO token, ogni retry ne consuma 1.
+    
+    Limita i retry a una frazione del traffico, evitando tempeste di retry
+    quando l'exchange e' degradato.
+    """
+    
+    def __init__(self, ratio=RETRY_BUDGET_RATIO, max_tokens=RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+    
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+    
+    def try_withdraw(self):
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+_breakers = {}
+_retry_budgets = {}
+_resilience_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint):
+    with _resilience_lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def get_retry_budget(endpoint):
+    with _resilience_lock:
+        budget = _retry_budgets.get(endpoint)
+        if budget is None:
+            budget = _retry_budgets[endpoint] = RetryBudget()
+        return budget
+
+
+def get_breaker_stats():
+    """Stato di tutti i circuit breaker: {endpoint: {'state', 'failures'}}."""
+    with _resilience_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.get_stats() for b in breakers}
+
+
+def is_transient_error(error):
+    """True per errori di rete/server per cui un retry ha senso."""
+    if isinstance(error, (ConnectionError, TimeoutError, socket.timeout)):
+        return True
+    error_str = str(error).lower()
+    return any(x in error_str for x in TRANSIENT_ERROR_MARKERS)
+
+
+def backoff_delay(attempt, base=RETRY_DELAY, cap=RETRY_MAX_DELAY):
+    """Backoff esponenziale con full jitter: uniform(0, min(cap, base * 2^attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def new_customer_ref():
+    """customerRef univoco (max 32 caratteri) per deduplica lato exchange."""
+    return uuid.uuid4().hex
+
+
+def with_retry(func=None, endpoint=None):
+    """Decorator to add retry logic for API calls.
+    
+    - Retry solo su errori transitori, con backoff esponenziale + jitter
+    - Circuit breaker per endpoint (CircuitOpenError se aperto)
+    - Retry budget per endpoint
+    
+    Usabile come @with_retry o @with_retry(endpoint='placeOrders').
+    Le chiamate non idempotenti devono passare un customerRef fisso
+    per tutti i tentativi (vedi place_bets).
+    """
+    if func is None:
+        return lambda f: with_retry(f, endpoint=endpoint)
+    
+    name = endpoint or func.__name__
+    
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        breaker = get_circuit_breaker(name)
+        budget = get_retry_budget(name)
+        budget.deposit()
         last_error = None
         for attempt in range(MAX_RETRIES):
+            if not breaker.allow_request():
+                raise CircuitOpenError(f"Circuit breaker aperto per {name}, riprova tra poco")
             try:
-                return func(*args, **kwargs)
+                result = func(*args, **kwargs)
+                breaker.record_success()
+                return result
             except Exception as e:
                 last_error = e
-                error_str = str(e).lower()
-                # Retry on network/server errors
-                if any(x in error_str for x in ['502', '503', '504', 'timeout', 'connection', 'network']):
-                    if attempt < MAX_RETRIES - 1:
-                        time.sleep(RETRY_DELAY * (attempt + 1))
-                        continue
-                # Don't retry on other errors
+                if not is_transient_error(e):
+                    # Errore applicativo: l'endpoint risponde, non conta come guasto
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt < MAX_RETRIES - 1 and budget.try_withdraw():
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"[RETRY] {name} tentativo {attempt + 1} fallito ({e}), retry tra {delay:.2f}s")
+                    time.sleep(delay)
+                    continue
                 raise
         raise last_error
     return wrapper
@@ -213,6 +572,395 @@ MARKET_TYPES = {
 }
 
 
+# ==============================================================================
+# SESSIONE HTTP CALDA (POOL, KEEP-ALIVE, TCP_NODELAY, TTFB)
+# ==============================================================================
+#
+# Dopo un periodo di inattivita il primo placeOrders paga handshake TCP+TLS.
+# La sessione requests condivisa con betfairlightweight usa un pool
+# dimensionato, TCP_NODELAY/SO_KEEPALIVE sulle socket e viene "tenuta calda"
+# con probe leggeri nei minuti prima dell'in-play dei mercati osservati.
+
+HTTP_POOL_CONNECTIONS = 4   # host distinti (login, betting, account)
+HTTP_POOL_MAXSIZE = 16      # connessioni per host (thread concorrenti)
+WARMUP_LEAD_SEC = 180       # inizia i probe 3 minuti prima del via
+WARMUP_GRACE_SEC = 120      # ...e continua 2 minuti dopo il via
+WARMUP_IDLE_SEC = 20.0      # probe solo se la sessione e' ferma da N secondi
+WARMUP_TICK_SEC = 1.0
+
+_RPC_METHOD_RE = re.compile(rb'"method"\s*:\s*"(?:[^"/]*/)*([A-Za-z]+)"')
+
+
+def _socket_options():
+    options = [
+        (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+    # Probe TCP keep-alive piu frequenti dove supportato (Linux/macOS)
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30))
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        options.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10))
+    return options
+
+
+class TunedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter con opzioni socket low-latency per il pool urllib3."""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = _socket_options()
+        super().init_poolmanager(*args, **kwargs)
+    
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        proxy_kwargs['socket_options'] = _socket_options()
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+
+def rpc_method_name(request):
+    """Nome del metodo JSON-RPC (es. 'placeOrders') dal body, altrimenti path URL."""
+    body = request.body
+    if body:
+        if isinstance(body, str):
+            body = body.encode('utf-8', errors='ignore')
+        match = _RPC_METHOD_RE.search(body[:256])
+        if match:
+            return match.group(1).decode('ascii')
+    path = (request.path_url or '').split('?')[0].rstrip('/')
+    return path.rsplit('/', 1)[-1] or 'unknown'
+
+
+class BettingSession:
+    """Sessione requests condivisa, con misura TTFB e tracking inattivita."""
+    
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+        self.session = requests.Session()
+        adapter = TunedHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.hooks['response'].append(self._on_response)
+        self.last_activity = 0.0
+    
+    def _on_response(self, response, *args, **kwargs):
+        # response.elapsed = invio richiesta -> header ricevuti (TTFB)
+        now = time.time()
+        after_idle = not self.last_activity or (now - self.last_activity) >= WARMUP_IDLE_SEC
+        self.last_activity = now
+        try:
+            _perf_metrics.record_ttfb(
+                rpc_method_name(response.request),
+                response.elapsed.total_seconds() * 1000,
+                after_idle=after_idle
+            )
+        except Exception as e:
+            logger.debug(f"[HTTP] TTFB non registrato: {e}")
+        return response
+    
+    def idle_for(self, now=None):
+        if not self.last_activity:
+            return float('inf')
+        return (now or time.time()) - self.last_activity
+    
+    def close(self):
+        self.session.close()
+
+
+class ConnectionWarmer:
+    """Thread che tiene calda la connessione betting prima dell'in-play.
+    
+    Per ogni mercato osservato, da WARMUP_LEAD_SEC prima del via fino a
+    WARMUP_GRACE_SEC dopo, esegue un probe se la sessione e' inattiva.
+    """
+    
+    def __init__(self, http, probe):
+        self.http = http
+        self.probe = probe
+        self.probes = 0
+        self._markets = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def watch(self, market_id, start_time):
+        """Registra un mercato (start_time: datetime o stringa ISO)."""
+        if isinstance(start_time, str):
+            try:
+                start_time = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+            except ValueError:
+                return
+        if start_time is None:
+            return
+        if start_time.tzinfo is None:
+            # betfairlightweight restituisce datetime naive in UTC
+            start_time = start_time.replace(tzinfo=timezone.utc)
+        with self._lock:
+            self._markets[market_id] = start_time.timestamp()
+        self.start()
+    
+    def unwatch(self, market_id):
+        with self._lock:
+            self._markets.pop(market_id, None)
+    
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ConnectionWarmer', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _run(self):
+        while not self._stop.wait(WARMUP_TICK_SEC):
+            self.tick(time.time())
+    
+    def tick(self, now):
+        """Esegue un probe se un mercato e' in finestra e la sessione e' ferma."""
+        target = None
+        with self._lock:
+            for market_id, start_ts in list(self._markets.items()):
+                if now > start_ts + WARMUP_GRACE_SEC:
+                    del self._markets[market_id]
+                elif now >= start_ts - WARMUP_LEAD_SEC:
+                    target = market_id
+        if target is None or self.http.idle_for(now) < WARMUP_IDLE_SEC:
+            return False
+        try:
+            self.probe(target)
+            self.probes += 1
+            return True
+        except Exception as e:
+            logger.debug(f"[WARMUP] Probe fallito su {target}: {e}")
+            return False
+
+
+# ==============================================================================
+# ADAPTER RISPOSTE (LIGHTWEIGHT DICT / RESOURCE OBJECT)
+# ==============================================================================
+#
+# In modalita lightweight betfairlightweight restituisce il JSON grezzo
+# (dict/list, decodificato con orjson se installato: betfairlightweight[speed])
+# senza costruire resource object. Gli adapter *_raw convertono il dict con
+# accessi diretti; gli adapter *_obj coprono la modalita classica. Entrambi
+# producono la stessa forma normalizzata usata da tutti i metodi del client.
+
+try:
+    import orjson  # noqa: F401 - usato internamente da betfairlightweight
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def parse_utc(value):
+    """ISO string / datetime -> datetime naive UTC (None se non valido)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _iso(value):
+    """Datetime -> ISO string; le stringhe (lightweight) passano invariate."""
+    if value is None:
+        return None
+    return value if isinstance(value, str) else value.isoformat()
+
+
+def _ladder_raw(levels):
+    return [[lv['price'], lv['size']] for lv in levels] if levels else []
+
+
+def _ladder_obj(levels):
+    return [[lv.price, lv.size] for lv in levels] if levels else []
+
+
+def adapt_market_book_raw(book):
+    """listMarketBook (dict grezzo) -> market book normalizzato."""
+    runners = []
+    for r in book.get('runners') or ():
+        ex = r.get('ex') or {}
+        runners.append({
+            'selectionId': r['selectionId'],
+            'status': r.get('status', 'ACTIVE'),
+            'back': _ladder_raw(ex.get('availableToBack')),
+            'lay': _ladder_raw(ex.get('availableToLay')),
+            'lastPriceTraded': r.get('lastPriceTraded'),
+            'totalMatched': r.get('totalMatched', 0)
+        })
+    return {
+        'marketId': book['marketId'],
+        'status': book.get('status', 'OPEN'),
+        'inplay': book.get('inplay', False),
+        'version': book.get('version'),
+        'complete': book.get('complete'),
+        'isMarketDataDelayed': book.get('isMarketDataDelayed'),
+        'runners': runners
+    }
+
+
+def adapt_market_book_obj(book):
+    """listMarketBook (resource object) -> market book normalizzato."""
+    runners = []
+    for r in book.runners or ():
+        ex = r.ex
+        runners.append({
+            'selectionId': r.selection_id,
+            'status': r.status or 'ACTIVE',
+            'back': _ladder_obj(ex.available_to_back) if ex else [],
+            'lay': _ladder_obj(ex.available_to_lay) if ex else [],
+            'lastPriceTraded': r.last_price_traded,
+            'totalMatched': r.total_matched or 0
+        })
+    return {
+        'marketId': book.market_id,
+        'status': book.status or 'OPEN',
+        'inplay': book.inplay or False,
+        'version': book.version,
+        'complete': book.complete,
+        'isMarketDataDelayed': book.is_market_data_delayed,
+        'runners': runners
+    }
+
+
+def adapt_current_order_raw(order):
+    """listCurrentOrders (dict grezzo) -> ordine normalizzato."""
+    price_size = order.get('priceSize') or {}
+    return {
+        'betId': order['betId'],
+        'marketId': order['marketId'],
+        'selectionId': order['selectionId'],
+        'side': order['side'],
+        'price': price_size.get('price'),
+        'size': price_size.get('size'),
+        'sizeMatched': order.get('sizeMatched', 0),
+        'sizeRemaining': order.get('sizeRemaining', 0),
+        'averagePriceMatched': order.get('averagePriceMatched'),
+        'status': order.get('status'),
+        'placedDate': order.get('placedDate'),
+        'customerOrderRef': order.get('customerOrderRef')
+    }
+
+
+def adapt_current_order_obj(order):
+    """listCurrentOrders (resource object) -> ordine normalizzato."""
+    price_size = order.price_size
+    return {
+        'betId': order.bet_id,
+        'marketId': order.market_id,
+        'selectionId': order.selection_id,
+        'side': order.side,
+        'price': price_size.price if price_size else None,
+        'size': price_size.size if price_size else None,
+        'sizeMatched': order.size_matched,
+        'sizeRemaining': order.size_remaining,
+        'averagePriceMatched': order.average_price_matched,
+        'status': order.status,
+        'placedDate': _iso(order.placed_date),
+        'customerOrderRef': getattr(order, 'customer_order_ref', None)
+    }
+
+
+def adapt_cleared_order_raw(order):
+    """listClearedOrders (dict grezzo) -> ordine chiuso normalizzato."""
+    item = order.get('itemDescription') or {}
+    return {
+        'betId': order['betId'],
+        'marketId': order.get('marketId'),
+        'selectionId': order.get('selectionId'),
+        'side': order.get('side'),
+        'priceRequested': order.get('priceRequested'),
+        'priceMatched': order.get('priceMatched'),
+        'sizeSettled': order.get('sizeSettled'),
+        'profit': order.get('profit', 0.0),
+        'placedDate': order.get('placedDate'),
+        'settledDate': order.get('settledDate'),
+        'eventTypeId': order.get('eventTypeId', ''),
+        'itemDescription': item or None
+    }
+
+
+def adapt_cleared_order_obj(order):
+    """listClearedOrders (resource object) -> ordine chiuso normalizzato."""
+    return {
+        'betId': order.bet_id,
+        'marketId': order.market_id,
+        'selectionId': order.selection_id,
+        'side': order.side,
+        'priceRequested': order.price_requested,
+        'priceMatched': order.price_matched,
+        'sizeSettled': order.size_settled,
+        'profit': order.profit,
+        'placedDate': _iso(order.placed_date),
+        'settledDate': _iso(order.settled_date),
+        'eventTypeId': getattr(order, 'event_type_id', '') or '',
+        'itemDescription': getattr(order, 'item_description', None)
+    }
+
+
+STREAM_SIDES = {'B': 'BACK', 'L': 'LAY'}
+STREAM_ORDER_STATUS = {'E': 'EXECUTABLE', 'EC': 'EXECUTION_COMPLETE'}
+
+
+def adapt_stream_order(order):
+    """Ordine della cache order stream (BetfairStream) -> forma normalizzata."""
+    placed = order.get('placed_date')
+    if isinstance(placed, (int, float)):
+        placed = datetime.fromtimestamp(placed / 1000, tz=timezone.utc).isoformat()
+    status = order.get('status')
+    return {
+        'betId': str(order.get('bet_id')),
+        'marketId': order.get('market_id'),
+        'selectionId': order.get('selection_id'),
+        'side': STREAM_SIDES.get(order.get('side'), order.get('side')),
+        'price': order.get('price'),
+        'size': order.get('size'),
+        'sizeMatched': order.get('size_matched') or 0,
+        'sizeRemaining': order.get('size_remaining') or 0,
+        'averagePriceMatched': order.get('average_price_matched'),
+        'status': STREAM_ORDER_STATUS.get(status, status),
+        'placedDate': placed,
+        'customerOrderRef': order.get('customer_order_ref'),
+    }
+
+
+def _placed_within(placed_date, placed_from, placed_to):
+    placed = parse_utc(placed_date)
+    if placed is None:
+        return True
+    if placed_from and placed < parse_utc(placed_from):
+        return False
+    if placed_to and placed > parse_utc(placed_to):
+        return False
+    return True
+
+
+def catalogue_chunk_size(projection):
+    """Market per chiamata listMarketCatalogue entro il limite di peso."""
+    weight = sum(CATALOGUE_PROJECTION_WEIGHTS.get(p, 0) for p in projection or ())
+    return MARKET_DATA_WEIGHT_LIMIT // weight if weight else 1000
+
+
+def book_chunk_size(price_data):
+    """Market per chiamata listMarketBook entro il limite di peso."""
+    weight = sum(BOOK_PRICE_WEIGHTS.get(p, 0) for p in price_data or ()) or BOOK_BASE_WEIGHT
+    return max(1, MARKET_DATA_WEIGHT_LIMIT // weight)
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def best_price(runner_book, side):
+    """Miglior prezzo (back/lay) da un runner normalizzato, o None."""
+    levels = runner_book['back'] if side == 'BACK' else runner_book['lay']
+    return levels[0][0] if levels else None
+
+
 class PriceStreamListener(StreamListener):
     """Custom listener for processing streaming price updates."""
     
@@ -248,8 +996,94 @@ class PriceStreamListener(StreamListener):
             print(f"Stream data error: {e}")
 
 
+# ==============================================================================
+# PIAZZAMENTO ASYNC RICONCILIATO DALL'ORDER STREAM
+# ==============================================================================
+#
+# Con async=True placeOrders risponde senza attendere il matching engine
+# (report con orderStatus PENDING, senza betId). Ogni istruzione ha un
+# customerOrderRef univoco: l'order stream lo riporta nel campo 'rfo' insieme
+# a betId e stato di match, che risolvono la Future dell'istruzione.
+
+ASYNC_PLACE_WORKERS = 4
+ASYNC_RECONCILE_SEC = 5.0  # attesa dello stream prima di riconciliare via REST
+
+class AsyncOrderTracker:
+    """Future per customerOrderRef in attesa di conferma dall'order stream."""
+    
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+    
+    def register(self, refs):
+        futures = []
+        with self._lock:
+            for ref in refs:
+                future = Future()
+                self._pending[ref] = future
+                futures.append(future)
+        return futures
+    
+    def is_pending(self, ref):
+        with self._lock:
+            return ref in self._pending
+    
+    def resolve(self, ref, report):
+        with self._lock:
+            future = self._pending.pop(ref, None)
+        if future is None or future.done():
+            return False
+        future.set_result(report)
+        return True
+    
+    def fail(self, ref, exc):
+        with self._lock:
+            future = self._pending.pop(ref, None)
+        if future is not None and not future.done():
+            future.set_exception(exc)
+    
+    def on_order_update(self, order_data):
+        """Risolve la Future dell'ordine se l'update porta rfo + betId."""
+        ref = order_data.get('customer_order_ref')
+        bet_id = order_data.get('bet_id')
+        if not ref or not bet_id or not self.is_pending(ref):
+            return False
+        placed = order_data.get('placed_date')
+        if isinstance(placed, (int, float)):
+            placed = datetime.fromtimestamp(placed / 1000, tz=timezone.utc).isoformat()
+        return self.resolve(ref, {
+            'status': 'SUCCESS',
+            'betId': str(bet_id),
+            'orderStatus': STREAM_ORDER_STATUS.get(order_data.get('status'), order_data.get('status')),
+            'placedDate': placed,
+            'averagePriceMatched': order_data.get('average_price_matched'),
+            'sizeMatched': order_data.get('size_matched', 0),
+            'customerOrderRef': ref
+        })
+
+
+def _order_bucket(order_data):
+    """matched / partiallyMatched / unmatched, None se chiuso senza abbinamenti."""
+    size_matched = order_data['sizeMatched']
+    size_remaining = order_data['sizeRemaining']
+    if size_remaining == 0 and size_matched > 0:
+        return 'matched'
+    if size_remaining > 0 and size_matched > 0:
+        return 'partiallyMatched'
+    if size_remaining > 0:
+        return 'unmatched'
+    return None
+
+
+@instrument_client
 class BetfairClient:
-    def __init__(self, username, app_key, cert_pem, key_pem):
+    def __init__(self, username, app_key, cert_pem, key_pem, lightweight=False):
+        """
+        Args:
+            lightweight: Se True, listMarketBook/listCurrentOrders/listClearedOrders
+                restituiscono dict grezzi convertiti con adapter dedicati
+                (niente resource object, meno CPU su risposte grandi).
+        """
         # Aggressive cleaning of all string values to remove newlines/whitespace
         self.username = self._clean_string(username)
         self.app_key = self._clean_string(app_key)
@@ -261,6 +1095,22 @@ class BetfairClient:
         self.stream_thread = None
         self.streaming_active = False
         self.price_callbacks = {}
+        self.lightweight = lightweight
+        self.http = None
+        self.warmer = None
+        self.async_orders = AsyncOrderTracker()
+        self._async_executor = None
+        self.order_queue = None
+        self._queue_lock = threading.Lock()
+        self.order_stream = None
+        self._orders_sync_lock = threading.Lock()
+        self._orders_snapshot = {}
+        self._orders_synced_at = None
+        self._orders_full_at = 0.0
+        self.event_index = EventIndex()
+        self._event_markets = {}
+        self._fetch_executor = None
+        self._fetch_lock = threading.Lock()
     
     @staticmethod
     def _clean_string(value):
@@ -310,12 +1160,14 @@ class BetfairClient:
         certs_dir = self._create_temp_cert_files()
         
         try:
+            self.http = BettingSession()
             self.client = betfairlightweight.APIClient(
                 username=self.username,
                 password=password,
                 app_key=self.app_key,
                 certs=certs_dir,
-                locale="italy"
+                locale="italy",
+                session=self.http.session
             )
             
             self.client.login()
@@ -323,6 +1175,11 @@ class BetfairClient:
             if not self.client.session_token:
                 raise Exception("Nessun token ricevuto - verifica credenziali")
             
+            if self.lightweight:
+                logger.info(f"[CLIENT] Modalita lightweight attiva (orjson: {'si' if HAS_ORJSON else 'no'})")
+            
+            self.warmer = ConnectionWarmer(self.http, self._warmup_probe)
+            
             return {
                 'session_token': self.client.session_token,
                 'expiry': (datetime.now() + timedelta(hours=8)).isoformat()
@@ -349,14 +1206,130 @@ class BetfairClient:
     def logout(self):
         """Logout from Betfair and stop streaming."""
         self.stop_streaming()
+        if self.warmer:
+            self.warmer.stop()
+            self.warmer = None
         if self.client:
             try:
                 self.client.logout()
             except:
                 pass
+        if self._async_executor:
+            self._async_executor.shutdown(wait=False)
+            self._async_executor = None
+        if self.order_queue:
+            self.order_queue.stop()
+            self.order_queue = None
+        if self._fetch_executor:
+            self._fetch_executor.shutdown(wait=False)
+            self._fetch_executor = None
+        if self.http:
+            self.http.close()
+            self.http = None
         self._cleanup_temp_files()
         self.client = None
     
+    # ------------------------------------------------------------------
+    # Connessione calda verso l'endpoint betting
+    # ------------------------------------------------------------------
+    
+    def _warmup_probe(self, market_id=None):
+        """Probe leggero sull'host betting: listCurrentOrders con 1 record."""
+        kwargs = {'record_count': 1}
+        if market_id:
+            kwargs['market_ids'] = [market_id]
+        self.client.betting.list_current_orders(lightweight=True, **kwargs)
+    
+    def warm_up(self, market_id=None):
+        """Riscalda la connessione se inattiva (da chiamare prima di un burst di ordini).
+        
+        Returns:
+            True se e' stato eseguito un probe
+        """
+        if not self.client or not self.http:
+            return False
+        if self.http.idle_for() < WARMUP_IDLE_SEC:
+            return False
+        self._warmup_probe(market_id)
+        return True
+    
+    @no_instrument
+    def watch_market_warmup(self, market_id, start_time):
+        """Tiene calda la connessione attorno all'in-play del mercato."""
+        if self.warmer:
+            self.warmer.watch(market_id, start_time)
+    
+    # ------------------------------------------------------------------
+    # Fetch normalizzati (lightweight o resource object)
+    # ------------------------------------------------------------------
+    
+    def _list_market_books(self, market_ids, price_data=None):
+        """listMarketBook -> lista di market book normalizzati.
+        
+        Oltre il limite di peso gli id vengono divisi in chunk scaricati in parallelo.
+        """
+        chunks = _chunks(list(market_ids), book_chunk_size(price_data))
+        if len(chunks) > 1:
+            return [book for part in self._map_parallel(
+                lambda ids: self._list_market_books(ids, price_data), chunks) for book in part]
+        
+        return self._fetch_market_books(market_ids, price_data)
+    
+    @instrumented(endpoint='listMarketBook')
+    def _fetch_market_books(self, market_ids, price_data=None):
+        """Singola richiesta listMarketBook (un chunk entro il limite di peso)."""
+        kwargs = {'market_ids': market_ids}
+        if price_data:
+            kwargs['price_projection'] = filters.price_projection(price_data=price_data)
+        if self.lightweight:
+            books = self.client.betting.list_market_book(lightweight=True, **kwargs)
+            return [adapt_market_book_raw(b) for b in books]
+        books = self.client.betting.list_market_book(**kwargs)
+        return [adapt_market_book_obj(b) for b in books]
+    
+    def _map_parallel(self, func, chunks):
+        """Esegue func su ogni chunk nel pool del client (ordine preservato)."""
+        with self._fetch_lock:
+            if self._fetch_executor is None:
+                self._fetch_executor = ThreadPoolExecutor(
+                    max_workers=MARKET_FETCH_WORKERS, thread_name_prefix='market-fetch'
+                )
+        return list(self._fetch_executor.map(func, chunks))
+    
+    def _list_catalogue_chunked(self, market_ids, market_projection):
+        """listMarketCatalogue per id arbitrari, a chunk pesati e in parallelo."""
+        def fetch(ids):
+            return self.client.betting.list_market_catalogue(
+                filter=filters.market_filter(market_ids=ids),
+                market_projection=market_projection,
+                max_results=len(ids)
+            ) or []
+        
+        chunks = _chunks(list(market_ids), catalogue_chunk_size(market_projection))
+        if len(chunks) == 1:
+            return fetch(chunks[0])
+        return [market for part in self._map_parallel(fetch, chunks) for market in part]
+    
+    def _list_current_orders(self, **order_filter):
+        """listCurrentOrders -> (ordini normalizzati, more_available)."""
+        if self.lightweight:
+            raw = self.client.betting.list_current_orders(lightweight=True, **order_filter)
+            orders = [adapt_current_order_raw(o) for o in raw.get('currentOrders') or ()]
+            return orders, raw.get('moreAvailable', False)
+        result = self.client.betting.list_current_orders(**order_filter)
+        orders = [adapt_current_order_obj(o) for o in result.orders or ()]
+        return orders, bool(getattr(result, 'more_available', False))
+    
+    def _list_cleared_orders(self, **kwargs):
+        """listClearedOrders -> (ordini chiusi normalizzati, more_available)."""
+        if self.lightweight:
+            raw = self.client.betting.list_cleared_orders(lightweight=True, **kwargs)
+            orders = [adapt_cleared_order_raw(o) for o in raw.get('clearedOrders') or ()]
+            return orders, raw.get('moreAvailable', False)
+        result = self.client.betting.list_cleared_orders(**kwargs)
+        orders = [adapt_cleared_order_obj(o) for o in result.cleared_orders or ()]
+        return orders, bool(getattr(result, 'more_available', False))
+    
     @with_retry
     def get_account_funds(self):
         """Get account balance."""
@@ -370,6 +1343,25 @@ class BetfairClient:
             'total': account.available_to_bet_balance + abs(account.exposure)
         }
     
+    def _fetch_cleared_status(self, bet_status, settled_date_range, bet_ids=None):
+        """Tutte le pagine di listClearedOrders per uno stato (fromRecord/moreAvailable)."""
+        kwargs = {
+            'bet_status': bet_status,
+            'settled_date_range': settled_date_range,
+            'record_count': CLEARED_PAGE_SIZE
+        }
+        if bet_ids:
+            kwargs['bet_ids'] = list(bet_ids)
+        
+        orders = []
+        from_record = 0
+        while True:
+            page, more_available = self._list_cleared_orders(from_record=from_record, **kwargs)
+            orders.extend(page)
+            if not more_available or not page:
+                return orders
+            from_record += len(page)
+    
     @with_retry
     def get_cleared_orders(self, bet_ids=None, from_date=None):
         """Get settled/cleared orders to check bet outcomes.
@@ -385,82 +1377,100 @@ class BetfairClient:
             raise Exception("Non connesso a Betfair")
         
         if from_date is None:
-            from_date = datetime.now() - timedelta(days=7)
+            from_date = datetime.utcnow() - timedelta(days=7)
         
         settled_date_range = filters.time_range(
             from_=from_date,
-            to=datetime.now()
+            to=datetime.utcnow()
         )
         
         results = []
         
-        # Get SETTLED orders
-        try:
-            cleared_orders = self.client.betting.list_cleared_orders(
-                bet_status='SETTLED',
-                settled_date_range=settled_date_range
-            )
-            
-            for order in cleared_orders.cleared_orders:
-                bet_data = {
-                    'bet_id': order.bet_id,
-                    'market_id': order.market_id,
-                    'selection_id': order.selection_id,
-                    'placed_date': order.placed_date.isoformat() if order.placed_date else None,
-                    'settled_date': order.settled_date.isoformat() if order.settled_date else None,
-                    'profit': order.profit,
-                    'side': order.side,
-                    'price_requested': order.price_requested,
-                    'price_matched': order.price_matched,
-                    'size_settled': order.size_settled,
-                }
-                
-                # Determine outcome from profit
-                # Note: profit=0 means stake returned (rule 4.4.1 void selection) = VOID
-                if order.profit > 0:
-                    bet_data['outcome'] = 'WON'
-                elif order.profit < 0:
-                    bet_data['outcome'] = 'LOST'
-                else:
-                    # Stake returned (dead heat, void selection, etc.)
-                    bet_data['outcome'] = 'VOID'
-                
-                # Filter by bet_ids if provided
-                if bet_ids is None or order.bet_id in bet_ids:
-                    results.append(bet_data)
-        except Exception as e:
-            print(f"Error getting settled orders: {e}")
-        
-        # Get VOIDED orders (cancelled markets, etc.)
-        try:
-            voided_orders = self.client.betting.list_cleared_orders(
-                bet_status='VOIDED',
-                settled_date_range=settled_date_range
-            )
+        # Get SETTLED orders, then VOIDED orders (cancelled markets, etc.)
+        for bet_status in ('SETTLED', 'VOIDED'):
+            try:
+                cleared_orders = self._fetch_cleared_status(bet_status, settled_date_range, bet_ids)
+            except Exception as e:
+                print(f"Error getting {bet_status.lower()} orders: {e}")
+                continue
             
-            for order in voided_orders.cleared_orders:
-                bet_data = {
-                    'bet_id': order.bet_id,
-                    'market_id': order.market_id,
-                    'selection_id': order.selection_id,
-                    'placed_date': order.placed_date.isoformat() if order.placed_date else None,
-                    'settled_date': order.settled_date.isoformat() if order.settled_date else None,
-                    'profit': 0.0,  # Voided bets have no profit/loss
-                    'side': order.side,
-                    'price_requested': order.price_requested,
-                    'price_matched': order.price_matched,
-                    'size_settled': order.size_settled,
-                    'outcome': 'VOID',  # Always VOID for voided bets
-                }
-                
-                # Filter by bet_ids if provided
-                if bet_ids is None or order.bet_id in bet_ids:
-                    results.append(bet_data)
-        except Exception as e:
-            print(f"Error getting voided orders: {e}")
+            for order in cleared_orders:
+                results.append(self._cleared_bet_data(order, voided=(bet_status == 'VOIDED')))
         
         return results
     
+    @with_retry
+    def sync_cleared_orders(self, since=None, bet_ids=None, backfill_days=CLEARED_BACKFILL_DAYS):
+        """
+        Sync incrementale degli ordini chiusi a partire da un watermark.
+        
+        Args:
+            since: watermark (settledDate UTC, ISO o datetime) dell'ultimo sync;
+                None = backfill degli ultimi backfill_days giorni
+            bet_ids: filtro lato server per betId (solo se la lista e' completa)
+        
+        Returns:
+            (lista bet_data come get_cleared_orders, nuovo watermark ISO)
+            Il watermark va salvato solo se la chiamata non solleva eccezioni.
+        """
+        if not self.client:
+            raise Exception("Non connesso a Betfair")
+        
+        now = datetime.utcnow()
+        watermark = parse_utc(since)
+        if watermark is not None:
+            # Piccola sovrapposizione: settlement registrati con leggero ritardo
+            from_date = watermark - CLEARED_SYNC_OVERLAP
+        else:
+            from_date = now - timedelta(days=backfill_days)
+            logger.info(f"[SETTLEMENT] Backfill ordini chiusi ultimi {backfill_days} giorni")
+        
+        settled_date_range = filters.time_range(from_=from_date, to=now)
+        
+        results = []
+        for bet_status in ('SETTLED', 'VOIDED'):
+            for order in self._fetch_cleared_status(bet_status, settled_date_range, bet_ids):
+                results.append(self._cleared_bet_data(order, voided=(bet_status == 'VOIDED')))
+                settled = parse_utc(order['settledDate'])
+                if settled is not None and (watermark is None or settled > watermark):
+                    watermark = settled
+        
+        if watermark is None:
+            # Nessun settlement nel backfill: si riparte da adesso
+            watermark = now
+        
+        return results, watermark.isoformat()
+    
+    @staticmethod
+    def _cleared_bet_data(order, voided=False):
+        """Ordine chiuso normalizzato -> formato bet_data con outcome."""
+        profit = 0.0 if voided else (order['profit'] or 0.0)
+        bet_data = {
+            'bet_id': order['betId'],
+            'market_id': order['marketId'],
+            'selection_id': order['selectionId'],
+            'placed_date': order['placedDate'],
+            'settled_date': order['settledDate'],
+            'profit': profit,  # Voided bets have no profit/loss
+            'side': order['side'],
+            'price_requested': order['priceRequested'],
+            'price_matched': order['priceMatched'],
+            'size_settled': order['sizeSettled'],
+        }
+        
+        # Determine outcome from profit
+        # Note: profit=0 means stake returned (rule 4.4.1 void selection) = VOID
+        if voided:
+            bet_data['outcome'] = 'VOID'  # Always VOID for voided bets
+        elif profit > 0:
+            bet_data['outcome'] = 'WON'
+        elif profit < 0:
+            bet_data['outcome'] = 'LOST'
+        else:
+            # Stake returned (dead heat, void selection, etc.)
+            bet_data['outcome'] = 'VOID'
+        return bet_data
+    
     @with_retry
     def get_market_status(self, market_ids):
         """Get market status (OPEN, SUSPENDED, CLOSED).
@@ -478,21 +1488,16 @@ class BetfairClient:
             return {}
         
         try:
-            market_books = self.client.betting.list_market_book(
-                market_ids=market_ids,
-                price_projection=filters.price_projection(
-                    price_data=['EX_BEST_OFFERS']
-                )
-            )
+            market_books = self._list_market_books(market_ids, price_data=['EX_BEST_OFFERS'])
             
             results = {}
             for book in market_books:
-                results[book.market_id] = {
-                    'status': book.status,
-                    'is_market_data_delayed': book.is_market_data_delayed,
-                    'complete': book.complete,
-                    'inplay': book.inplay,
-                    'version': book.version
+                results[book['marketId']] = {
+                    'status': book['status'],
+                    'is_market_data_delayed': book['isMarketDataDelayed'],
+                    'complete': book['complete'],
+                    'inplay': book['inplay'],
+                    'version': book['version']
                 }
             
             return results
@@ -501,8 +1506,8 @@ class BetfairClient:
             return {}
     
     @with_retry
-    def get_football_events(self, include_inplay=True):
-        """Get upcoming and in-play football events."""
+    def _fetch_football_events(self, include_inplay=True):
+        """Scarica eventi calcio in arrivo + in-play (due list_events)."""
         if not self.client:
             raise Exception("Non connesso a Betfair")
         
@@ -560,51 +1565,78 @@ class BetfairClient:
                     'inPlay': False
                 })
         
-        # Sort: in-play first, then by date
-        result.sort(key=lambda x: (not x.get('inPlay', False), x['openDate'] or ''))
         return result
     
+    def refresh_football_events(self):
+        """
+        Aggiorna l'indice eventi e restituisce solo le differenze
+        (EventDiff: added / removed / updated).
+        """
+        return self.event_index.merge(self._fetch_football_events(include_inplay=True))
+    
+    def get_football_events(self, include_inplay=True):
+        """Get upcoming and in-play football events."""
+        if not include_inplay:
+            events = self._fetch_football_events(include_inplay=False)
+            events.sort(key=event_sort_key)
+            return events
+        
+        # Sort: in-play first, then by date (lista ordinata in cache nell'indice)
+        self.refresh_football_events()
+        return self.event_index.sorted_events()
+    
     @with_retry
     def get_available_markets(self, event_id):
-        """Get all available markets for an event (no type restriction)."""
+        """Get all available markets for an event (no type restriction).
+        
+        Tutti i mercati dell'evento: elenco id a peso zero, catalogue e stato
+        in-play a chunk entro il limite di peso, scaricati in parallelo e
+        memorizzati per evento (catalogue EVENT_CATALOGUE_TTL, in-play EVENT_INPLAY_TTL).
+        """
         if not self.client:
             raise Exception("Non connesso a Betfair")
         
-        import logging
-        logging.debug(f"get_available_markets called with event_id: {event_id} (type: {type(event_id).__name__})")
-        
         # Ensure event_id is a string for the API
         event_id_str = str(event_id)
+        logger.debug(f"get_available_markets called with event_id: {event_id_str}")
         
-        # Fetch ALL markets without type restriction - include RUNNER_DESCRIPTION for auto-bet
-        markets = self.client.betting.list_market_catalogue(
-            filter=filters.market_filter(
-                event_ids=[event_id_str]
-            ),
-            market_projection=['MARKET_START_TIME', 'MARKET_DESCRIPTION', 'RUNNER_DESCRIPTION'],
-            max_results=100
-        )
+        now = time.time()
+        cached = self._event_markets.get(event_id_str)
         
-        logging.debug(f"list_market_catalogue returned {len(markets) if markets else 0} markets for event {event_id_str}")
-        if markets:
-            for m in markets[:5]:
-                logging.debug(f"Market: {m.market_id} - {m.market_name} - type: {getattr(m, 'market_type', 'N/A')}")
+        if cached and now - cached['catalogue_ts'] < EVENT_CATALOGUE_TTL:
+            markets = cached['markets']
         else:
-            logging.warning(f"No markets found for event {event_id_str}")
-        
-        # Get in-play status for these markets
-        market_ids = [m.market_id for m in markets]
-        in_play_status = {}
+            # Id di tutti i mercati (projection vuota = peso 0, fino a 1000 risultati)
+            id_catalogue = self.client.betting.list_market_catalogue(
+                filter=filters.market_filter(
+                    event_ids=[event_id_str]
+                ),
+                max_results=1000
+            ) or []
+            all_ids = [m.market_id for m in id_catalogue]
+            
+            # Dettagli (RUNNER_DESCRIPTION per auto-bet) a chunk pesati
+            markets = self._list_catalogue_chunked(
+                all_ids, ['MARKET_START_TIME', 'MARKET_DESCRIPTION', 'RUNNER_DESCRIPTION']
+            ) if all_ids else []
+            position = {market_id: i for i, market_id in enumerate(all_ids)}
+            markets.sort(key=lambda m: position.get(m.market_id, len(position)))
+            cached = {'markets': markets, 'catalogue_ts': now, 'inplay': {}, 'inplay_ts': 0.0}
+            self._event_markets[event_id_str] = cached
+        
+        logger.debug(f"list_market_catalogue returned {len(markets)} markets for event {event_id_str}")
+        if not markets:
+            logger.warning(f"No markets found for event {event_id_str}")
         
-        if market_ids:
+        # Get in-play status for all markets (chunk da BOOK_BASE_WEIGHT)
+        if markets and now - cached['inplay_ts'] >= EVENT_INPLAY_TTL:
             try:
-                market_books = self.client.betting.list_market_book(
-                    market_ids=market_ids[:50]  # API limit
-                )
-                for book in market_books:
-                    in_play_status[book.market_id] = book.inplay if hasattr(book, 'inplay') else False
-            except:
-                pass
+                market_books = self._list_market_books([m.market_id for m in markets])
+                cached['inplay'] = {book['marketId']: book['inplay'] for book in market_books}
+                cached['inplay_ts'] = now
+            except Exception as e:
+                logger.debug(f"In-play status non disponibile per {event_id_str}: {e}")
+        in_play_status = cached['inplay']
         
         result = []
         for market in markets:
@@ -633,8 +1665,11 @@ class BetfairClient:
         return result
     
     @with_retry
-    def get_market_with_prices(self, market_id):
-        """Get a specific market with runner details and prices."""
+    def get_market_view(self, market_id, with_orders=False):
+        """
+        Costruisce il MarketView unico del mercato: catalogue + book
+        (+ ordini propri se richiesto), runner indicizzati per selection_id.
+        """
         if not self.client:
             raise Exception("Non connesso a Betfair")
         
@@ -649,99 +1684,54 @@ class BetfairClient:
         if not markets:
             raise Exception("Mercato non trovato")
         
-        market = markets[0]
+        view = MarketView.from_catalogue(markets[0])
         
-        price_data = self.client.betting.list_market_book(
-            market_ids=[market_id],
-            price_projection=filters.price_projection(
-                price_data=['EX_BEST_OFFERS']
-            )
-        )
-        
-        if not price_data:
+        if self.refresh_market_view(view) is None:
             raise Exception("Quote non disponibili")
         
-        runners = []
-        price_book = price_data[0]
+        if with_orders:
+            orders, _ = self._list_current_orders(market_ids=[market_id])
+            view.apply_orders(orders)
         
-        for runner in market.runners:
-            runner_prices = None
-            for pb_runner in price_book.runners:
-                if pb_runner.selection_id == runner.selection_id:
-                    runner_prices = pb_runner
-                    break
-            
-            back_price = None
-            lay_price = None
-            back_size = None
-            lay_size = None
-            
-            if runner_prices and runner_prices.ex:
-                if runner_prices.ex.available_to_back:
-                    back_price = runner_prices.ex.available_to_back[0].price
-                    back_size = runner_prices.ex.available_to_back[0].size
-                if runner_prices.ex.available_to_lay:
-                    lay_price = runner_prices.ex.available_to_lay[0].price
-                    lay_size = runner_prices.ex.available_to_lay[0].size
-            
-            runners.append({
-                'selectionId': runner.selection_id,
-                'runnerName': runner.runner_name,
-                'sortPriority': runner.sort_priority,
-                'backPrice': back_price,
-                'layPrice': lay_price,
-                'backSize': back_size,
-                'laySize': lay_size,
-                'status': runner_prices.status if runner_prices else 'ACTIVE'
-            })
-        
-        market_status = 'OPEN'
-        if hasattr(price_book, 'status'):
-            market_status = price_book.status
-        
-        is_inplay = False
-        if hasattr(price_book, 'inplay'):
-            is_inplay = price_book.inplay
+        return view
+    
+    @no_instrument
+    def refresh_market_view(self, view):
+        """
+        Aggiorna i prezzi di un MarketView esistente con una sola chiamata
+        listMarketBook (nessun catalogue). Ritorna i selection_id cambiati,
+        None se il book non e' disponibile.
+        """
+        if not self.client:
+            raise Exception("Non connesso a Betfair")
         
-        return {
-            'marketId': market_id,
-            'marketName': market.market_name,
-            'startTime': market.market_start_time.isoformat() if market.market_start_time else None,
-            'runners': runners,
-            'status': market_status,
-            'inPlay': is_inplay
-        }
+        price_data = self._list_market_books([view.market_id], price_data=['EX_BEST_OFFERS'])
+        if not price_data:
+            return None
+        return view.apply_book(price_data[0])
+    
+    def get_market_with_prices(self, market_id):
+        """Get a specific market with runner details and prices."""
+        return self.get_market_view(market_id).to_dict()
     
     def get_market_book(self, market_id):
         """Get current market prices (for refreshing best prices before placing bets)."""
         if not self.client:
             raise Exception("Non connesso a Betfair")
         
-        price_data = self.client.betting.list_market_book(
-            market_ids=[market_id],
-            price_projection=filters.price_projection(
-                price_data=['EX_BEST_OFFERS']
-            )
-        )
+        price_data = self._list_market_books([market_id], price_data=['EX_BEST_OFFERS'])
         
         if not price_data:
             return None
         
-        price_book = price_data[0]
         runners = []
         
-        for pb_runner in price_book.runners:
-            back_price = None
-            lay_price = None
-            
-            if pb_runner.ex:
-                if pb_runner.ex.available_to_back:
-                    back_price = pb_runner.ex.available_to_back[0].price
-                if pb_runner.ex.available_to_lay:
-                    lay_price = pb_runner.ex.available_to_lay[0].price
+        for pb_runner in price_data[0]['runners']:
+            back_price = best_price(pb_runner, 'BACK')
+            lay_price = best_price(pb_runner, 'LAY')
             
             runners.append({
-                'selectionId': pb_runner.selection_id,
+                'selectionId': pb_runner['selectionId'],
                 'ex': {
                     'availableToBack': [{'price': back_price}] if back_price else [],
                     'availableToLay': [{'price': lay_price}] if lay_price else []
@@ -750,6 +1740,17 @@ class BetfairClient:
         
         return {'runners': runners}
     
+    def get_market_books(self, market_ids, price_data=None):
+        """
+        Market book normalizzati (stato, in-play, runner con status e ladder)
+        per piu mercati, a chunk entro il limite di peso.
+        """
+        if not self.client:
+            raise Exception("Non connesso a Betfair")
+        if not market_ids:
+            return []
+        return self._list_market_books(list(market_ids), price_data=price_data)
+    
     def get_correct_score_market(self, event_id):
         """Get correct score market for an event (legacy method)."""
         if not self.client:
@@ -823,6 +1824,7 @@ class BetfairClient:
         finally:
             self.streaming_active = False
     
+    @no_instrument
     def stop_streaming(self):
         """Stop the active stream."""
         self.streaming_active = False
@@ -834,6 +1836,7 @@ class BetfairClient:
             self.stream = None
         self.stream_thread = None
     
+    @no_instrument
     def is_streaming(self):
         """Check if streaming is active."""
         return self.streaming_active and self.stream is not None
@@ -852,7 +1855,67 @@ class BetfairClient:
         }]
         return self.place_bets(market_id, instructions)
     
-    def place_bets(self, market_id, instructions):
+    @no_instrument
+    def submit_order(self, market_id, selection_id, side, price, size):
+        """
+        Accoda un ordine nella coda micro-batch del mercato: le istruzioni
+        dello stesso mercato entro pochi ms partono in un solo placeOrders.
+        
+        Returns:
+            Future risolta con l'instruction report dell'ordine
+        """
+        if not self.client:
+            raise Exception("Non connesso a Betfair")
+        return self._get_order_queue().submit(market_id, selection_id, side, price, size)
+    
+    @no_instrument
+    def submit_orders(self, market_id, instructions):
+        """
+        Accoda piu istruzioni dello stesso chiamante (es. le gambe di un
+        dutching): restano insieme nel placeOrders e un errore non coinvolge
+        altri chiamanti.
+        
+        Returns:
+            Lista di Future, una per istruzione
+        """
+        if not self.client:
+            raise Exception("Non connesso a Betfair")
+        return self._get_order_queue().submit_many(market_id, instructions)
+    
+    def _get_order_queue(self):
+        with self._queue_lock:
+            if self.order_queue is None:
+                self.order_queue = MarketOrderQueue(self, async_placement=self._async_placement_ready)
+        return self.order_queue
+    
+    def _async_placement_ready(self):
+        """Piazzamento async solo con order stream connesso (conferme via stream)."""
+        stream = self.order_stream
+        return stream is not None and stream.is_connected()
+    
+    def _build_place_instructions(self, instructions, customer_ref):
+        """Istruzioni LIMIT con customerOrderRef '<customerRef>-<indice>'."""
+        place_instructions = []
+        order_refs = []
+        for i, inst in enumerate(instructions):
+            order_ref = f"{customer_ref[:28]}-{i}"
+            order_refs.append(order_ref)
+            place_instructions.append(
+                betfairlightweight.filters.place_instruction(
+                    selection_id=inst['selectionId'],
+                    side=inst['side'],
+                    order_type='LIMIT',
+                    limit_order=betfairlightweight.filters.limit_order(
+                        size=inst['size'],
+                        price=inst['price'],
+                        persistence_type='LAPSE'
+                    ),
+                    customer_order_ref=order_ref
+                )
+            )
+        return place_instructions, order_refs
+    
+    def place_bets(self, market_id, instructions, customer_ref=None, async_=False):
         """
         Place bets on Betfair.
         
@@ -862,6 +1925,18 @@ class BetfairClient:
             'price': float,
             'size': float
         }
+        customer_ref: customerRef per deduplica (generato se None).
+        async_: se True usa il piazzamento async di Betfair e ritorna subito
+            {'status': 'PENDING', 'customerRef', 'futures'}: una Future per
+            istruzione (stesso ordine), risolta dall'order stream con il
+            report dell'istruzione (betId, orderStatus, sizeMatched...).
+            Ordini non confermati ne' dallo stream ne' da listCurrentOrders
+            si risolvono con status 'UNKNOWN': potrebbero essere sul mercato,
+            il chiamante non deve ripiazzarli.
+        
+        Lo stesso customerRef viene inviato a ogni retry: se il primo tentativo
+        e' arrivato all'exchange ma la risposta si e' persa, il retry viene
+        rifiutato come duplicato invece di raddoppiare l'esposizione.
         """
         if not self.client:
             raise Exception("Non connesso a Betfair")
@@ -869,31 +1944,26 @@ class BetfairClient:
         # Note: In dutching, individual selection stakes can be below €1
         # Betfair Italy allows stakes as low as €0.10 per selection in multi-bet scenarios
         
-        limit_orders = []
-        for inst in instructions:
-            limit_orders.append(
-                betfairlightweight.filters.limit_order(
-                    size=inst['size'],
-                    price=inst['price'],
-                    persistence_type='LAPSE'
-                )
-            )
+        customer_ref = customer_ref or new_customer_ref()
+        place_instructions, order_refs = self._build_place_instructions(instructions, customer_ref)
         
-        place_instructions = []
-        for i, inst in enumerate(instructions):
-            place_instructions.append(
-                betfairlightweight.filters.place_instruction(
-                    selection_id=inst['selectionId'],
-                    side=inst['side'],
-                    order_type='LIMIT',
-                    limit_order=limit_orders[i]
+        if async_:
+            futures = self.async_orders.register(order_refs)
+            if self._async_executor is None:
+                self._async_executor = ThreadPoolExecutor(
+                    max_workers=ASYNC_PLACE_WORKERS, thread_name_prefix='place-async'
                 )
+            self._async_executor.submit(
+                self._place_async_worker, market_id, place_instructions, customer_ref, order_refs, futures
             )
+            return {
+                'status': 'PENDING',
+                'marketId': market_id,
+                'customerRef': customer_ref,
+                'futures': futures
+            }
         
-        result = self.client.betting.place_orders(
-            market_id=market_id,
-            instructions=place_instructions
-        )
+        result = self._place_orders(market_id, place_instructions, customer_ref)
         
         # Handle different response structures from betfairlightweight
         instruction_reports = getattr(result, 'instruction_reports', None) or getattr(result, 'instructionReports', None) or []
@@ -905,56 +1975,251 @@ class BetfairClient:
                 'betId': getattr(ir, 'bet_id', None) or getattr(ir, 'betId', None),
                 'placedDate': ir.placed_date.isoformat() if getattr(ir, 'placed_date', None) else None,
                 'averagePriceMatched': getattr(ir, 'average_price_matched', None) or getattr(ir, 'averagePriceMatched', None),
-                'sizeMatched': getattr(ir, 'size_matched', 0) or getattr(ir, 'sizeMatched', 0)
+                'sizeMatched': getattr(ir, 'size_matched', 0) or getattr(ir, 'sizeMatched', 0),
+                'errorCode': getattr(ir, 'error_code', None) or getattr(ir, 'errorCode', None)
             })
         
-        return {
-            'status': getattr(result, 'status', 'UNKNOWN'),
+        status = getattr(result, 'status', 'UNKNOWN')
+        error_code = getattr(result, 'error_code', None) or getattr(result, 'errorCode', None)
+        
+        response = {
+            'status': status,
             'marketId': getattr(result, 'market_id', None) or getattr(result, 'marketId', market_id),
+            'customerRef': customer_ref,
+            'errorCode': error_code,
             'instructionReports': reports
         }
+        
+        if error_code == 'DUPLICATE_TRANSACTION':
+            # Un tentativo precedente con lo stesso customerRef e' gia' stato accettato
+            logger.warning(f"[PLACE] customerRef {customer_ref} duplicato: ordine gia' piazzato, riconcilio")
+            response['deduplicated'] = True
+            response['instructionReports'] = self._reconcile_customer_ref(market_id, customer_ref, len(instructions))
+            if response['instructionReports']:
+                response['status'] = 'SUCCESS'
+        
+        return response
     
-    def get_current_orders(self, market_ids=None):
-        """Get current unmatched and partially matched orders."""
-        if not self.client:
-            raise Exception("Non connesso a Betfair")
+    @with_retry(endpoint='placeOrders')
+    def _place_orders(self, market_id, place_instructions, customer_ref, async_=False):
+        """placeOrders con retry sicuro (customerRef fisso tra i tentativi)."""
+        kwargs = {'async_': True} if async_ else {}
+        return self.client.betting.place_orders(
+            market_id=market_id,
+            instructions=place_instructions,
+            customer_ref=customer_ref,
+            **kwargs
+        )
+    
+    def _place_async_worker(self, market_id, place_instructions, customer_ref, order_refs, futures):
+        """Invia placeOrders async e chiude le Future non confermate dallo stream."""
+        tracker = self.async_orders
+        try:
+            result = self._place_orders(market_id, place_instructions, customer_ref, async_=True)
+        except Exception as e:
+            # La richiesta puo' essere arrivata all'exchange: riconcilia prima di chiudere
+            logger.error(f"[PLACE-ASYNC] placeOrders {customer_ref} fallito: {e}")
+            self._reconcile_async(market_id, customer_ref, order_refs)
+            return
+        
+        status = getattr(result, 'status', 'UNKNOWN')
+        error_code = getattr(result, 'error_code', None) or getattr(result, 'errorCode', None)
+        
+        if status != 'SUCCESS' and error_code != 'DUPLICATE_TRANSACTION':
+            reports = getattr(result, 'instruction_reports', None) or []
+            for i, ref in enumerate(order_refs):
+                ir = reports[i] if i < len(reports) else None
+                tracker.resolve(ref, {
+                    'status': 'FAILURE',
+                    'errorCode': getattr(ir, 'error_code', None) or error_code,
+                    'betId': None,
+                    'sizeMatched': 0,
+                    'customerOrderRef': ref
+                })
+            return
         
-        order_filter = {}
-        if market_ids:
-            order_filter['market_ids'] = market_ids
+        # Accettato: betId e match arrivano dall'order stream
+        wait_futures(futures, timeout=ASYNC_RECONCILE_SEC)
+        pending = [ref for ref, future in zip(order_refs, futures) if not future.done()]
+        if not pending:
+            return
         
-        orders = self.client.betting.list_current_orders(**order_filter)
+        # Stream assente o lento: riconciliazione REST per customerOrderRef
+        logger.warning(f"[PLACE-ASYNC] {len(pending)} ordini {customer_ref} non confermati dallo stream, riconcilio")
+        self._reconcile_async(market_id, customer_ref, pending)
+    
+    def _reconcile_async(self, market_id, customer_ref, pending):
+        """
+        Risolve via listCurrentOrders (customerOrderRef) le Future ancora
+        aperte; quelle non trovate restano 'UNKNOWN', mai fallite: l'ordine
+        puo' essere stato accettato e un retry raddoppierebbe l'esposizione.
+        """
+        tracker = self.async_orders
+        try:
+            orders, _ = self._list_current_orders(market_ids=[market_id], customer_order_refs=pending)
+        except Exception as e:
+            orders = []
+            logger.error(f"[PLACE-ASYNC] Riconciliazione {customer_ref} fallita: {e}")
+        for order in orders:
+            ref = order.get('customerOrderRef')
+            if ref:
+                tracker.resolve(ref, {
+                    'status': 'SUCCESS',
+                    'betId': order['betId'],
+                    'orderStatus': order['status'],
+                    'placedDate': order['placedDate'],
+                    'averagePriceMatched': order['averagePriceMatched'],
+                    'sizeMatched': order['sizeMatched'],
+                    'customerOrderRef': ref
+                })
+        for ref in pending:
+            tracker.resolve(ref, {
+                'status': 'UNKNOWN',
+                'errorCode': 'UNCONFIRMED',
+                'betId': None,
+                'sizeMatched': 0,
+                'customerOrderRef': ref
+            })
+    
+    @no_instrument
+    def on_order_stream_update(self, order_data):
+        """Da collegare alla callback order dello stream: risolve le Future async."""
+        return self.async_orders.on_order_update(order_data)
+    
+    def _reconcile_customer_ref(self, market_id, customer_ref, count):
+        """Recupera i report degli ordini gia' piazzati tramite customerOrderRef."""
+        order_refs = [f"{customer_ref[:28]}-{i}" for i in range(count)]
+        try:
+            orders, _ = self._list_current_orders(
+                market_ids=[market_id],
+                customer_order_refs=order_refs
+            )
+        except Exception as e:
+            logger.error(f"[PLACE] Riconciliazione customerRef {customer_ref} fallita: {e}")
+            return []
+        
+        return [{
+            'status': 'SUCCESS',
+            'betId': order['betId'],
+            'placedDate': order['placedDate'],
+            'averagePriceMatched': order['averagePriceMatched'],
+            'sizeMatched': order['sizeMatched']
+        } for order in orders]
+    
+    @no_instrument
+    def attach_order_stream(self, stream):
+        """Collega l'order stream (BetfairStream) per le query 'changed since'."""
+        self.order_stream = stream
+    
+    def _fetch_current_orders(self, **order_filter):
+        """Tutte le pagine di listCurrentOrders (fromRecord/moreAvailable)."""
+        orders = []
+        from_record = 0
+        while True:
+            page, more_available = self._list_current_orders(
+                from_record=from_record, record_count=CURRENT_ORDERS_PAGE_SIZE, **order_filter
+            )
+            orders.extend(page)
+            if not more_available or not page:
+                return orders
+            from_record += len(page)
+    
+    def get_current_orders(self, market_ids=None, bet_ids=None, placed_from=None,
+                           placed_to=None, changed_since=None):
+        """Get current unmatched and partially matched orders.
         
+        Args:
+            market_ids / bet_ids: filtri lato server
+            placed_from / placed_to: intervallo data piazzamento (datetime UTC)
+            changed_since: epoch secondi; con order stream connesso risponde
+                dalla cache dello stream (nessuna chiamata REST) con i soli
+                ordini cambiati, altrimenti ripiega su REST (superset).
+        """
+        orders = self._current_orders(market_ids, bet_ids, placed_from, placed_to, changed_since)
         result = {
             'matched': [],
             'unmatched': [],
             'partiallyMatched': []
         }
-        
-        for order in orders.orders if orders.orders else []:
-            order_data = {
-                'betId': order.bet_id,
-                'marketId': order.market_id,
-                'selectionId': order.selection_id,
-                'side': order.side,
-                'price': order.price_size.price if order.price_size else None,
-                'size': order.price_size.size if order.price_size else None,
-                'sizeMatched': order.size_matched,
-                'sizeRemaining': order.size_remaining,
-                'averagePriceMatched': order.average_price_matched,
-                'status': order.status,
-                'placedDate': order.placed_date.isoformat() if order.placed_date else None
-            }
-            
-            if order.size_remaining == 0 and order.size_matched > 0:
-                result['matched'].append(order_data)
-            elif order.size_remaining > 0 and order.size_matched > 0:
-                result['partiallyMatched'].append(order_data)
-            elif order.size_remaining > 0:
-                result['unmatched'].append(order_data)
-        
+        for order_data in orders:
+            bucket = _order_bucket(order_data)
+            if bucket:
+                result[bucket].append(order_data)
         return result
     
+    def sync_current_orders(self):
+        """
+        Ordini correnti tenuti in memoria per i loop periodici: snapshot
+        REST completo alla prima chiamata e ogni ORDERS_RESYNC_SEC, in mezzo
+        solo i cambiamenti dalla cache dell'order stream (changed_since).
+        Senza stream ogni chiamata e' uno snapshot completo. Stesso formato
+        di get_current_orders.
+        """
+        with self._orders_sync_lock:
+            now = time.time()
+            stream = self.order_stream
+            delta = (
+                self._orders_synced_at is not None
+                and stream is not None and stream.has_order_cache()
+                and now - self._orders_full_at < ORDERS_RESYNC_SEC
+            )
+            if delta:
+                orders = self._current_orders(changed_since=self._orders_synced_at - ORDERS_DELTA_OVERLAP)
+            else:
+                orders = self._current_orders()
+                self._orders_snapshot = {}
+                self._orders_full_at = now
+            
+            for order_data in orders:
+                bucket = _order_bucket(order_data)
+                if bucket:
+                    self._orders_snapshot[order_data['betId']] = (bucket, order_data)
+                else:
+                    # Cancellato/scaduto senza abbinamenti
+                    self._orders_snapshot.pop(order_data['betId'], None)
+            self._orders_synced_at = now
+            
+            result = {
+                'matched': [],
+                'unmatched': [],
+                'partiallyMatched': []
+            }
+            for bucket, order_data in self._orders_snapshot.values():
+                result[bucket].append(dict(order_data))
+            return result
+    
+    def _current_orders(self, market_ids=None, bet_ids=None, placed_from=None,
+                        placed_to=None, changed_since=None):
+        """Ordini grezzi (formato REST) da stream cache o listCurrentOrders."""
+        if not self.client:
+            raise Exception("Non connesso a Betfair")
+        if market_ids is not None and not market_ids:
+            # Lista vuota: nessun mercato, non un fetch senza filtro
+            return []
+        
+        stream = self.order_stream
+        if changed_since is not None and stream is not None and stream.has_order_cache():
+            orders = [adapt_stream_order(o) for o in stream.get_orders_changed_since(changed_since, market_ids)]
+            if bet_ids:
+                wanted = {str(b) for b in bet_ids}
+                orders = [o for o in orders if o['betId'] in wanted]
+            if placed_from or placed_to:
+                orders = [o for o in orders if _placed_within(o['placedDate'], placed_from, placed_to)]
+        else:
+            order_filter = {}
+            if market_ids:
+                order_filter['market_ids'] = list(market_ids)
+            if bet_ids:
+                order_filter['bet_ids'] = [str(b) for b in bet_ids]
+            if placed_from or placed_to:
+                order_filter['date_range'] = filters.time_range(from_=placed_from, to=placed_to)
+                order_filter['order_by'] = 'BY_PLACE_TIME'
+            orders = self._fetch_current_orders(**order_filter)
+        
+        for order_data in orders:
+            order_data.pop('customerOrderRef', None)
+        return orders
+    
     def cancel_orders(self, market_id, bet_ids=None):
         """Cancel unmatched orders."""
         if not self.client:
@@ -967,10 +2232,7 @@ class BetfairClient:
                     betfairlightweight.filters.cancel_instruction(bet_id=bet_id)
                 )
         
-        result = self.client.betting.cancel_orders(
-            market_id=market_id,
-            instructions=instructions if instructions else None
-        )
+        result = self._cancel_orders(market_id, instructions if instructions else None)
         
         # Handle different response structures
         instruction_reports = getattr(result, 'instruction_reports', None) or getattr(result, 'instructionReports', None) or []
@@ -987,6 +2249,14 @@ class BetfairClient:
             'instructionReports': reports
         }
     
+    @with_retry(endpoint='cancelOrders')
+    def _cancel_orders(self, market_id, instructions):
+        """cancelOrders con retry (idempotente: cancellare due volte e' innocuo)."""
+        return self.client.betting.cancel_orders(
+            market_id=market_id,
+            instructions=instructions
+        )
+    
     def get_markets(self, event_id):
         """Alias for get_available_markets - get all markets for an event."""
         return self.get_available_markets(event_id)
@@ -1031,10 +2301,7 @@ class BetfairClient:
             )
         ]
         
-        result = self.client.betting.replace_orders(
-            market_id=market_id,
-            instructions=instructions
-        )
+        result = self._replace_orders(market_id, instructions, new_customer_ref())
         
         instruction_reports = getattr(result, 'instruction_reports', None) or getattr(result, 'instructionReports', None) or []
         
@@ -1062,7 +2329,10 @@ class BetfairClient:
                 'newBetId': new_bet_id,  # IMPORTANTE: traccia questo!
                 'sizeCancelled': size_cancelled,
                 'sizeMatched': size_matched,
-                'averagePriceMatched': average_price
+                'averagePriceMatched': average_price,
+                'cancelStatus': getattr(cancel_report, 'status', None) if cancel_report else None,
+                'placeStatus': getattr(place_report, 'status', None) if place_report else None,
+                'errorCode': getattr(ir, 'error_code', None)
             }
             reports.append(report)
             
@@ -1105,10 +2375,7 @@ class BetfairClient:
                 )
             )
         
-        result = self.client.betting.replace_orders(
-            market_id=market_id,
-            instructions=instructions
-        )
+        result = self._replace_orders(market_id, instructions, new_customer_ref())
         
         instruction_reports = getattr(result, 'instruction_reports', None) or getattr(result, 'instructionReports', None) or []
         
@@ -1117,15 +2384,22 @@ class BetfairClient:
             original_bet_id = replacements[i]['betId'] if i < len(replacements) else None
             
             place_report = getattr(ir, 'place_instruction_report', None)
+            cancel_report = getattr(ir, 'cancel_instruction_report', None)
             new_bet_id = None
             if place_report:
                 new_bet_id = getattr(place_report, 'bet_id', None) or getattr(place_report, 'betId', None)
             
+            # replaceOrders non annulla la cancel se la place fallisce: il
+            # chiamante deve sapere quale meta' e' andata a buon fine
             reports.append({
                 'status': getattr(ir, 'status', 'UNKNOWN'),
                 'originalBetId': original_bet_id,
                 'newBetId': new_bet_id,
-                'newPrice': replacements[i]['newPrice'] if i < len(replacements) else None
+                'newPrice': replacements[i]['newPrice'] if i < len(replacements) else None,
+                'cancelStatus': getattr(cancel_report, 'status', None) if cancel_report else None,
+                'sizeCancelled': (getattr(cancel_report, 'size_cancelled', None) or 0) if cancel_report else 0,
+                'placeStatus': getattr(place_report, 'status', None) if place_report else None,
+                'errorCode': getattr(ir, 'error_code', None)
             })
             
             if new_bet_id and new_bet_id != original_bet_id:
@@ -1136,6 +2410,15 @@ class BetfairClient:
             'instructionReports': reports
         }
     
+    @with_retry(endpoint='replaceOrders')
+    def _replace_orders(self, market_id, instructions, customer_ref):
+        """replaceOrders con retry sicuro (customerRef fisso tra i tentativi)."""
+        return self.client.betting.replace_orders(
+            market_id=market_id,
+            instructions=instructions,
+            customer_ref=customer_ref
+        )
+    
     def cashout(self, market_id, selection_id, side, price, size):
         """
         Execute a cashout by placing an opposite bet.
@@ -1146,43 +2429,6 @@ class BetfairClient:
         opposite_side = 'LAY' if side == 'BACK' else 'BACK'
         return self.place_bet(market_id, selection_id, opposite_side, price, size)
     
-    def calculate_cashout(self, original_stake, original_odds, current_odds, side='BACK'):
-        """
-        Calculate cashout stake and profit/loss.
-        
-        Returns dict with:
-            - cashout_stake: amount to bet for full cashout
-            - profit_if_win: profit if original selection wins
-            - profit_if_lose: profit if original selection loses  
-            - guaranteed_profit: locked-in profit (if positive)
-        """
-        if side == 'BACK':
-            potential_profit = original_stake * (original_odds - 1)
-            cashout_stake = potential_profit / (current_odds - 1)
-            
-            if current_odds < original_odds:
-                guaranteed = original_stake - cashout_stake
-            else:
-                guaranteed = potential_profit - (cashout_stake * (current_odds - 1))
-            
-            return {
-                'cashout_stake': round(cashout_stake, 2),
-                'profit_if_win': round(potential_profit - (cashout_stake * (current_odds - 1)), 2),
-                'profit_if_lose': round(cashout_stake - original_stake, 2),
-                'guaranteed_profit': round(guaranteed, 2) if guaranteed > 0 else 0
-            }
-        else:
-            liability = original_stake * (original_odds - 1)
-            potential_profit = original_stake
-            cashout_stake = liability / (current_odds - 1)
-            
-            return {
-                'cashout_stake': round(cashout_stake, 2),
-                'profit_if_win': round(cashout_stake - liability, 2),
-                'profit_if_lose': round(potential_profit - cashout_stake, 2),
-                'guaranteed_profit': 0
-            }
-    
     def get_position(self, market_id, selection_id):
         """Get current position on a selection including P&L."""
         if not self.client:
@@ -1236,25 +2482,25 @@ class BetfairClient:
             to=settled_to.strftime('%Y-%m-%dT%H:%M:%SZ')
         )
         
-        result = self.client.betting.list_cleared_orders(
+        cleared_orders, _ = self._list_cleared_orders(
             bet_status='SETTLED',
             settled_date_range=time_range
         )
         
         bets = []
-        for order in result.cleared_orders if result.cleared_orders else []:
+        for order in cleared_orders:
             bets.append({
-                'betId': order.bet_id,
-                'marketId': order.market_id,
-                'selectionId': order.selection_id,
-                'side': order.side,
-                'price': order.price_requested,
-                'priceMatched': order.price_matched,
-                'size': order.size_settled,
-                'profit': order.profit,
-                'settledDate': order.settled_date.isoformat() if order.settled_date else None,
-                'eventName': getattr(order, 'event_type_id', '') or '',
-                'itemDescription': getattr(order, 'item_description', None)
+                'betId': order['betId'],
+                'marketId': order['marketId'],
+                'selectionId': order['selectionId'],
+                'side': order['side'],
+                'price': order['priceRequested'],
+                'priceMatched': order['priceMatched'],
+                'size': order['sizeSettled'],
+                'profit': order['profit'],
+                'settledDate': order['settledDate'],
+                'eventName': order['eventTypeId'],
+                'itemDescription': order['itemDescription']
             })
         
         return bets
@@ -1283,6 +2529,7 @@ class BetfairClient:
         
         return market_pnl
     
+    @no_instrument
     def calculate_cashout(self, market_id, selection_id, side, matched_stake, matched_price):
         """
         Calculate cashout stake and potential P/L.
@@ -1301,27 +2548,16 @@ class BetfairClient:
             raise Exception("Non connesso a Betfair")
         
         # Get current prices
-        price_data = self.client.betting.list_market_book(
-            market_ids=[market_id],
-            price_projection=filters.price_projection(
-                price_data=['EX_BEST_OFFERS']
-            )
-        )
+        price_data = self._list_market_books([market_id], price_data=['EX_BEST_OFFERS'])
         
         if not price_data:
             raise Exception("Quote non disponibili")
         
         current_price = None
-        for runner in price_data[0].runners:
-            if runner.selection_id == selection_id:
-                if side == 'BACK':
-                    # For BACK cashout, we need LAY price
-                    if runner.ex and runner.ex.available_to_lay:
-                        current_price = runner.ex.available_to_lay[0].price
-                else:
-                    # For LAY cashout, we need BACK price
-                    if runner.ex and runner.ex.available_to_back:
-                        current_price = runner.ex.available_to_back[0].price
+        for runner in price_data[0]['runners']:
+            if runner['selectionId'] == selection_id:
+                # For BACK cashout, we need LAY price; for LAY cashout, BACK price
+                current_price = best_price(runner, 'LAY' if side == 'BACK' else 'BACK')
                 break
         
         if not current_price:
@@ -1392,25 +2628,14 @@ class BetfairClient:
             Best available price or None
         """
         try:
-            price_data = self.client.betting.list_market_book(
-                market_ids=[market_id],
-                price_projection=filters.price_projection(
-                    price_data=['EX_BEST_OFFERS']
-                )
-            )
+            price_data = self._list_market_books([market_id], price_data=['EX_BEST_OFFERS'])
             
-            if not price_data or not price_data[0].runners:
+            if not price_data or not price_data[0]['runners']:
                 return None
             
-            for runner in price_data[0].runners:
-                if runner.selection_id == selection_id:
-                    if side == 'BACK':
-                        if runner.ex and runner.ex.available_to_back:
-                            return runner.ex.available_to_back[0].price
-                    else:  # LAY
-                        if runner.ex and runner.ex.available_to_lay:
-                            return runner.ex.available_to_lay[0].price
-                    break
+            for runner in price_data[0]['runners']:
+                if runner['selectionId'] == selection_id:
+                    return best_price(runner, side)
             return None
         except:
             return None
@@ -1431,28 +2656,6 @@ class BetfairClient:
         Returns:
             Adjusted price
         """
-        # Betfair price ladder increments
-        if price < 2:
-            increment = 0.01
-        elif price < 3:
-            increment = 0.02
-        elif price < 4:
-            increment = 0.05
-        elif price < 6:
-            increment = 0.1
-        elif price < 10:
-            increment = 0.2
-        elif price < 20:
-            increment = 0.5
-        elif price < 30:
-            increment = 1.0
-        elif price < 50:
-            increment = 2.0
-        elif price < 100:
-            increment = 5.0
-        else:
-            increment = 10.0
-        
         # Betfair order matching:
         # - BACK at price X matches LAY orders at X or HIGHER
         # - LAY at price X matches BACK orders at X or LOWER
@@ -1460,12 +2663,10 @@ class BetfairClient:
         # To increase fill probability with slippage:
         # - BACK: DECREASE price (willing to accept lower odds = worse for backer)
         # - LAY: INCREASE price (offering higher odds = worse for layer, attracts backers)
+        # Offset by ladder index, so slippage crosses band boundaries correctly
         if side == 'BACK':
-            adjusted = price - (increment * slippage_ticks)
-            return max(1.01, round(adjusted, 2))
-        else:  # LAY
-            adjusted = price + (increment * slippage_ticks)
-            return min(1000, round(adjusted, 2))
+            return tick_offset(price, -slippage_ticks)
+        return tick_offset(price, slippage_ticks)
     
     def execute_cashout(self, market_id, selection_id, cashout_side, cashout_stake, cashout_price, 
                         max_retries=3, slippage_ticks=1, use_fresh_price=True):
@@ -1498,6 +2699,9 @@ class BetfairClient:
         
         last_error = None
         last_status = None
+        # customerRef rinnovato solo dopo una risposta definitiva: dopo un errore
+        # di rete il tentativo successivo riusa lo stesso ref (no doppio cashout)
+        customer_ref = new_customer_ref()
         
         for attempt in range(max_retries):
             try:
@@ -1534,12 +2738,22 @@ class BetfairClient:
                 
                 result = self.client.betting.place_orders(
                     market_id=market_id,
-                    instructions=instructions
+                    instructions=instructions,
+                    customer_ref=customer_ref
                 )
                 
                 # Parse result
                 parsed = self._parse_cashout_result(result)
                 
+                if parsed.get('error_code') == 'DUPLICATE_TRANSACTION':
+                    # Il tentativo precedente (risposta persa) e' gia' stato piazzato
+                    logger.warning(f"[CASHOUT] customerRef {customer_ref} gia' piazzato, nessun nuovo ordine")
+                    parsed['status'] = 'SUCCESS'
+                    parsed['deduplicated'] = True
+                    parsed['attempts'] = attempt + 1
+                    return parsed
+                customer_ref = new_customer_ref()
+                
                 # Success - return immediately
                 if parsed.get('status') == 'SUCCESS':
                     parsed['price_used'] = price_to_use
@@ -1558,7 +2772,7 @@ class BetfairClient:
                 
                 # Retry on transient errors or unmatched
                 if attempt < max_retries - 1:
-                    time.sleep(0.5 * (attempt + 1))  # Increasing delay
+                    time.sleep(backoff_delay(attempt, base=0.5))
                     continue
                 
                 return parsed
@@ -1566,7 +2780,7 @@ class BetfairClient:
             except Exception as e:
                 last_error = str(e)
                 if attempt < max_retries - 1:
-                    time.sleep(0.5 * (attempt + 1))
+                    time.sleep(backoff_delay(attempt, base=0.5))
                     continue
         
         # All retries failed
@@ -9,7 +9,7 @@ import json
 import threading
 import logging
 import time
-from typing import Callable, Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List
 
 
 class BetfairStream:
@@ -19,6 +19,10 @@ class BetfairStream:
     STREAM_HOST_IT = "stream-api.betfair.it"
     STREAM_PORT = 443
     
+    # Completed orders stay in the order cache this long (longer than any polling window)
+    ORDER_CACHE_TTL = 600.0
+    ORDER_CACHE_PRUNE_INTERVAL = 60.0
+    
     def __init__(self, app_key: str, session_token: str, use_italian_exchange: bool = True):
         """
         Initialize Betfair Stream client.
@@ -48,11 +52,21 @@ class BetfairStream:
         
         # Market stream callbacks
         self.on_market_change: Optional[Callable[[Dict], None]] = None
+        # Additional market listeners (e.g. trading engines), called after on_market_change
+        self._market_listeners: List[Callable[[Dict], None]] = []
+        # marketDefinition listeners (status, in-play, winners): (market_id, definition)
+        self._definition_listeners: List[Callable[[str, Dict], None]] = []
         
         # Market data cache for delta processing
         self._market_cache: Dict[str, Dict] = {}
         self._subscribed_markets: list = []
         
+        # Order cache (bet_id -> latest order state) for "changed since" queries
+        self._order_cache: Dict[str, Dict] = {}
+        self._order_cache_lock = threading.Lock()
+        self._order_image_ready = False
+        self._order_cache_pruned_at = 0.0
+        
         self._read_thread = None
         self._heartbeat_thread = None
         
@@ -67,6 +81,26 @@ class BetfairStream:
         self.on_error = on_error
         self.on_market_change = on_market_change
     
+    def add_market_listener(self, callback: Callable[[Dict], None]):
+        """Register an extra market update listener (called from the read thread)."""
+        if callback not in self._market_listeners:
+            self._market_listeners.append(callback)
+    
+    def remove_market_listener(self, callback: Callable[[Dict], None]):
+        """Unregister a market update listener."""
+        if callback in self._market_listeners:
+            self._market_listeners.remove(callback)
+    
+    def add_definition_listener(self, callback: Callable[[str, Dict], None]):
+        """Register a marketDefinition listener (status, in-play, runner results)."""
+        if callback not in self._definition_listeners:
+            self._definition_listeners.append(callback)
+    
+    def remove_definition_listener(self, callback: Callable[[str, Dict], None]):
+        """Unregister a marketDefinition listener."""
+        if callback in self._definition_listeners:
+            self._definition_listeners.remove(callback)
+    
     def _get_next_id(self) -> int:
         """Get next message ID."""
         self.message_id += 1
@@ -113,6 +147,7 @@ class BetfairStream:
         self.running = False
         self.connected = False
         self.authenticated = False
+        self._order_image_ready = False
         
         if self.ssl_socket:
             try:
@@ -196,7 +231,7 @@ class BetfairStream:
         
         # Default fields for price streaming
         if fields is None:
-            fields = ["EX_BEST_OFFERS", "EX_TRADED"]
+            fields = ["EX_BEST_OFFERS", "EX_TRADED", "EX_MARKET_DEF"]
         
         self._subscribed_markets = market_ids
         
@@ -323,6 +358,11 @@ class BetfairStream:
         try:
             oc = msg.get("oc", [])
             
+            if msg.get("ct") == "SUB_IMAGE":
+                # Full image: the cache is rebuilt from this message
+                with self._order_cache_lock:
+                    self._order_cache.clear()
+            
             for market_orders in oc:
                 market_id = market_orders.get("id")
                 orders = market_orders.get("orc", [])
@@ -348,11 +388,17 @@ class BetfairStream:
                             "size_cancelled": order.get("sc", 0),
                             "size_voided": order.get("sv", 0),
                             "placed_date": order.get("pd"),
-                            "matched_date": order.get("md")
+                            "matched_date": order.get("md"),
+                            "average_price_matched": order.get("avp"),
+                            "customer_order_ref": order.get("rfo")
                         }
                         
                         logging.info(f"Order update: {order_data['bet_id']} - matched={order_data['size_matched']}")
                         
+                        # Each uo entry carries the full order state
+                        with self._order_cache_lock:
+                            self._order_cache[str(order_data['bet_id'])] = dict(order_data, changed_at=time.time())
+                        
                         if self.on_order_change:
                             self.on_order_change(order_data)
                     
@@ -372,9 +418,33 @@ class BetfairStream:
                         if self.on_order_change:
                             self.on_order_change(order_data)
                             
+            if msg.get("ct") == "SUB_IMAGE":
+                self._order_image_ready = True
+            
+            self._prune_order_cache([mo.get("id") for mo in oc if mo.get("closed")])
+                
         except Exception as e:
             logging.error(f"Error handling order change: {e}")
     
+    def _prune_order_cache(self, closed_markets: List[str]):
+        """Evict orders of closed (settled) markets and completed orders older than ORDER_CACHE_TTL."""
+        now = time.time()
+        expire = now - self._order_cache_pruned_at >= self.ORDER_CACHE_PRUNE_INTERVAL
+        if not closed_markets and not expire:
+            return
+        closed = set(closed_markets)
+        with self._order_cache_lock:
+            stale = [
+                bet_id for bet_id, order in self._order_cache.items()
+                if order['market_id'] in closed
+                or (expire and order['status'] == 'EXECUTION_COMPLETE'
+                    and now - order['changed_at'] > self.ORDER_CACHE_TTL)
+            ]
+            for bet_id in stale:
+                del self._order_cache[bet_id]
+        if expire:
+            self._order_cache_pruned_at = now
+    
     def _handle_market_change(self, msg: Dict):
         """
         Handle MarketChangeMessage (mcm) for real-time price updates.
@@ -391,7 +461,7 @@ class BetfairStream:
                             "id": 12345,  # selection_id
                             "atb": [[1.5, 100], [1.48, 200]],  # available to back
                             "atl": [[1.52, 50], [1.55, 150]],  # available to lay
-                            "trd": [[1.5, 500]],  # traded volume
+                            "trd": [[1.5, 500]],  # traded volume (delta per price)
                             "ltp": 1.5,  # last traded price
                             "tv": 1500  # total volume
                         }
@@ -422,6 +492,18 @@ class BetfairStream:
                 if market_status:
                     market_cache["status"] = market_status
                 
+                # Market definition (status, in-play, WINNER/LOSER/REMOVED at settlement)
+                definition = market.get("marketDefinition")
+                if definition:
+                    market_cache["definition"] = definition
+                    if definition.get("status"):
+                        market_cache["status"] = definition["status"]
+                    for listener in list(self._definition_listeners):
+                        try:
+                            listener(market_id, definition)
+                        except Exception as e:
+                            logging.error(f"Definition listener error: {e}")
+                
                 # Runner changes
                 runner_changes = market.get("rc", [])
                 
@@ -435,6 +517,7 @@ class BetfairStream:
                         market_cache["runners"][selection_id] = {
                             "back": [],
                             "lay": [],
+                            "traded": {},
                             "ltp": None,
                             "tv": 0
                         }
@@ -452,6 +535,14 @@ class BetfairStream:
                     if atl is not None:
                         runner_cache["lay"] = sorted(atl, key=lambda x: x[0]) if atl else []
                     
+                    # Traded volume per price (delta: size 0 removes the level)
+                    trd = rc.get("trd") or []
+                    for price, size in trd:
+                        if size:
+                            runner_cache["traded"][price] = size
+                        else:
+                            runner_cache["traded"].pop(price, None)
+                    
                     # Last traded price
                     ltp = rc.get("ltp")
                     if ltp is not None:
@@ -478,16 +569,36 @@ class BetfairStream:
                         "ltp": runner_cache["ltp"],
                         "tv": runner_cache["tv"],
                         "back_prices": runner_cache["back"][:3],  # Top 3 levels
-                        "lay_prices": runner_cache["lay"][:3]
+                        "lay_prices": runner_cache["lay"][:3],
+                        "traded": trd  # [[price, cumulative size]] changed in this message
                     }
                     
                     # Notify callback
                     if self.on_market_change:
                         self.on_market_change(update_data)
+                    for listener in list(self._market_listeners):
+                        try:
+                            listener(update_data)
+                        except Exception as e:
+                            logging.error(f"Market listener error: {e}")
                         
         except Exception as e:
             logging.error(f"Error handling market change: {e}")
     
+    def has_order_cache(self) -> bool:
+        """True when connected and the initial order image has been received."""
+        return self.connected and self.authenticated and self._order_image_ready
+    
+    def get_orders_changed_since(self, since: float, market_ids: Optional[list] = None) -> list:
+        """Orders whose state changed after `since` (epoch seconds), optionally by market."""
+        markets = set(market_ids) if market_ids else None
+        with self._order_cache_lock:
+            return [
+                dict(order) for order in self._order_cache.values()
+                if order['changed_at'] > since
+                and (markets is None or order['market_id'] in markets)
+            ]
+    
     def get_market_cache(self, market_id: str) -> Optional[Dict]:
         """Get cached market data."""
         return self._market_cache.get(market_id)
@@ -448,6 +448,15 @@ class Database:
             )
         ''')
         
+        # Watermark/cursori per le sincronizzazioni incrementali (es. cleared orders)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                updated_at TEXT
+            )
+        ''')
+        
         # Indexes for performance
         try:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_telegram_audit_status ON telegram_audit(status)')
@@ -1049,7 +1058,7 @@ class Database:
         # conn.close() - using persistent connection
     
     def save_simulation_bet(self, event_name, market_id, market_name, side, 
-                            selections, total_stake, potential_profit):
+                            selections, total_stake, potential_profit, status='MATCHED'):
         """Save a simulation bet."""
         conn = self._get_connection()
         cursor = conn.cursor()
@@ -1057,17 +1066,54 @@ class Database:
             INSERT INTO simulation_bets 
             (event_name, market_id, market_name, side, selections, 
              total_stake, potential_profit, status, placed_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, 'MATCHED', ?)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             event_name, market_id, market_name, side,
             json.dumps(selections) if isinstance(selections, (list, dict)) else str(selections),
-            total_stake, potential_profit, datetime.now().isoformat()
+            total_stake, potential_profit, status, datetime.now().isoformat()
         ))
         bet_id = cursor.lastrowid
         conn.commit()
         # conn.close() - using persistent connection
         return bet_id
     
+    def get_open_simulation_bets(self, market_id):
+        """Get simulation bets of a market not yet settled."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM simulation_bets WHERE market_id = ? AND settled_at IS NULL
+        ''', (market_id,))
+        rows = cursor.fetchall()
+        bets = []
+        for row in rows:
+            bet = dict(row)
+            try:
+                bet['selections'] = json.loads(bet['selections'])
+            except (TypeError, ValueError):
+                bet['selections'] = []
+            bets.append(bet)
+        return bets
+    
+    def settle_simulation_bet(self, bet_id, profit_loss, result):
+        """Mark a simulation bet as settled and update won/lost counters."""
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute('''
+            UPDATE simulation_bets SET 
+                status = 'SETTLED',
+                settled_at = ?,
+                profit_loss = ?,
+                result = ?
+            WHERE id = ?
+        ''', (datetime.now().isoformat(), profit_loss, result, bet_id))
+        if result == 'won':
+            cursor.execute('UPDATE simulation_settings SET total_won = total_won + 1 WHERE id = 1')
+        elif result == 'lost':
+            cursor.execute('UPDATE simulation_settings SET total_lost = total_lost + 1 WHERE id = 1')
+        conn.commit()
+        # conn.close() - using persistent connection
+    
     def get_simulation_bets(self, limit=50):
         """Get simulation bet history."""
         conn = self._get_connection()
@@ -1193,6 +1239,30 @@ class Database:
         conn.commit()
         # conn.close() - using persistent connection
     
+    # ==================== SYNC STATE METHODS ====================
+    
+    def get_sync_state(self, key):
+        """Get a persisted sync watermark (None if never synced)."""
+        def do_get():
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT value FROM sync_state WHERE key = ?', (key,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        return self._execute_with_retry(do_get)
+    
+    def set_sync_state(self, key, value):
+        """Persist a sync watermark."""
+        def do_set():
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO sync_state (key, value, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            ''', (key, value, datetime.now().isoformat()))
+            conn.commit()
+        self._execute_with_retry(do_set)
+    
     # ==================== TELEGRAM AUDIT METHODS ====================
     
     def insert_telegram_audit(self, chat_id: str, payload: str, dedup_key: str = None) -> int:
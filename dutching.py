@@ -3,8 +3,19 @@ Dutching Engine per Betfair Exchange.
 Calcolo stake ottimali per profitto uniforme su multiple selezioni.
 """
 
+import heapq
 import logging
-from typing import List, Dict, Tuple
+import math
+from bisect import bisect_left
+from typing import List, Dict, Optional, Tuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from tick_ladder import ticks_difference
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +27,12 @@ MAX_WIN = 10000.0
 def validate_selections(results: List[Dict]) -> List[str]:
     """Valida selezioni per requisiti Betfair."""
     errors = []
+    total = sum(r.get("stake", 0) for r in results)
+    if results and total < len(results) * MIN_STAKE:
+        errors.append(
+            f"Budget troppo basso: {total:.2f} < {len(results) * MIN_STAKE:.2f} "
+            f"({len(results)} selezioni x {MIN_STAKE:.2f})"
+        )
     for r in results:
         if r.get("stake", 0) < MIN_STAKE:
             errors.append(f"Stake troppo basso: {r.get('stake', 0):.2f} < {MIN_STAKE}")
@@ -27,6 +44,385 @@ def validate_selections(results: List[Dict]) -> List[str]:
     return errors
 
 
+# ==============================================================================
+# ARROTONDAMENTO STAKE
+# ==============================================================================
+#
+# Gli stake vanno in centesimi (regola Betfair) e rispettano MIN_STAKE; il
+# numero totale di centesimi e' fissato dal budget (o dalla somma
+# arrotondata degli stake grezzi). Profitto dell'esito j, modello
+# diagonale + rango uno:
+#   profit_j = offset_j + diag_j * x_j + sum_{k != j} off_k * x_k
+#   BACK: diag = p - 1, off = -1     LAY: diag = -(p - 1), off = +1
+# (offset = termine costante, es. ladder linearizzata nel dutching su depth)
+# Obiettivo: spread minimo tra i profitti degli esiti (a parita, profitto
+# garantito piu alto).
+#
+# Con off uguale per tutti i leg il termine comune e' costante e basta
+# equalizzare u_j = +-offset_j + |diag_j - off| * c_j (separabile). Per ogni livello
+# candidato (ogni leg a floor-1/floor/floor+1 centesimi) si prendono i
+# centesimi minimi per stare sopra il livello e i residui vanno dove
+# alzano meno il massimo; si tiene il candidato con spread minimo.
+# Misto (off diverso per BACK e LAY): water-filling dal floor verso
+# l'esito peggiore, poi scambi di singoli centesimi che riducono lo spread.
+# Resta candidato anche l'arrotondamento storico (centesimo piu vicino e
+# resto sullo stake piu grande): lo spread non e' mai peggiore di quello.
+#
+# round_stakes e' una scansione di candidati in Python puro per un singolo
+# book; la versione NumPy per molti book e' round_stakes_batch. Il LAY
+# dutching classico passa invece da round_lay_stakes (sotto), non da un
+# ottimizzatore vettoriale comune.
+#
+# Il LAY dutching classico non equalizza il profitto ma ripartisce la
+# liability (liability_i proporzionale a 1/(p_i-1)): round_lay_stakes
+# arrotonda quella ripartizione senza superare la liability totale.
+
+ROUND_CENT = 0.01
+
+
+def back_rounding_coefficients(prices):
+    """(diag, off) di round_stakes per leg BACK."""
+    return [p - 1 for p in prices], [-1.0] * len(prices)
+
+
+def lay_rounding_coefficients(prices):
+    """(diag, off) di round_stakes per leg LAY."""
+    return [1 - p for p in prices], [1.0] * len(prices)
+
+
+def _clamp_min_stakes(stakes: List[float], total: Optional[float], min_stake: float) -> List[float]:
+    """
+    Porta a min_stake gli stake attivi sotto soglia; con budget riscala gli altri.
+    
+    Il chiamante garantisce total >= leg attivi * min_stake (nessun leg
+    attivo viene azzerato).
+    """
+    stakes = list(stakes)
+    for _ in range(len(stakes)):
+        low = [i for i, x in enumerate(stakes) if 0 < x < min_stake]
+        if not low:
+            break
+        for i in low:
+            stakes[i] = min_stake
+        if total is not None:
+            fixed = sum(1 for x in stakes if 0 < x <= min_stake)
+            rest = sum(x for x in stakes if x > min_stake)
+            if rest > 0:
+                scale = max(total - min_stake * fixed, 0.0) / rest
+                stakes = [x * scale if x > min_stake else x for x in stakes]
+    return stakes
+
+
+def _separable_cents(floors: List[int], weights: List[float], bases: List[float],
+                     budget: int, min_cents: int, prefer_high: bool) -> List[int]:
+    """
+    Spread minimo di u_j = bases_j + weights_j * c_j con sum(c) = budget.
+    
+    prefer_high: a parita di spread preferisce il minimo piu alto (BACK),
+    altrimenti il massimo piu basso (LAY: u alto = profitto basso).
+    """
+    levels = sorted({
+        b + w * c for w, b, f in zip(weights, bases, floors)
+        for c in (f - 1, f, f + 1) if c >= min_cents
+    })
+    best, best_key = None, None
+    for level in levels:
+        cents = [
+            max(min_cents, math.ceil((level - b) / w - 1e-9))
+            for w, b in zip(weights, bases)
+        ]
+        left = budget - sum(cents)
+        if left < 0:
+            break
+        heap = [(b + w * (c + 1), j) for j, (w, b, c) in enumerate(zip(weights, bases, cents))]
+        heapq.heapify(heap)
+        for _ in range(left):
+            _, j = heapq.heappop(heap)
+            cents[j] += 1
+            heapq.heappush(heap, (bases[j] + weights[j] * (cents[j] + 1), j))
+        values = [b + w * c for w, b, c in zip(weights, bases, cents)]
+        low, high = min(values), max(values)
+        key = (round(high - low, 9), -low if prefer_high else high)
+        if best_key is None or key < best_key:
+            best, best_key = cents, key
+    if best is None:
+        return [max(min_cents, f) for f in floors]
+    return best
+
+
+def _mixed_cents(floors: List[int], diag, off, offsets, extra: int, min_cents: int) -> List[int]:
+    """Caso misto: water-filling dal floor + scambi di singoli centesimi."""
+    n = len(floors)
+    cents = list(floors)
+    off_total = sum(o * c for o, c in zip(off, cents)) / 100.0
+    profits = [
+        (d - o) * c / 100.0 + off_total + a
+        for d, o, c, a in zip(diag, off, cents, offsets)
+    ]
+    
+    def shift(give, take):
+        # Variazione dei profitti spostando un centesimo da give (None = budget) a take
+        out = [off[take] * ROUND_CENT] * n
+        out[take] = diag[take] * ROUND_CENT
+        if give is not None:
+            out = [v - off[give] * ROUND_CENT for v in out]
+            out[give] -= (diag[give] - off[give]) * ROUND_CENT
+        return out
+    
+    # Un centesimo alla volta al leg che alza di piu l'esito peggiore:
+    # gli altri esiti si spostano tutti di off[j], basta il secondo minimo
+    for _ in range(extra):
+        order = sorted(range(n), key=profits.__getitem__)
+        best, best_val = None, None
+        for j in range(n):
+            others = profits[order[1]] if j == order[0] else profits[order[0]]
+            val = min(others + off[j] * ROUND_CENT, profits[j] + diag[j] * ROUND_CENT)
+            if best is None or val > best_val:
+                best, best_val = j, val
+        profits = [p + dp for p, dp in zip(profits, shift(None, best))]
+        cents[best] += 1
+    
+    # Scambi i -> j finche lo spread scende (a parita, minimo piu alto).
+    # Gli esiti diversi da i e j si spostano di off[j] - off[i]: min e max
+    # del resto dai tre profitti piu bassi e piu alti
+    for _ in range(2 * n):
+        order = sorted(range(n), key=profits.__getitem__)
+        lows, highs = order[:3], order[::-1][:3]
+        current = profits[order[-1]] - profits[order[0]]
+        best, best_score, best_spread = None, None, None
+        for i in range(n):
+            if cents[i] - 1 < max(min_cents, 1):
+                continue
+            for j in range(n):
+                if i == j:
+                    continue
+                delta = (off[j] - off[i]) * ROUND_CENT
+                p_i = profits[i] + (off[j] - diag[i]) * ROUND_CENT
+                p_j = profits[j] + (diag[j] - off[i]) * ROUND_CENT
+                low, high = min(p_i, p_j), max(p_i, p_j)
+                for k in lows:
+                    if k != i and k != j:
+                        low = min(low, profits[k] + delta)
+                        break
+                for k in highs:
+                    if k != i and k != j:
+                        high = max(high, profits[k] + delta)
+                        break
+                score = high - low - low * 1e-9
+                if best_score is None or score < best_score:
+                    best, best_score, best_spread = (i, j), score, high - low
+        if best is None or best_spread >= current - 1e-9:
+            break
+        profits = [p + dp for p, dp in zip(profits, shift(*best))]
+        cents[best[0]] -= 1
+        cents[best[1]] += 1
+    return cents
+
+
+def round_stakes(
+    stakes: List[float],
+    diag: List[float],
+    off: List[float],
+    total: Optional[float] = None,
+    min_stake: float = MIN_STAKE,
+    offsets: Optional[List[float]] = None
+) -> List[float]:
+    """
+    Arrotonda gli stake al centesimo con spread minimo del profitto.
+    
+    Args:
+        stakes: stake grezzi (<= 0 = leg escluso, lasciato invariato)
+        diag, off: coefficienti del profitto (vedi back/lay_rounding_coefficients)
+        total: budget da rispettare esattamente (None = somma arrotondata)
+        min_stake: stake minimo per i leg attivi
+        offsets: termine costante del profitto di ogni esito (default 0)
+    """
+    if min_stake > 0:
+        count = sum(1 for x in stakes if x > 0)
+        if total is not None and count * min_stake > total + 1e-9:
+            # Budget sotto gli stake minimi: stake grezzi, li segnala validate_selections
+            return [round(x, 2) for x in stakes]
+        stakes = _clamp_min_stakes(stakes, total, min_stake)
+    active = [i for i, x in enumerate(stakes) if x > 0]
+    if not active:
+        return [round(x, 2) for x in stakes]
+    
+    raw = [stakes[i] * 100 for i in active]
+    floors = [int(c + 1e-6) for c in raw]
+    min_cents = int(round(min_stake * 100))
+    if total is not None:
+        budget = int(round(total * 100))
+    else:
+        budget = max(int(round(sum(raw))), sum(floors))
+    
+    d = [diag[i] for i in active]
+    o = [off[i] for i in active]
+    a = [offsets[i] for i in active] if offsets else [0.0] * len(active)
+    gains = [x - y for x, y in zip(d, o)]
+    if len(active) == 1:
+        cents = [max(budget, min_cents)]
+    elif max(o) - min(o) < 1e-12 and (min(gains) > 0 or max(gains) < 0):
+        # u_j = profitto (segno incluso) in centesimi di valore
+        sign = 1.0 if gains[0] > 0 else -1.0
+        cents = _separable_cents(
+            floors, [abs(g) for g in gains], [sign * 100 * v for v in a],
+            budget, min_cents, sign > 0
+        )
+    else:
+        extra = min(max(budget - sum(floors), 0), len(active))
+        cents = _mixed_cents(floors, d, o, a, extra, min_cents)
+    
+    # Candidato storico: centesimo piu vicino e resto sullo stake piu grande
+    legacy = [int(round(c)) for c in raw]
+    legacy[raw.index(max(raw))] += budget - sum(legacy)
+    if min(legacy) >= max(min_cents, 1):
+        def spread(c):
+            common = sum(y * x for y, x in zip(o, c))
+            values = [(g * x + common) / 100.0 + v for g, x, v in zip(gains, c, a)]
+            return max(values) - min(values), -min(values)
+        if spread(legacy)[0] < spread(cents)[0] - 1e-9:
+            cents = legacy
+    
+    result = [round(x, 2) for x in stakes]
+    for i, c in zip(active, cents):
+        result[i] = c / 100.0
+    return result
+
+
+def round_lay_stakes(stakes: List[float], prices: List[float], total_liability: float) -> List[float]:
+    """
+    Arrotonda al centesimo gli stake LAY mantenendo la ripartizione della liability.
+    
+    Parte dal floor di ogni stake (liability sotto il target del leg) e
+    aggiunge un centesimo ai leg piu lontani dal proprio target finche'
+    la liability totale resta entro total_liability: la somma differisce
+    dall'input di meno di un centesimo di stake del leg piu caro.
+    """
+    cents = [int(x * 100 + 1e-6) if x > 0 else 0 for x in stakes]
+    gains = [p - 1 for p in prices]
+    budget = int(round(total_liability * 100))
+    used = sum(c * g for c, g in zip(cents, gains))
+    # Deficit di liability di ogni leg rispetto alla ripartizione grezza
+    order = sorted(
+        (i for i, x in enumerate(stakes) if x > 0),
+        key=lambda i: -(stakes[i] * 100 - cents[i]) * gains[i]
+    )
+    for i in order:
+        if stakes[i] * 100 - cents[i] > 1e-6 and used + gains[i] <= budget + 1e-6:
+            cents[i] += 1
+            used += gains[i]
+    return [c / 100.0 if x > 0 else round(x, 2) for c, x in zip(cents, stakes)]
+
+
+def round_stakes_batch(stakes, diag, off, totals=None, min_stake: float = MIN_STAKE):
+    """
+    round_stakes su una matrice (m, n) di scenari.
+    
+    diag, off: (n,) o (m, n); totals: None, scalare o (m,).
+    Il caso misto senza budget (calculate_mixed_dutching_batch) e'
+    vettoriale su tutte le righe; gli altri usano round_stakes per riga.
+    """
+    m = len(stakes)
+    if totals is None or isinstance(totals, (int, float)):
+        totals = [totals] * m
+    if len(diag) and not hasattr(diag[0], '__len__'):
+        diag, off = [diag] * m, [off] * m
+    
+    if HAS_NUMPY:
+        x = np.array(np.atleast_2d(stakes), dtype=float)
+        d = np.broadcast_to(np.asarray(diag, dtype=float), x.shape)
+        o = np.broadcast_to(np.asarray(off, dtype=float), x.shape)
+        if all(t is None for t in totals) and np.all(np.ptp(o, axis=1) > 1e-12):
+            return _mixed_cents_batch(x, d, o, min_stake)
+    
+    rows = [
+        round_stakes(list(s), list(dd), list(oo), t, min_stake)
+        for s, dd, oo, t in zip(stakes, diag, off, totals)
+    ]
+    return np.array(rows) if HAS_NUMPY else rows
+
+
+def _mixed_cents_batch(x, d, o, min_stake: float):
+    """_mixed_cents vettoriale (budget = somma arrotondata per riga)."""
+    m, n = x.shape
+    min_cents = int(round(min_stake * 100))
+    active = x > 0
+    x = np.where(active & (x < min_stake), min_stake, x)
+    
+    cents = np.where(active, np.floor(x * 100 + 1e-6), 0.0)
+    budget = np.maximum(np.round(np.where(active, x * 100, 0.0).sum(axis=1)), cents.sum(axis=1))
+    extra = np.minimum(budget - cents.sum(axis=1), active.sum(axis=1)).astype(int)
+    
+    off_total = np.where(active, o * cents, 0.0).sum(axis=1, keepdims=True) / 100.0
+    profits = (d - o) * cents / 100.0 + off_total
+    rows = np.arange(m)
+    cols = np.arange(n)
+    
+    def ranked(fill, descending=False):
+        """Indici e valori dei tre esiti attivi piu bassi (o piu alti)."""
+        values = np.where(active, profits, fill)
+        order = np.argsort(-values if descending else values, axis=1)[:, :3]
+        top = np.take_along_axis(values, order, axis=1)
+        if top.shape[1] < 3:
+            pad = 3 - top.shape[1]
+            top = np.pad(top, ((0, 0), (0, pad)), constant_values=fill)
+            order = np.pad(order, ((0, 0), (0, pad)), constant_values=-1)
+        return order, top
+    
+    for step in range(int(extra.max()) if m else 0):
+        todo = extra > step
+        order, top = ranked(np.inf)
+        others = np.where(cols == order[:, :1], top[:, 1:2], top[:, :1])
+        val = np.minimum(others + o * ROUND_CENT, profits + d * ROUND_CENT)
+        take = np.argmax(np.where(active, val, -np.inf), axis=1)
+        bump = np.where(cols == take[:, None], d, o[rows, take][:, None]) * ROUND_CENT
+        profits = np.where(todo[:, None] & active, profits + bump, profits)
+        cents[rows[todo], take[todo]] += 1
+    
+    if n < 2:
+        return np.where(active, cents / 100.0, np.round(x, 2))
+    
+    ii = cols[None, :, None]
+    jj = cols[None, None, :]
+    valid = ~np.eye(n, dtype=bool)[None] & active[:, :, None] & active[:, None, :]
+    
+    def rest_of(order, top, fill):
+        # Primo dei tre esiti ordinati diverso da i e j, per ogni coppia (i, j)
+        rest = np.full((m, n, n), fill)
+        for r in (2, 1, 0):
+            idx = order[:, r][:, None, None]
+            rest = np.where((idx != ii) & (idx != jj), top[:, r][:, None, None], rest)
+        return rest
+    
+    for _ in range(2 * n):
+        low_order, low_top = ranked(np.inf)
+        high_order, high_top = ranked(-np.inf, descending=True)
+        current = high_top[:, 0] - low_top[:, 0]
+        delta = (o[:, None, :] - o[:, :, None]) * ROUND_CENT
+        p_i = profits[:, :, None] + (o[:, None, :] - d[:, :, None]) * ROUND_CENT
+        p_j = profits[:, None, :] + (d[:, None, :] - o[:, :, None]) * ROUND_CENT
+        low = np.minimum(np.minimum(p_i, p_j), rest_of(low_order, low_top, np.inf) + delta)
+        high = np.maximum(np.maximum(p_i, p_j), rest_of(high_order, high_top, -np.inf) + delta)
+        ok = valid & (cents - 1 >= max(min_cents, 1))[:, :, None]
+        score = np.where(ok, high - low - low * 1e-9, np.inf).reshape(m, n * n)
+        flat = np.argmin(score, axis=1)
+        spread = (high - low).reshape(m, n * n)[rows, flat]
+        improve = ok.reshape(m, n * n)[rows, flat] & (spread < current - 1e-9)
+        if not improve.any():
+            break
+        r = rows[improve]
+        give, take = np.divmod(flat[improve], n)
+        k = np.arange(len(r))
+        new = profits[r] + delta[r, give, take][:, None]
+        new[k, give] = p_i[r, give, take]
+        new[k, take] = p_j[r, give, take]
+        profits[r] = np.where(active[r], new, profits[r])
+        cents[r, give] -= 1
+        cents[r, take] += 1
+    
+    return np.where(active, cents / 100.0, np.round(x, 2))
+
+
 def calculate_dutching_stakes(
     selections: List[Dict],
     total_stake: float,
@@ -104,9 +500,15 @@ def _calculate_back_dutching(
     results = []
     net_profits = []
     
+    # Stake al centesimo con stake totale esatto (round_stakes)
+    stakes = round_stakes(
+        [total_stake * w / weight_sum for w in inv_weights],
+        *back_rounding_coefficients([sel['price'] for sel in selections]),
+        total=total_stake
+    )
+    
     for i, sel in enumerate(selections):
-        stake = total_stake * inv_weights[i] / weight_sum
-        stake = round(stake, 2)
+        stake = stakes[i]
         
         # Profitto NETTO = ritorno se vince - stake totale investito
         gross_return = stake * sel['price']
@@ -131,21 +533,6 @@ def _calculate_back_dutching(
         })
         net_profits.append(net_profit)
     
-    # Correggi arrotondamento per mantenere stake totale esatto
-    actual_total = sum(r['stake'] for r in results)
-    diff = round(total_stake - actual_total, 2)
-    if diff != 0 and results:
-        max_idx = max(range(len(results)), key=lambda i: results[i]['stake'])
-        results[max_idx]['stake'] = round(results[max_idx]['stake'] + diff, 2)
-        # Ricalcola profitto per lo stake aggiustato
-        adjusted_return = results[max_idx]['stake'] * results[max_idx]['price']
-        adjusted_gross = adjusted_return - total_stake
-        adjusted_net = adjusted_gross * commission_mult if adjusted_gross > 0 else adjusted_gross
-        results[max_idx]['grossProfit'] = round(adjusted_gross, 2)
-        results[max_idx]['profitIfWins'] = round(adjusted_net, 2)
-        results[max_idx]['potentialReturn'] = round(adjusted_return, 2)
-        net_profits[max_idx] = adjusted_net
-    
     uniform_profit = round(min(net_profits), 2)
     
     # Log risultati dettagliati
@@ -204,11 +591,15 @@ def calculate_back_target_profit(
     
     results = []
     
+    # Stake proporzionali al peso, al centesimo
+    stakes = round_stakes(
+        [total_stake * w / sum_weights for w in weights],
+        *back_rounding_coefficients([sel['price'] for sel in valid_selections])
+    )
+    
     for i, sel in enumerate(valid_selections):
         price = sel['price']
-        # Stake proporzionale al peso
-        stake = total_stake * weights[i] / sum_weights
-        stake = round(stake, 2)
+        stake = stakes[i]
         
         # Profitto lordo = ritorno - stake totale
         gross_return = stake * price
@@ -225,13 +616,7 @@ def calculate_back_target_profit(
             'impliedProbability': round((1.0 / price) * 100, 2)
         })
     
-    # Correggi arrotondamento per mantenere stake totale esatto
-    actual_total = sum(r['stake'] for r in results)
-    diff = round(total_stake - actual_total, 2)
-    if diff != 0 and results:
-        max_idx = max(range(len(results)), key=lambda i: results[i]['stake'])
-        results[max_idx]['stake'] = round(results[max_idx]['stake'] + diff, 2)
-        actual_total = sum(r['stake'] for r in results)
+    actual_total = sum(stakes)
     
     # Ricalcola profitto netto effettivo per ogni selezione
     net_profits = []
@@ -276,11 +661,16 @@ def _calculate_lay_dutching(
     
     results = []
     
+    stakes = round_lay_stakes(
+        [total_liability * w / weight_sum / (sel['price'] - 1) if w > 0 else 0
+         for w, sel in zip(weights, selections)],
+        [sel['price'] for sel in selections],
+        total_liability
+    )
+    
     for i, sel in enumerate(selections):
-        liability = total_liability * weights[i] / weight_sum
-        stake = liability / (sel['price'] - 1) if sel['price'] > 1 else 0
-        stake = round(stake, 2)
-        liability = round(liability, 2)
+        stake = stakes[i]
+        liability = round(stake * (sel['price'] - 1), 2)
         
         results.append({
             'selectionId': sel['selectionId'],
@@ -295,6 +685,14 @@ def _calculate_lay_dutching(
             'impliedProbability': round((1.0 / sel['price']) * 100, 2)
         })
     
+    # La liability distribuita deve essere quella richiesta (a meno dell'arrotondamento)
+    total_liab = sum(r['liability'] for r in results)
+    tolerance = max(sel['price'] - 1 for sel in selections) * ROUND_CENT + ROUND_CENT
+    if abs(total_liab - total_liability) > tolerance:
+        raise ValueError(
+            f"Liability distribuita {total_liab:.2f} diversa da {total_liability:.2f}"
+        )
+    
     # Calcola profitto per ogni scenario
     total_stakes = sum(r['stake'] for r in results)
     
@@ -323,6 +721,348 @@ def _calculate_lay_dutching(
     return results, round(best_case, 2), round(implied_prob, 2)
 
 
+class DutchingBook:
+    """
+    Dutching incrementale per il pannello live.
+    
+    Mantiene le somme dei pesi (sum 1/price per BACK, sum 1/(price-1)
+    per LAY) e aggiorna gli aggregati in O(1) ad ogni cambio di quota.
+    Ogni riga si ricava in O(1) dagli aggregati; update_price restituisce
+    solo le righe i cui valori mostrati (stake, profitto) sono cambiati.
+    
+    Stessi numeri di calculate_dutching_stakes, senza log per tick.
+    """
+    
+    def __init__(self, side: str = 'BACK', total: float = 10.0, commission: float = 4.5):
+        if side not in ('BACK', 'LAY'):
+            raise ValueError("side deve essere BACK o LAY")
+        self.side = side
+        self.total = total
+        self.commission_mult = 1 - (commission / 100.0)
+        self.version = 0
+        self._order: List = []
+        self._names: Dict = {}
+        self._prices: Dict = {}
+        self._weights: Dict = {}
+        self._w_sum = 0.0          # sum dei pesi
+        self._s_sum = 0.0          # LAY: sum(w / (price-1)) -> stake totale / total
+        self._inv_sum = 0.0        # sum(1/price): probabilita implicita
+        self._rows: Dict = {}
+        self.profit = 0.0
+        self.implied_prob = 0.0
+    
+    @classmethod
+    def from_selections(cls, selections: List[Dict], side: str = 'BACK',
+                        total: float = 10.0, commission: float = 4.5) -> 'DutchingBook':
+        """Crea il book dalle selezioni (stesse chiavi di calculate_dutching_stakes)."""
+        book = cls(side, total, commission)
+        for sel in selections:
+            book._add(sel['selectionId'], sel.get('runnerName', ''), sel.get('price') or 0)
+        book._recompute()
+        return book
+    
+    # ==============================
+    # AGGREGATI
+    # ==============================
+    
+    def _weight(self, price: float) -> float:
+        if self.side == 'BACK':
+            return 1.0 / price if price > 1.0 else 0.0
+        return 1.0 / (price - 1) if price > 1.0 else 0.0
+    
+    def _add(self, selection_id, name: str, price: float):
+        self._order.append(selection_id)
+        self._names[selection_id] = name
+        self._prices[selection_id] = 0.0
+        self._weights[selection_id] = 0.0
+        self._set_price(selection_id, price)
+    
+    def _set_price(self, selection_id, price: float):
+        """Sostituisce il contributo della selezione negli aggregati (O(1))."""
+        old_price = self._prices[selection_id]
+        old_w = self._weights[selection_id]
+        self._w_sum -= old_w
+        self._inv_sum -= 1.0 / old_price if old_price > 1.0 else 0.0
+        if self.side == 'LAY' and old_price > 1.0:
+            self._s_sum -= old_w / (old_price - 1)
+        
+        w = self._weight(price)
+        self._prices[selection_id] = price
+        self._weights[selection_id] = w
+        self._w_sum += w
+        self._inv_sum += 1.0 / price if price > 1.0 else 0.0
+        if self.side == 'LAY' and price > 1.0:
+            self._s_sum += w / (price - 1)
+    
+    # ==============================
+    # API
+    # ==============================
+    
+    def update_price(self, selection_id, price: float) -> List[Dict]:
+        """
+        Nuova quota per una selezione.
+        
+        Returns:
+            Righe (formato calculate_dutching_stakes) con valori cambiati
+        """
+        if selection_id not in self._prices or not price or price == self._prices[selection_id]:
+            return []
+        self._set_price(selection_id, price)
+        return self._recompute()
+    
+    def set_total(self, total: float) -> List[Dict]:
+        """Nuovo stake totale (BACK) o liability totale (LAY)."""
+        if total == self.total:
+            return []
+        self.total = total
+        return self._recompute()
+    
+    def results(self) -> List[Dict]:
+        """Righe correnti nell'ordine di inserimento."""
+        return [self._rows[sid] for sid in self._order if sid in self._rows]
+    
+    def is_valid(self) -> bool:
+        return self._w_sum > 0 and self.total > 0
+    
+    # ==============================
+    # RIGHE
+    # ==============================
+    
+    def _recompute(self) -> List[Dict]:
+        if not self.is_valid():
+            self._rows = {}
+            return []
+        rows = self._back_rows() if self.side == 'BACK' else self._lay_rows()
+        changed = []
+        for sid, row in rows.items():
+            old = self._rows.get(sid)
+            if old is None or old != row:
+                changed.append(row)
+        self._rows = rows
+        self.implied_prob = round(self._inv_sum * 100, 2)
+        if changed:
+            self.version += 1
+        return changed
+    
+    def _back_rows(self) -> Dict:
+        total, cm = self.total, self.commission_mult
+        scale = total / self._w_sum
+        sids = [sid for sid in self._order if self._weights[sid] > 0]
+        stakes = dict(zip(sids, round_stakes(
+            [scale * self._weights[sid] for sid in sids],
+            *back_rounding_coefficients([self._prices[sid] for sid in sids]),
+            total=total
+        )))
+        
+        rows = {}
+        net_min = None
+        for sid, stake in stakes.items():
+            price = self._prices[sid]
+            gross_return = stake * price
+            gross = gross_return - total
+            net = gross * cm if gross > 0 else gross
+            net_min = net if net_min is None else min(net_min, net)
+            rows[sid] = {
+                'selectionId': sid,
+                'runnerName': self._names[sid],
+                'price': price,
+                'stake': stake,
+                'side': 'BACK',
+                'grossProfit': round(gross, 2),
+                'profitIfWins': round(net, 2),
+                'potentialReturn': round(gross_return, 2),
+                'impliedProbability': round((1.0 / price) * 100, 2)
+            }
+        self.profit = round(net_min or 0.0, 2)
+        return rows
+    
+    def _lay_rows(self) -> Dict:
+        total, cm = self.total, self.commission_mult
+        scale = total / self._w_sum
+        sids = [sid for sid in self._order if self._weights[sid] > 0]
+        stakes = round_lay_stakes(
+            [scale * self._weights[sid] / (self._prices[sid] - 1) for sid in sids],
+            [self._prices[sid] for sid in sids],
+            total
+        )
+        rows = {}
+        total_stakes = 0.0
+        for sid, stake in zip(sids, stakes):
+            price = self._prices[sid]
+            liability = round(stake * (price - 1), 2)
+            total_stakes += stake
+            rows[sid] = {
+                'selectionId': sid,
+                'runnerName': self._names[sid],
+                'price': price,
+                'stake': stake,
+                'side': 'LAY',
+                'liability': liability,
+                'profitIfLoses': round(stake * cm, 2),
+                'lossIfWins': liability,
+                'potentialReturn': stake,
+                'impliedProbability': round((1.0 / price) * 100, 2)
+            }
+        
+        # Profitto garantito: caso peggiore sugli esiti
+        theoretical = min(total_stakes - r['stake'] - r['liability'] for r in rows.values())
+        net = theoretical * cm if theoretical > 0 else theoretical
+        best_case = total_stakes * cm
+        for row in rows.values():
+            row['profitIfWins'] = round(net, 2)
+            row['grossProfit'] = round(theoretical, 2)
+            row['bestCase'] = round(best_case, 2)
+            row['worstCase'] = round(net, 2)
+        self.profit = round(best_case, 2)
+        return rows
+
+
+# Soglia sotto cui un coefficiente del sistema misto e' considerato nullo
+MIXED_EPS = 1e-9
+
+# Esiti del solver misto
+MIXED_OK = 'OK'
+MIXED_DEGENERATE = 'DEGENERATE'          # e_j ~ 0 o 1+K ~ 0: serve la via matriciale
+MIXED_NEGATIVE_STAKE = 'NEGATIVE_STAKE'  # soluzione esatta con stake negativi
+
+
+def solve_mixed_stakes(
+    diag: List[float],
+    off: List[float],
+    target: float
+) -> Tuple[Optional[List[float]], str]:
+    """
+    Solver O(n) del sistema misto BACK+LAY.
+    
+    Il profitto sull'esito k e' A[k][j] = d_j se j == k, altrimenti o_j:
+        A = 1·oᵀ + diag(e),  e = d - o
+    (diagonale + rango uno). Con Sherman-Morrison:
+        K = sum(o_j / e_j)
+        x_j = target / ((1 + K) * e_j)
+    
+    Returns:
+        (stakes, MIXED_OK) oppure (stakes, MIXED_NEGATIVE_STAKE) se la
+        soluzione esatta ha stake negativi, (None, MIXED_DEGENERATE) se il
+        sistema e' degenere (usare _solve_mixed_matrix).
+    """
+    e = [d - o for d, o in zip(diag, off)]
+    if not e or any(abs(ej) < MIXED_EPS for ej in e):
+        return None, MIXED_DEGENERATE
+    
+    denom = 1.0 + sum(o / ej for o, ej in zip(off, e))
+    if abs(denom) < MIXED_EPS:
+        return None, MIXED_DEGENERATE
+    
+    stakes = [target / (denom * ej) for ej in e]
+    if any(x < 0 for x in stakes):
+        return stakes, MIXED_NEGATIVE_STAKE
+    return stakes, MIXED_OK
+
+
+def solve_mixed_stakes_batch(diag, off, targets):
+    """
+    solve_mixed_stakes vettoriale su m scenari di n selezioni.
+    
+    Args:
+        diag, off: matrici (m, n) dei coefficienti
+        targets: vettore (m,) dei profitti target
+    
+    Returns:
+        (stakes (m, n), status lista di m esiti). Gli scenari degeneri
+        passano dalla via matriciale (least squares).
+    """
+    if not HAS_NUMPY:
+        stakes, status = [], []
+        for d_row, o_row, t in zip(diag, off, targets):
+            x, st = solve_mixed_stakes(d_row, o_row, t)
+            if x is None:
+                x = _solve_mixed_matrix(d_row, o_row, t)
+            stakes.append(x)
+            status.append(st)
+        return stakes, status
+    
+    d = np.atleast_2d(np.asarray(diag, dtype=float))
+    o = np.atleast_2d(np.asarray(off, dtype=float))
+    t = np.asarray(targets, dtype=float).reshape(-1)
+    e = d - o
+    
+    bad_e = np.any(np.abs(e) < MIXED_EPS, axis=1)
+    safe_e = np.where(np.abs(e) < MIXED_EPS, 1.0, e)
+    denom = 1.0 + np.sum(o / safe_e, axis=1)
+    degenerate = bad_e | (np.abs(denom) < MIXED_EPS)
+    safe_denom = np.where(degenerate, 1.0, denom)
+    
+    stakes = t[:, None] / (safe_denom[:, None] * safe_e)
+    negative = np.any(stakes < 0, axis=1)
+    
+    status = np.where(degenerate, MIXED_DEGENERATE,
+                      np.where(negative, MIXED_NEGATIVE_STAKE, MIXED_OK)).tolist()
+    for row in np.nonzero(degenerate)[0]:
+        stakes[row] = _solve_mixed_matrix(d[row], o[row], t[row])
+    return stakes, status
+
+
+def _solve_mixed_matrix(diag, off, target) -> List[float]:
+    """Via matriciale densa (solo casi degeneri): least squares su A x = target."""
+    n = len(diag)
+    if not HAS_NUMPY:
+        logger.error("[MIXED DUTCHING] Sistema degenere: serve NumPy per least squares")
+        return [0.0] * n
+    A = np.tile(np.asarray(off, dtype=float), (n, 1))
+    A[np.arange(n), np.arange(n)] = diag
+    stakes, _, _, _ = np.linalg.lstsq(A, np.full(n, float(target)), rcond=None)
+    return stakes.tolist()
+
+
+def mixed_dutching_coefficients(sides, prices, commission_mult: float):
+    """
+    Coefficienti (d, o) del modello di calculate_mixed_dutching.
+    
+    BACK: d = price * (1-comm), o = 0
+    LAY:  d = -(price - 1),     o = (1-comm)
+    
+    prices puo essere una lista (n) o una matrice (m, n) con NumPy.
+    """
+    if HAS_NUMPY and not isinstance(prices, list):
+        p = np.asarray(prices, dtype=float)
+        is_back = np.asarray([s == 'BACK' for s in sides])
+        d = np.where(is_back, p * commission_mult, -(p - 1))
+        o = np.where(is_back, 0.0, commission_mult) * np.ones_like(p)
+        return d, o
+    d = [p * commission_mult if s == 'BACK' else -(p - 1) for s, p in zip(sides, prices)]
+    o = [0.0 if s == 'BACK' else commission_mult for s in sides]
+    return d, o
+
+
+def calculate_mixed_dutching_batch(
+    sides: List[str],
+    prices,
+    targets,
+    commission: float = 4.5
+):
+    """
+    Dutching misto per molti scenari (prezzi, target) in una volta.
+    
+    Args:
+        sides: lato di ogni selezione ('BACK'/'LAY'), comune agli scenari
+        prices: matrice (m, n) delle quote
+        targets: vettore (m,) dei profitti target
+    
+    Returns:
+        (stakes (m, n) arrotondati, status per scenario)
+    """
+    commission_mult = 1 - (commission / 100.0)
+    if HAS_NUMPY:
+        prices = np.atleast_2d(np.asarray(prices, dtype=float))
+        d, o = mixed_dutching_coefficients(sides, prices, commission_mult)
+        stakes, status = solve_mixed_stakes_batch(d, o, targets)
+        return round_stakes_batch(stakes, d, o), status
+    
+    rows = [mixed_dutching_coefficients(sides, list(p), commission_mult) for p in prices]
+    stakes, status = solve_mixed_stakes_batch([r[0] for r in rows], [r[1] for r in rows], targets)
+    return round_stakes_batch(stakes, [r[0] for r in rows], [r[1] for r in rows]), status
+
+
 def calculate_mixed_dutching(
     selections: List[Dict],
     target_profit: float,
@@ -343,8 +1083,6 @@ def calculate_mixed_dutching(
         Per ogni esito k:
         sum(back_wins_k) - sum(lay_losses_k) - sum(back_stakes) + sum(lay_stakes) = TARGET
     """
-    import numpy as np
-    
     if not selections:
         raise ValueError("Nessuna selezione")
     
@@ -369,79 +1107,32 @@ def calculate_mixed_dutching(
     if not back_sels:
         return _calculate_lay_dutching(valid_selections, target_profit, commission)
     
-    n = len(valid_selections)
     commission_mult = 1 - (commission / 100.0)
     
     logger.info(f"[MIXED DUTCHING] {len(back_sels)} BACK + {len(lay_sels)} LAY, target={target_profit}")
     
-    # Costruisci sistema lineare: A * stakes = b
-    # Per ogni esito k, il profitto deve essere = target_profit
-    A = []
-    b = []
+    # Sistema A * stakes = target: diagonale + rango uno, risolto in O(n)
+    sides = [sel.get('effectiveType', 'BACK') for sel in valid_selections]
+    prices = [sel['price'] for sel in valid_selections]
+    diag, off = mixed_dutching_coefficients(sides, prices, commission_mult)
     
-    for k in range(n):
-        row = []
-        for i, sel in enumerate(valid_selections):
-            price = sel['price']
-            is_back = sel.get('effectiveType', 'BACK') == 'BACK'
-            
-            if is_back:
-                # BACK: se vince k=i, guadagno = stake * price * (1-comm)
-                # se perde, perdo stake
-                if i == k:
-                    row.append(price * commission_mult)
-                else:
-                    row.append(0)
-            else:
-                # LAY: se vince k=i (runner vince), perdo liability = stake * (price-1)
-                # se perde, guadagno stake * (1-comm)
-                if i == k:
-                    row.append(-(price - 1))
-                else:
-                    row.append(commission_mult)
-        
-        A.append(row)
-        b.append(target_profit)
+    stakes, status = solve_mixed_stakes(diag, off, target_profit)
+    if status == MIXED_DEGENERATE:
+        logger.warning("[MIXED DUTCHING] Sistema degenere, uso least squares")
+        if not HAS_NUMPY:
+            raise ValueError("Sistema non risolvibile - combinazione non valida")
+        stakes = _solve_mixed_matrix(diag, off, target_profit)
     
-    A = np.array(A, dtype=float)
-    b = np.array(b, dtype=float)
+    # Verifica stakes validi
+    if any(x < 0 for x in stakes):
+        logger.warning(f"[MIXED DUTCHING] Stakes negativi rilevati: {stakes}")
+        raise ValueError("Combinazione non risolvibile - stakes negativi")
     
-    try:
-        # Risolvi sistema sovradeterminato con least squares se necessario
-        if n == len(A):
-            stakes = np.linalg.solve(A, b)
-        else:
-            stakes, _, _, _ = np.linalg.lstsq(A, b, rcond=None)
-        
-        # Verifica stakes validi
-        if np.any(stakes < 0):
-            logger.warning(f"[MIXED DUTCHING] Stakes negativi rilevati: {stakes}")
-            raise ValueError("Combinazione non risolvibile - stakes negativi")
-        
-        stakes = np.round(stakes, 2)
-        
-    except np.linalg.LinAlgError as e:
-        logger.error(f"[MIXED DUTCHING] Errore sistema lineare: {e}")
-        raise ValueError("Sistema non risolvibile - combinazione non valida")
-    
-    # Calcola profitti reali per verifica
-    profits = []
-    for k in range(n):
-        profit_k = 0
-        for i, sel in enumerate(valid_selections):
-            price = sel['price']
-            stake = stakes[i]
-            is_back = sel.get('effectiveType', 'BACK') == 'BACK'
-            
-            if is_back:
-                if i == k:
-                    profit_k += stake * price * commission_mult
-            else:
-                if i == k:
-                    profit_k -= stake * (price - 1)
-                else:
-                    profit_k += stake * commission_mult
-        profits.append(profit_k)
+    stakes = round_stakes(stakes, diag, off)
+    
+    # Calcola profitti reali per verifica: profit_k = e_k*x_k + sum(o_j*x_j)
+    off_total = sum(o * x for o, x in zip(off, stakes))
+    profits = [(d - o) * x + off_total for d, o, x in zip(diag, off, stakes)]
     
     uniform_profit = round(min(profits), 2)
     
@@ -515,6 +1206,274 @@ def adjust_for_slippage(
     return _calculate_back_dutching(remaining_odds, remaining_profit, commission)
 
 
+# ==============================================================================
+# DUTCHING SU PROFONDITA' DEL BOOK
+# ==============================================================================
+#
+# Ogni leg riempie la ladder livello per livello. Per uno stake s il
+# ritorno matchato e' r(s) = sum(fill_k * price_k): lineare a tratti,
+# crescente e concavo. Oltre la profondita' visibile si assume l'ultimo
+# prezzo (la parte eccedente resta non matchata in coda).
+#
+# BACK: profitto uniforme, r_j(s_j) = R uguale per tutti i runner con
+# sum(s_j) = stake totale. Il vincolo e' lineare a tratti in R: si
+# ordinano i breakpoint (fine di ogni livello), si trova l'intervallo per
+# bisezione e si interpola in modo esatto.
+# LAY: stessa ripartizione del LAY dutching classico (liability_j
+# proporzionale a 1/(p_j-1) sul prezzo migliore); ogni leg percorre la
+# propria ladder fino alla sua quota di liability.
+# Con profondita' illimitata entrambi i lati coincidono con
+# calculate_dutching_stakes (verificato a runtime quando ogni leg sta
+# nel primo livello).
+
+class _DepthLeg:
+    """Ladder cumulata di un runner: prezzi, size cumulate, ritorni cumulati."""
+    
+    __slots__ = ('prices', 'cum_size', 'cum_return', 'cum_liability')
+    
+    def __init__(self, levels: List[Tuple[float, float]]):
+        self.prices = []
+        self.cum_size = []
+        self.cum_return = []
+        self.cum_liability = []
+        size_total = 0.0
+        return_total = 0.0
+        liability_total = 0.0
+        for price, size in levels:
+            size_total += size
+            return_total += size * price
+            liability_total += size * (price - 1)
+            self.prices.append(price)
+            self.cum_size.append(size_total)
+            self.cum_return.append(return_total)
+            self.cum_liability.append(liability_total)
+    
+    def stake_for_return(self, target: float) -> float:
+        """Stake che produce il ritorno matchato target (inversa di r(s))."""
+        k = bisect_left(self.cum_return, target)
+        if k >= len(self.prices):
+            k = len(self.prices) - 1
+        prev_size = self.cum_size[k - 1] if k > 0 else 0.0
+        prev_return = self.cum_return[k - 1] if k > 0 else 0.0
+        return prev_size + (target - prev_return) / self.prices[k]
+    
+    def stake_for_liability(self, target: float) -> float:
+        """Stake LAY la cui liability matchata r(s) - s vale target."""
+        k = bisect_left(self.cum_liability, target)
+        if k >= len(self.prices):
+            k = len(self.prices) - 1
+        prev_size = self.cum_size[k - 1] if k > 0 else 0.0
+        prev_liability = self.cum_liability[k - 1] if k > 0 else 0.0
+        return prev_size + (target - prev_liability) / (self.prices[k] - 1)
+    
+    def liability(self, stake: float) -> float:
+        """Liability matchata r(s) - s di uno stake LAY."""
+        k = bisect_left(self.cum_size, stake - 1e-9)
+        if k >= len(self.prices):
+            k = len(self.prices) - 1
+        prev_size = self.cum_size[k - 1] if k > 0 else 0.0
+        prev_liability = self.cum_liability[k - 1] if k > 0 else 0.0
+        return prev_liability + (stake - prev_size) * (self.prices[k] - 1)
+    
+    def fill(self, stake: float) -> Tuple[float, float, float]:
+        """(ritorno matchato, prezzo del livello piu profondo toccato, parte non coperta)."""
+        k = bisect_left(self.cum_size, stake - 1e-9)
+        if k >= len(self.prices):
+            k = len(self.prices) - 1
+        prev_size = self.cum_size[k - 1] if k > 0 else 0.0
+        prev_return = self.cum_return[k - 1] if k > 0 else 0.0
+        matched_return = prev_return + (stake - prev_size) * self.prices[k]
+        return matched_return, self.prices[k], max(0.0, stake - self.cum_size[-1])
+
+
+def _depth_levels(sel: Dict, side: str) -> List[Tuple[float, float]]:
+    """
+    Livelli validi (prezzo, size) dal migliore al peggiore.
+    
+    Accetta 'ladder' oppure 'backPrices'/'layPrices' (formato stream),
+    come liste [prezzo, size] o dict {'price', 'size'}. Senza ladder usa
+    'price' con profondita' illimitata (equivale al dutching classico).
+    """
+    raw = sel.get('ladder') or sel.get('backPrices' if side == 'BACK' else 'layPrices') or []
+    levels = []
+    for lv in raw:
+        if isinstance(lv, dict):
+            price, size = lv.get('price', 0), lv.get('size', 0)
+        else:
+            price, size = lv[0], lv[1] if len(lv) > 1 else 0
+        if price and price > 1.0 and size and size > 0:
+            levels.append((float(price), float(size)))
+    if not levels and (sel.get('price') or 0) > 1.0:
+        levels.append((float(sel['price']), float('inf')))
+    # BACK: prezzi decrescenti (migliore = piu alto); LAY: crescenti
+    levels.sort(key=lambda lv: -lv[0] if side == 'BACK' else lv[0])
+    return levels
+
+
+def _depth_back_stakes(legs: List[_DepthLeg], total: float) -> Tuple[float, List[float]]:
+    """BACK: ritorno comune R con sum(stake) = total, stake al centesimo."""
+    def constraint(target):
+        return sum(leg.stake_for_return(target) for leg in legs)
+    
+    breakpoints = sorted({
+        r for leg in legs for r in leg.cum_return if r != float('inf')
+    })
+    
+    # Ultimo breakpoint con vincolo <= total (bisezione sui breakpoint)
+    lo, hi = 0, len(breakpoints)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if constraint(breakpoints[mid]) <= total:
+            lo = mid + 1
+        else:
+            hi = mid
+    r_low = breakpoints[lo - 1] if lo > 0 else 0.0
+    g_low = constraint(r_low) if lo > 0 else 0.0
+    
+    if lo < len(breakpoints):
+        r_high = breakpoints[lo]
+        g_high = constraint(r_high)
+        target = r_low + (total - g_low) * (r_high - r_low) / (g_high - g_low)
+    else:
+        # Oltre la profondita' visibile: pendenza dell'ultimo livello
+        target = r_low + (total - g_low) / sum(1.0 / leg.prices[-1] for leg in legs)
+    
+    # Ritorno linearizzato al prezzo marginale: r(s) ~ target + p * (s - raw),
+    # cioe' profitto con termine costante (target - p * raw) per esito
+    raw = [leg.stake_for_return(target) for leg in legs]
+    marginal = [leg.fill(x)[1] for leg, x in zip(legs, raw)]
+    stakes = round_stakes(
+        raw, *back_rounding_coefficients(marginal),
+        total=total,
+        offsets=[target - p * x for p, x in zip(marginal, raw)]
+    )
+    return target, stakes
+
+
+def _depth_lay_stakes(legs: List[_DepthLeg], total: float) -> List[float]:
+    """LAY: liability ripartita come _calculate_lay_dutching, ogni leg sulla sua ladder."""
+    weights = [1.0 / (leg.prices[0] - 1) for leg in legs]
+    weight_sum = sum(weights)
+    targets = [total * w / weight_sum for w in weights]
+    raw = [leg.stake_for_liability(t) for leg, t in zip(legs, targets)]
+    # Prezzo medio del leg (liability(raw) = raw * (p - 1)): round_lay_stakes
+    # resta entro la liability totale a meno della convessita' sul centesimo
+    prices = [
+        leg.prices[0] if x <= leg.cum_size[0] else 1 + t / x
+        for leg, t, x in zip(legs, targets, raw)
+    ]
+    return round_lay_stakes(raw, prices, total)
+
+
+def calculate_depth_dutching(
+    selections: List[Dict],
+    total: float,
+    side: str = "BACK",
+    commission: float = 4.5
+) -> Tuple[List[Dict], float, float]:
+    """
+    Dutching che percorre la profondita' del book per ogni runner.
+    
+    Args:
+        selections: Lista di {'selectionId', 'runnerName', 'price',
+                    'ladder' | 'backPrices' | 'layPrices'}
+        total: Stake totale (BACK) o liability totale (LAY)
+        side: 'BACK' o 'LAY'
+        commission: Commissione Betfair
+    
+    Returns:
+        Tuple (results, profit, implied_probability) come
+        calculate_dutching_stakes; ogni riga aggiunge 'averagePrice',
+        'limitPrice' (prezzo da inviare per riempire il leg in un colpo),
+        'slippageTicks' e 'unmatched'.
+    """
+    if side not in ("BACK", "LAY"):
+        raise ValueError("side deve essere BACK o LAY")
+    if total <= 0:
+        raise ValueError("Stake deve essere positivo")
+    
+    commission_mult = 1 - (commission / 100.0)
+    
+    runners = []
+    for sel in selections:
+        levels = _depth_levels(sel, side)
+        if levels:
+            runners.append((sel, _DepthLeg(levels)))
+    if not runners:
+        raise ValueError("Nessuna quota valida")
+    legs = [leg for _, leg in runners]
+    
+    if side == "BACK":
+        _, stakes = _depth_back_stakes(legs, total)
+    else:
+        stakes = _depth_lay_stakes(legs, total)
+    
+    results = []
+    for (sel, leg), stake in zip(runners, stakes):
+        matched_return, limit_price, unmatched = leg.fill(stake)
+        average_price = matched_return / stake if stake > 0 else leg.prices[0]
+        results.append({
+            'selectionId': sel['selectionId'],
+            'runnerName': sel.get('runnerName', ''),
+            'price': leg.prices[0],
+            'stake': stake,
+            'side': side,
+            'averagePrice': round(average_price, 4),
+            'limitPrice': limit_price,
+            'slippageTicks': abs(ticks_difference(leg.prices[0], limit_price)),
+            'unmatched': round(unmatched, 2),
+            'potentialReturn': round(matched_return, 2) if side == "BACK" else stake,
+            'impliedProbability': round((1.0 / average_price) * 100, 2),
+            '_return': matched_return if side == "BACK" else leg.liability(stake),
+        })
+    
+    if side == "BACK":
+        net_profits = []
+        for r in results:
+            gross = r.pop('_return') - total
+            net = gross * commission_mult if gross > 0 else gross
+            r['grossProfit'] = round(gross, 2)
+            r['profitIfWins'] = round(net, 2)
+            net_profits.append(net)
+        profit = round(min(net_profits), 2)
+    else:
+        total_stakes = sum(r['stake'] for r in results)
+        best_case = total_stakes * commission_mult
+        profits_if_win = []
+        for r in results:
+            liability = round(r.pop('_return'), 2)
+            r['liability'] = liability
+            r['lossIfWins'] = liability
+            r['profitIfLoses'] = round(r['stake'] * commission_mult, 2)
+            profits_if_win.append(total_stakes - r['stake'] - liability)
+        total_liab = sum(r['liability'] for r in results)
+        tolerance = max(r['limitPrice'] - 1 for r in results) * ROUND_CENT + ROUND_CENT
+        if abs(total_liab - total) > tolerance:
+            raise ValueError(f"Liability distribuita {total_liab:.2f} diversa da {total:.2f}")
+        theoretical = min(profits_if_win)
+        net = theoretical * commission_mult if theoretical > 0 else theoretical
+        for r in results:
+            r['profitIfWins'] = round(net, 2)
+            r['grossProfit'] = round(theoretical, 2)
+            r['bestCase'] = round(best_case, 2)
+            r['worstCase'] = round(net, 2)
+        profit = round(best_case, 2)
+    
+    # Ogni leg nel primo livello: stessi stake del dutching al prezzo migliore
+    if all(r['limitPrice'] == r['price'] for r in results):
+        book = DutchingBook.from_selections(
+            [{'selectionId': i, 'price': r['price']} for i, r in enumerate(results)],
+            side, total, commission
+        )
+        expected = [row['stake'] for row in book.results()]
+        if expected != [r['stake'] for r in results]:
+            raise ValueError(f"Depth dutching {side} diverso dal dutching al prezzo migliore")
+    
+    implied_prob = sum(1.0 / r['averagePrice'] for r in results) * 100
+    logger.debug(f"[DUTCHING] Depth {side}: profit={profit:.2f}, implied={implied_prob:.1f}%")
+    return results, profit, round(implied_prob, 2)
+
+
 def multi_market_swap(
     markets: List[Dict],
     target_profit: float,
@@ -0,0 +1,82 @@
+"""
+Event Index - Indice eventi con refresh incrementale per Pickfair
+
+Mantiene gli eventi indicizzati per id e fonde ogni refresh calcolando un
+diff (nuovi, rimossi, in-play cambiato, orario/nome/mercati cambiati).
+Lista ordinata ricalcolata solo se il diff non e' vuoto: UI e
+elaborazione scalano con cio' che cambia, non con il numero di eventi.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+# Campi confrontati per rilevare un evento modificato
+TRACKED_FIELDS = ('name', 'countryCode', 'openDate', 'marketCount', 'inPlay')
+
+
+def event_sort_key(event: Dict) -> Tuple[bool, str]:
+    """Ordinamento lista eventi: in-play prima, poi per data."""
+    return (not event.get('inPlay', False), event.get('openDate') or '')
+
+
+@dataclass
+class EventDiff:
+    """Differenze tra due refresh dell'indice."""
+    added: List[Dict] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    updated: List[Dict] = field(default_factory=list)
+    version: int = 0
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.updated)
+
+
+class EventIndex:
+    """Eventi per id + lista ordinata in cache."""
+
+    def __init__(self):
+        self.events: Dict[str, Dict] = {}
+        self.version = 0
+        self._sorted: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def merge(self, fresh: List[Dict]) -> EventDiff:
+        """
+        Fonde la lista completa appena scaricata.
+
+        Returns:
+            EventDiff con eventi aggiunti, id rimossi ed eventi aggiornati
+        """
+        diff = EventDiff()
+        with self._lock:
+            incoming = {event['id']: event for event in fresh}
+
+            for event_id in list(self.events):
+                if event_id not in incoming:
+                    del self.events[event_id]
+                    diff.removed.append(event_id)
+
+            for event_id, event in incoming.items():
+                current = self.events.get(event_id)
+                if current is None:
+                    self.events[event_id] = event
+                    diff.added.append(event)
+                elif any(current.get(f) != event.get(f) for f in TRACKED_FIELDS):
+                    self.events[event_id] = event
+                    diff.updated.append(event)
+
+            if not diff.is_empty:
+                self.version += 1
+                self._sorted = sorted(self.events.values(), key=event_sort_key)
+            diff.version = self.version
+        return diff
+
+    def sorted_events(self) -> List[Dict]:
+        """Lista ordinata (in-play prima, poi data), ricalcolata solo su modifica."""
+        with self._lock:
+            return list(self._sorted)
+
+    def get(self, event_id: str):
+        return self.events.get(event_id)
@@ -12,6 +12,7 @@ import json
 import logging
 import os
 import sys
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 
 APP_NAME = "Pickfair"
@@ -56,7 +57,9 @@ from betfair_client import BetfairClient, MARKET_TYPES
 from storage import get_persistent_storage
 from bet_logger import get_bet_logger
 from betfair_stream import BetfairStream
-from dutching import calculate_dutching_stakes, validate_selections, format_currency
+from paper_exchange import PaperExchange
+from event_index import event_sort_key
+from dutching import calculate_dutching_stakes, calculate_depth_dutching, validate_selections, format_currency, DutchingBook
 from telegram_listener import TelegramListener, SignalQueue
 from auto_updater import check_for_updates, show_update_dialog, DEFAULT_UPDATE_URL
 from theme import COLORS, FONTS, configure_customtkinter, configure_ttk_dark_theme
@@ -184,6 +187,7 @@ class PickfairApp:
         self.client = None
         self.current_event = None
         self.current_market = None
+        self.market_view = None  # MarketView condiviso da UI/dutching/cashout
         self.available_markets = []
         self.selected_runners = {}
         self.streaming_active = False
@@ -198,6 +202,7 @@ class PickfairApp:
         self.telegram_status = 'STOPPED'
         self.market_status = 'OPEN'
         self.simulation_mode = False  # Simulation mode flag
+        self.paper_exchange = None  # Simulated exchange matching on the stream ladder
         self.recovered_positions = []  # Positions recovered from DB
         
         # License check
@@ -600,6 +605,7 @@ class PickfairApp:
         self.events_tree.bind('<<TreeviewSelect>>', self._on_event_selected)
         
         self.all_events = []
+        self._events_version = None  # EventIndex version shown in the events tree
         self.auto_refresh_id = None
     
     def _create_market_panel(self, parent):
@@ -1040,11 +1046,8 @@ class PickfairApp:
         
         def fetch_bets():
             try:
-                orders = self.client.get_current_orders()
-                matched = orders.get('matched', [])
-                
-                # Filter orders for current market
-                market_orders = [o for o in matched if o.get('marketId') == market_id]
+                orders = self.client.get_current_orders(market_ids=[market_id])
+                market_orders = orders.get('matched', [])
                 
                 # Update UI in main thread
                 self.root.after(0, lambda: self._display_placed_bets(market_orders, runner_names))
@@ -1096,7 +1099,8 @@ class PickfairApp:
                     self.market_cashout_fetch_in_progress = False
                     return
                 
-                orders = self.client.get_current_orders()
+                # Live tracking loop: deltas from the order stream between full snapshots
+                orders = self.client.sync_current_orders()
                 matched = orders.get('matched', [])
                 unmatched = orders.get('unmatched', [])
                 
@@ -1486,7 +1490,8 @@ class PickfairApp:
                         settings['username'],
                         settings['app_key'],
                         settings['certificate'],
-                        settings['private_key']
+                        settings['private_key'],
+                        lightweight=True
                     )
                     result = self.client.login(password)
                     
@@ -1581,6 +1586,15 @@ class PickfairApp:
                 on_market_change=self._on_market_stream_update
             )
             
+            # Let the client answer "changed since" order queries from the stream cache
+            if self.client:
+                self.client.attach_order_stream(self.order_stream)
+            
+            # Paper exchange follows the new stream (prices, volumes, definitions)
+            if self.paper_exchange:
+                self.paper_exchange.detach_stream()
+                self.paper_exchange.attach_stream(self.order_stream)
+            
             # Cache reference for thread safety
             stream_ref = self.order_stream
             
@@ -1611,6 +1625,10 @@ class PickfairApp:
         """Handle order update from stream."""
         logging.info(f"Order Stream update: {order_data}")
         
+        # Resolve pending async placements (matched by customerOrderRef)
+        if self.client:
+            self.client.on_order_stream_update(order_data)
+        
         bet_id = order_data.get('bet_id')
         size_matched = order_data.get('size_matched', 0)
         status = order_data.get('status', '')
@@ -1671,32 +1689,15 @@ class PickfairApp:
         if not self.current_market:
             return
         
-        # Only process updates for current market
-        if market_data.get('market_id') != self.current_market.get('marketId'):
+        # Apply update to the shared MarketView (ignores other markets);
+        # the view tracks dirty runners for the throttled UI loop
+        view = self.market_view
+        if not view or not view.apply_stream_update(market_data):
             return
         
-        # Accumulate updates in thread-safe buffer (instead of updating UI directly)
-        selection_id = str(market_data.get('selection_id'))
-        
-        # Initialize buffers if needed
-        if not hasattr(self, '_market_update_buffer'):
-            self._market_update_buffer = {}
-            self._market_update_dirty = False
-        
         if not hasattr(self, '_cashout_dirty'):
             self._cashout_dirty = False
         
-        # Store latest data for each selection (overwrites previous - we only need latest)
-        self._market_update_buffer[selection_id] = {
-            'back_price': market_data.get('back_price'),
-            'back_size': market_data.get('back_size', 0),
-            'lay_price': market_data.get('lay_price'),
-            'lay_size': market_data.get('lay_size', 0),
-            'ltp': market_data.get('ltp'),
-            'tv': market_data.get('tv', 0)
-        }
-        self._market_update_dirty = True
-        
         # Mark cashout dirty if we have positions (for realtime cashout update)
         if hasattr(self, 'market_cashout_positions') and self.market_cashout_positions:
             self._cashout_dirty = True
@@ -1708,19 +1709,17 @@ class PickfairApp:
     
     def _process_stream_buffer(self):
         """Process accumulated stream updates at throttled interval (30ms)."""
-        if not hasattr(self, '_market_update_buffer'):
+        view = self.market_view
+        if not view:
             self._stream_ui_loop_running = False
             return
         
-        # Only update UI if there are changes
-        if self._market_update_dirty and self._market_update_buffer:
-            self._market_update_dirty = False
-            
-            # Take snapshot of current buffer
-            buffer_snapshot = dict(self._market_update_buffer)
-            
+        # Only update UI for runners changed since last tick
+        dirty_runners = view.pop_dirty()
+        if dirty_runners:
             # Update all changed runners in one batch
-            for selection_id, data in buffer_snapshot.items():
+            for runner in dirty_runners:
+                selection_id = str(runner.selection_id)
                 try:
                     if not self.runners_tree.exists(selection_id):
                         continue
@@ -1731,12 +1730,12 @@ class PickfairApp:
                     old_back = current_values[2] if current_values[2] != '-' else None
                     
                     # Format new values
-                    back_price = data['back_price']
-                    lay_price = data['lay_price']
+                    back_price = runner.back_price
+                    lay_price = runner.lay_price
                     new_back = f"{back_price:.2f}" if back_price else "-"
                     new_lay = f"{lay_price:.2f}" if lay_price else "-"
-                    new_back_size = f"{data['back_size']:.0f}" if data['back_size'] else "-"
-                    new_lay_size = f"{data['lay_size']:.0f}" if data['lay_size'] else "-"
+                    new_back_size = f"{runner.back_size:.0f}" if runner.back_size else "-"
+                    new_lay_size = f"{runner.lay_size:.0f}" if runner.lay_size else "-"
                     
                     current_values[2] = new_back
                     current_values[3] = new_back_size
@@ -1792,18 +1791,16 @@ class PickfairApp:
         if not hasattr(self, 'market_cashout_positions') or not self.market_cashout_positions:
             return
         
-        if not hasattr(self, '_market_update_buffer') or not self._market_update_buffer:
+        view = self.market_view
+        if not view:
             return
         
-        buffer = self._market_update_buffer
-        
         for bet_id, pos in self.market_cashout_positions.items():
             try:
-                selection_id = str(pos.get('selection_id'))
-                if selection_id not in buffer:
+                runner = view.get_runner(pos.get('selection_id'))
+                if runner is None:
                     continue
                 
-                price_data = buffer[selection_id]
                 side = pos.get('side')
                 matched_stake = pos.get('stake', 0)
                 matched_price = pos.get('price', 0)
@@ -1814,12 +1811,12 @@ class PickfairApp:
                 # Get current price for cashout direction
                 if side == 'BACK':
                     # BACK position: cashout by LAYing
-                    current_price = price_data.get('lay_price')
-                    available_liquidity = price_data.get('lay_size', 0)
+                    current_price = runner.lay_price
+                    available_liquidity = runner.lay_size
                 else:
                     # LAY position: cashout by BACKing
-                    current_price = price_data.get('back_price')
-                    available_liquidity = price_data.get('back_size', 0)
+                    current_price = runner.back_price
+                    available_liquidity = runner.back_size
                 
                 if not current_price or current_price <= 1:
                     continue
@@ -1971,8 +1968,8 @@ class PickfairApp:
         """Load football events."""
         def fetch():
             try:
-                events = self.client.get_football_events()
-                self.root.after(0, lambda: self._display_events(events))
+                diff = self.client.refresh_football_events()
+                self.root.after(0, lambda: self._apply_events_diff(diff))
             except Exception as e:
                 err_msg = str(e)
                 self.root.after(0, lambda msg=err_msg: messagebox.showerror("Errore", f"Errore caricamento partite: {msg}"))
@@ -1984,6 +1981,66 @@ class PickfairApp:
         self.all_events = events
         self._populate_events_tree()
     
+    def _apply_events_diff(self, diff):
+        """Apply an EventIndex diff to the events tree (only changed rows).
+        
+        Other callers (Telegram auto-bet loops) merge into the same index and
+        consume their diffs: the tree tracks the index version it last
+        rendered and redraws when this diff does not follow it directly.
+        """
+        rendered = self._events_version
+        if diff.version == rendered and self.events_tree.get_children():
+            return
+        
+        self.all_events = self.client.event_index.sorted_events()
+        self._events_version = diff.version
+        
+        # Search view, first load or missed diffs: full redraw
+        if (self.search_var.get() or not self.events_tree.get_children()
+                or rendered is None or diff.is_empty or diff.version != rendered + 1):
+            self._populate_events_tree()
+            return
+        
+        for event_id in diff.removed:
+            if self.events_tree.exists(event_id):
+                parent = self.events_tree.parent(event_id)
+                self.events_tree.delete(event_id)
+                if parent and not self.events_tree.get_children(parent):
+                    self.events_tree.delete(parent)
+        
+        for event in diff.updated + diff.added:
+            self._place_event_row(event)
+    
+    def _place_event_row(self, event):
+        """Insert or move/update one event row under its country, keeping sort order."""
+        country = event.get('countryCode', 'XX') or 'XX'
+        country_id = f"country_{country}"
+        
+        if not self.events_tree.exists(country_id):
+            countries = [c for c in self.events_tree.get_children() if c.startswith('country_')]
+            index = sum(1 for c in countries if c < country_id)
+            self.events_tree.insert('', index, iid=country_id, text=country, open=False)
+        
+        key = event_sort_key(event)
+        index = 0
+        for child in self.events_tree.get_children(country_id):
+            if child == event['id']:
+                continue
+            sibling = self.client.event_index.get(child)
+            if sibling is not None and event_sort_key(sibling) > key:
+                break
+            index += 1
+        
+        values = (event['name'], self._format_event_date(event))
+        if self.events_tree.exists(event['id']):
+            old_parent = self.events_tree.parent(event['id'])
+            self.events_tree.move(event['id'], country_id, index)
+            self.events_tree.item(event['id'], values=values)
+            if old_parent != country_id and not self.events_tree.get_children(old_parent):
+                self.events_tree.delete(old_parent)
+        else:
+            self.events_tree.insert(country_id, index, iid=event['id'], values=values)
+    
     def _populate_events_tree(self):
         """Populate events tree based on current search filter."""
         self.events_tree.delete(*self.events_tree.get_children())
@@ -2184,17 +2241,18 @@ class PickfairApp:
         
         def fetch():
             try:
-                market = self.client.get_market_with_prices(market_id)
-                self.root.after(0, lambda: self._display_market(market))
+                view = self.client.get_market_view(market_id)
+                self.root.after(0, lambda: self._display_market(view.to_dict(), view))
             except Exception as e:
                 err_msg = str(e)
                 self.root.after(0, lambda msg=err_msg: messagebox.showerror("Errore", f"Mercato non disponibile: {msg}"))
         
         threading.Thread(target=fetch, daemon=True).start()
     
-    def _display_market(self, market):
+    def _display_market(self, market, view=None):
         """Display market runners."""
         self.current_market = market
+        self.market_view = view
         self.runners_tree.delete(*self.runners_tree.get_children())
         
         # Update market status
@@ -2233,6 +2291,10 @@ class PickfairApp:
                 lay_size
             ), tags=('runner_row',))
         
+        # Keep the betting connection warm around the in-play start
+        if self.client and self.market_status not in ('SUSPENDED', 'CLOSED'):
+            self.client.watch_market_warmup(market['marketId'], market.get('startTime'))
+        
         # Auto-start streaming for live price updates
         if self.market_status not in ('SUSPENDED', 'CLOSED'):
             self.stream_var.set(True)
@@ -2307,19 +2369,32 @@ class PickfairApp:
         
         def fetch_and_update():
             try:
-                market_id = self.current_market['marketId']
-                book = self.client.get_market_book(market_id)
-                if book and book.get('runners'):
+                view = self.market_view
+                if not view:
+                    return
+                changed = self.client.refresh_market_view(view)
+                
+                # No stream: the paper exchange matches on the polled ladder
+                if self.paper_exchange and changed is not None:
+                    self.paper_exchange.on_market_book({
+                        'marketId': view.market_id,
+                        'status': view.status,
+                        'inplay': view.inplay,
+                        'runners': [
+                            {'selectionId': r.selection_id, 'status': r.status, 'back': r.back, 'lay': r.lay}
+                            for r in view.runners.values()
+                        ]
+                    })
+                
+                if changed:
                     runners_data = []
-                    for runner in book['runners']:
-                        back_prices = [[runner.get('backPrice', 0), runner.get('backSize', 0)]] if runner.get('backPrice') else []
-                        lay_prices = [[runner.get('layPrice', 0), runner.get('laySize', 0)]] if runner.get('layPrice') else []
+                    for runner in view.pop_dirty():
                         runners_data.append({
-                            'selectionId': runner['selectionId'],
-                            'backPrices': back_prices,
-                            'layPrices': lay_prices
+                            'selectionId': runner.selection_id,
+                            'backPrices': runner.back,
+                            'layPrices': runner.lay
                         })
-                    self.root.after(0, lambda: self._on_price_update(market_id, runners_data))
+                    self.root.after(0, lambda: self._on_price_update(view.market_id, runners_data))
             except Exception as e:
                 logging.debug(f"Polling refresh error: {e}")
         
@@ -2356,6 +2431,8 @@ class PickfairApp:
             self._prev_prices = {}
         
         def update_ui():
+            changed = []
+            needs_full = False
             for runner_update in runners_data:
                 selection_id = str(runner_update['selectionId'])
                 
@@ -2423,10 +2500,23 @@ class PickfairApp:
                             self.selected_runners[selection_id]['price'] = back_prices[0][0]
                         elif bet_type == 'LAY' and lay_prices:
                             self.selected_runners[selection_id]['price'] = lay_prices[0][0]
-                        self._recalculate()
+                        # Aggiornamento O(1) del book: solo le righe cambiate
+                        book = getattr(self, 'dutching_book', None)
+                        if book is None or book.side != bet_type:
+                            needs_full = True
+                        else:
+                            sel = self.selected_runners[selection_id]
+                            changed.extend(book.update_price(
+                                sel.get('selectionId', selection_id), sel.get('price', 0)
+                            ))
                         
                 except Exception:
                     pass
+            
+            if needs_full:
+                self._recalculate()
+            elif changed:
+                self._apply_dutching_changes(changed)
         
         self.root.after(0, update_ui)
     
@@ -2457,9 +2547,14 @@ class PickfairApp:
         if not self.current_market:
             return
         
+        view_runner = self.market_view.get_runner(selection_id) if self.market_view else None
+        
         for runner in self.current_market['runners']:
             if str(runner['selectionId']) == selection_id:
-                current_price = runner.get('backPrice') or runner.get('layPrice') or 0
+                if view_runner is not None:
+                    current_price = view_runner.back_price or view_runner.lay_price or 0
+                else:
+                    current_price = runner.get('backPrice') or runner.get('layPrice') or 0
                 if current_price > 0:
                     self._show_booking_dialog(
                         selection_id,
@@ -2503,15 +2598,20 @@ class PickfairApp:
                     if str(runner['selectionId']) == selection_id:
                         runner_data = runner.copy()
                         
-                        # Get current prices from treeview
+                        # Get current prices from the shared market view
                         values = list(self.runners_tree.item(item)['values'])
-                        # values: [selection, runnerName, backPrice, backSize, layPrice, laySize]
-                        try:
-                            back_price = float(str(values[2]).replace(',', '.')) if values[2] and values[2] != '-' else 0
-                            lay_price = float(str(values[4]).replace(',', '.')) if values[4] and values[4] != '-' else 0
-                        except (ValueError, IndexError):
-                            back_price = 0
-                            lay_price = 0
+                        view_runner = self.market_view.get_runner(selection_id) if self.market_view else None
+                        if view_runner is not None:
+                            back_price = view_runner.back_price or 0
+                            lay_price = view_runner.lay_price or 0
+                        else:
+                            # values: [selection, runnerName, backPrice, backSize, layPrice, laySize]
+                            try:
+                                back_price = float(str(values[2]).replace(',', '.')) if values[2] and values[2] != '-' else 0
+                                lay_price = float(str(values[4]).replace(',', '.')) if values[4] and values[4] != '-' else 0
+                            except (ValueError, IndexError):
+                                back_price = 0
+                                lay_price = 0
                         
                         runner_data['backPrice'] = back_price
                         runner_data['layPrice'] = lay_price
@@ -2545,15 +2645,19 @@ class PickfairApp:
         if not runner:
             return
         
-        # Get price from treeview
-        values = list(self.runners_tree.item(selection_id)['values'])
-        try:
-            if bet_type == 'BACK':
-                price = float(str(values[2]).replace(',', '.')) if values[2] and values[2] != '-' else 0
-            else:
-                price = float(str(values[4]).replace(',', '.')) if values[4] and values[4] != '-' else 0
-        except (ValueError, IndexError):
-            price = 0
+        # Get price from the shared market view, treeview as fallback
+        view_runner = self.market_view.get_runner(selection_id) if self.market_view else None
+        if view_runner is not None:
+            price = view_runner.best(bet_type) or 0
+        else:
+            values = list(self.runners_tree.item(selection_id)['values'])
+            try:
+                if bet_type == 'BACK':
+                    price = float(str(values[2]).replace(',', '.')) if values[2] and values[2] != '-' else 0
+                else:
+                    price = float(str(values[4]).replace(',', '.')) if values[4] and values[4] != '-' else 0
+            except (ValueError, IndexError):
+                price = 0
         
         if price <= 0:
             messagebox.showwarning("Attenzione", "Quota non disponibile")
@@ -2918,18 +3022,10 @@ class PickfairApp:
             self._place_quick_real_bet(runner, bet_type, price, stake)
     
     def _place_quick_simulation_bet(self, runner, bet_type, price, stake):
-        """Place a quick simulated bet."""
+        """Place a quick simulated bet on the paper exchange."""
         try:
-            # Calculate P/L
-            commission = 0.045  # 4.5% Betfair Italia commission
-            if bet_type == 'BACK':
-                gross_profit = stake * (price - 1)
-                profit = gross_profit * (1 - commission)  # Net profit after commission
-                liability = stake
-            else:
-                gross_profit = stake
-                profit = gross_profit * (1 - commission)  # Net profit after commission
-                liability = stake * (price - 1)
+            # Liability reserved until settlement
+            liability = stake if bet_type == 'BACK' else stake * (price - 1)
             
             # Check balance
             settings = self.db.get_simulation_settings()
@@ -2942,27 +3038,48 @@ class PickfairApp:
                     f"Richiesto: {format_currency(liability)}")
                 return
             
+            # Match against the live ladder (partial fills rest in queue)
+            market_id = self.current_market['marketId']
+            report = self._get_paper_exchange().place_bet(
+                market_id, runner['selectionId'], bet_type, price, stake
+            )['instructionReports'][0]
+            if report['status'] != 'SUCCESS':
+                messagebox.showerror("Errore Simulazione", f"Scommessa rifiutata: {report['errorCode']}")
+                return
+            
             # Deduct from virtual balance and increment bet count
             new_balance = current_balance - liability
             self.db.increment_simulation_bet_count(new_balance)
             
-            # Save bet
+            size_matched = report['sizeMatched']
             self.db.save_simulation_bet(
                 event_name=self.current_market.get('eventName', 'Quick Bet'),
-                market_id=self.current_market['marketId'],
+                market_id=market_id,
                 market_name=self.current_market.get('marketName', ''),
                 side=bet_type,
-                selection_id=str(runner['selectionId']),
-                selection_name=runner['runnerName'],
-                price=price,
-                stake=stake,
-                status='MATCHED'
+                selections=[{
+                    'name': runner['runnerName'],
+                    'selectionId': runner['selectionId'],
+                    'price': price,
+                    'stake': stake,
+                    'reserved': liability,
+                    'betId': report['betId'],
+                    'sizeMatched': size_matched,
+                    'averagePriceMatched': report['averagePriceMatched']
+                }],
+                total_stake=stake,
+                potential_profit=stake * (price - 1) if bet_type == 'BACK' else stake,
+                status=self._paper_fill_status(size_matched, stake)
             )
+            self._update_simulation_balance_display()
             
+            matched_info = (f"Abbinato: {format_currency(size_matched)} @ {report['averagePriceMatched']:.2f}"
+                            if size_matched > 0 else "Non abbinato: in coda")
             messagebox.showinfo("Simulazione", 
                 f"Scommessa simulata piazzata!\n\n"
                 f"{runner['runnerName']} @ {price:.2f}\n"
                 f"Stake: {format_currency(stake)}\n"
+                f"{matched_info}\n"
                 f"Nuovo Saldo: {format_currency(new_balance)}")
             
         except Exception as e:
@@ -2995,16 +3112,21 @@ class PickfairApp:
                 else:
                     match_price = price
                 
-                result = self.client.place_bet(
+                # Through the market order queue: merged with other orders on this market
+                report = self.client.submit_order(
                     market_id=self.current_market['marketId'],
                     selection_id=runner['selectionId'],
                     side=bet_type,
                     price=match_price,
-                    size=stake,
-                    persistence_type='LAPSE'
-                )
+                    size=stake
+                ).result(timeout=30)
                 
-                bet_result = result
+                bet_result = {
+                    'status': report.get('status'),
+                    'errorCode': report.get('errorCode'),
+                    'customerRef': report.get('customerRef'),
+                    'instructionReports': [report]
+                }
                 self.root.after(0, lambda r=bet_result, rn=runner, bt=bet_type, p=price, s=stake: self._on_quick_bet_result(r, rn, bt, p, s))
             except Exception as e:
                 err_msg = str(e)
@@ -3116,7 +3238,9 @@ class PickfairApp:
         self.calculated_results = None
     
     def _recalculate(self):
-        """Recalculate dutching stakes."""
+        """Recalculate dutching stakes (full rebuild of the dutching book)."""
+        self.dutching_book = None
+        self._dutching_rendered = []
         if not self.selected_runners:
             self.selections_text.configure(state=tk.NORMAL)
             self.selections_text.delete('1.0', tk.END)
@@ -3126,9 +3250,6 @@ class PickfairApp:
             self.place_btn.configure(state=tk.DISABLED)
             return
         
-        self.selections_text.configure(state=tk.NORMAL)
-        self.selections_text.delete('1.0', tk.END)
-        
         try:
             total_stake = float(self.stake_var.get().replace(',', '.'))
         except ValueError:
@@ -3146,48 +3267,142 @@ class PickfairApp:
         selections = list(self.selected_runners.values())
         
         try:
-            results, profit, implied_prob = calculate_dutching_stakes(
-                selections, total_stake, bet_type
-            )
-            
-            text_lines = []
-            for r in results:
-                text_lines.append(f"{r['runnerName']}")
-                text_lines.append(f"  Quota: {r['price']:.2f}")
-                text_lines.append(f"  Stake: {format_currency(r['stake'])}")
-                if bet_type == 'LAY':
-                    text_lines.append(f"  Liability: {format_currency(r.get('liability', 0))}")
-                    text_lines.append(f"  Se vince: {format_currency(r['profitIfWins'])}")
-                else:
-                    text_lines.append(f"  Profitto se vince: {format_currency(r['profitIfWins'])}")
-                text_lines.append("")
-            
-            self.selections_text.insert('1.0', '\n'.join(text_lines))
-            
-            if bet_type == 'LAY' and results:
-                # Show both best and worst case for LAY
-                best = results[0].get('bestCase', profit)
-                worst = results[0].get('worstCase', 0)
-                self.profit_label.configure(text=f"Profitto Max: {format_currency(best)} | Rischio: {format_currency(worst)}")
-            else:
-                self.profit_label.configure(text=f"Profitto Atteso: {format_currency(profit)}")
-            self.prob_label.configure(text=f"Probabilita Implicita: {implied_prob:.1f}%")
-            
-            errors = validate_selections(results, bet_type)
-            if not errors:
-                self.place_btn.configure(state=tk.NORMAL)
-            else:
-                self.place_btn.configure(state=tk.DISABLED)
-                self.selections_text.insert(tk.END, "\nErrori:\n" + "\n".join(errors))
-            
-            self.calculated_results = results
-            
+            self.dutching_book = DutchingBook.from_selections(selections, bet_type, total_stake)
+            if not self.dutching_book.is_valid():
+                raise ValueError("Quote non valide per il dutching")
+            self._render_dutching()
         except Exception as e:
+            self.dutching_book = None
+            self.selections_text.configure(state=tk.NORMAL)
+            self.selections_text.delete('1.0', tk.END)
             self.selections_text.insert('1.0', f"Errore calcolo: {e}")
+            self.selections_text.configure(state=tk.DISABLED)
             self.profit_label.configure(text="Profitto: -")
             self.place_btn.configure(state=tk.DISABLED)
+            self.calculated_results = None
+    
+    def _dutching_block(self, r, bet_type):
+        """Text lines for one runner in the dutching panel (fixed line count per side)."""
+        lines = [
+            f"{r['runnerName']}",
+            f"  Quota: {r['price']:.2f}",
+            f"  Stake: {format_currency(r['stake'])}",
+        ]
+        if bet_type == 'LAY':
+            lines.append(f"  Liability: {format_currency(r.get('liability', 0))}")
+            lines.append(f"  Se vince: {format_currency(r['profitIfWins'])}")
+        else:
+            lines.append(f"  Profitto se vince: {format_currency(r['profitIfWins'])}")
+        lines.append("")
+        return lines
+    
+    def _render_dutching(self):
+        """Full redraw of the dutching panel from the current book."""
+        book = self.dutching_book
+        results = book.results()
+        
+        text_lines = []
+        for r in results:
+            text_lines.extend(self._dutching_block(r, book.side))
+        
+        self.selections_text.configure(state=tk.NORMAL)
+        self.selections_text.delete('1.0', tk.END)
+        self.selections_text.insert('1.0', '\n'.join(text_lines))
+        self.selections_text.configure(state=tk.DISABLED)
+        self._dutching_rendered = [r['selectionId'] for r in results]
+        self._update_dutching_summary(results)
+    
+    def _apply_dutching_changes(self, changed):
+        """Redraw only the runner blocks whose values changed on a price tick."""
+        book = self.dutching_book
+        results = book.results()
+        order = [r['selectionId'] for r in results]
+        if order != self._dutching_rendered:
+            # Runner aggiunti/rimossi dal book: layout diverso, ridisegno completo
+            self._render_dutching()
+            return
+        
+        block_len = 6 if book.side == 'LAY' else 5
+        position = {sid: i for i, sid in enumerate(order)}
+        
+        self.selections_text.configure(state=tk.NORMAL)
+        for r in changed:
+            i = position.get(r['selectionId'])
+            if i is None:
+                continue
+            first = i * block_len + 1
+            last = first + block_len - 2
+            self.selections_text.delete(f"{first}.0", f"{last}.end")
+            self.selections_text.insert(
+                f"{first}.0", '\n'.join(self._dutching_block(r, book.side)[:-1])
+            )
+        self.selections_text.configure(state=tk.DISABLED)
+        self._update_dutching_summary(results)
+    
+    def _update_dutching_summary(self, results):
+        """Profit/probability labels, validation errors and calculated_results."""
+        book = self.dutching_book
+        
+        if book.side == 'LAY' and results:
+            # Show both best and worst case for LAY
+            best = results[0].get('bestCase', book.profit)
+            worst = results[0].get('worstCase', 0)
+            self.profit_label.configure(text=f"Profitto Max: {format_currency(best)} | Rischio: {format_currency(worst)}")
+        else:
+            self.profit_label.configure(text=f"Profitto Atteso: {format_currency(book.profit)}")
+        self.prob_label.configure(text=f"Probabilita Implicita: {book.implied_prob:.1f}%")
+        
+        # Sezione errori in coda ai blocchi runner
+        block_len = 6 if book.side == 'LAY' else 5
+        errors_start = len(results) * block_len
+        self.selections_text.configure(state=tk.NORMAL)
+        self.selections_text.delete(f"{errors_start}.0 lineend", tk.END)
         
+        errors = validate_selections(results)
+        if not errors:
+            self.place_btn.configure(state=tk.NORMAL)
+        else:
+            self.place_btn.configure(state=tk.DISABLED)
+            self.selections_text.insert(tk.END, "\nErrori:\n" + "\n".join(errors))
         self.selections_text.configure(state=tk.DISABLED)
+        
+        self.calculated_results = results
+    
+    def _depth_dutching_results(self, results, bet_type):
+        """
+        Re-split the dutching over the MarketView ladder when a leg is larger
+        than the size at its best price. Each leg is then sent at the limit
+        price that fills it in one order. Without depth for every leg the
+        top-of-book results are returned unchanged.
+        """
+        view = self.market_view
+        if not view or not self.dutching_book or view.market_id != self.current_market['marketId']:
+            return results
+        
+        selections = []
+        for r in results:
+            ladder = view.ladder(r['selectionId'], bet_type)
+            if not ladder:
+                return results
+            selections.append({
+                'selectionId': r['selectionId'],
+                'runnerName': r.get('runnerName', ''),
+                'price': r['price'],
+                'ladder': ladder
+            })
+        if all(r['stake'] <= sel['ladder'][0][1] for r, sel in zip(results, selections)):
+            return results
+        
+        try:
+            depth_results, _, _ = calculate_depth_dutching(selections, self.dutching_book.total, bet_type)
+        except ValueError as e:
+            logging.warning(f"[DUTCHING] Depth dutching not available: {e}")
+            return results
+        for r in depth_results:
+            logging.info(f"[DUTCHING] Depth: {r['runnerName']} stake={r['stake']:.2f} "
+                         f"avg={r['averagePrice']:.2f} limit={r['limitPrice']:.2f}")
+            r['price'] = r['limitPrice']
+        return depth_results
     
     def _place_bets(self):
         """Place the calculated bets (real or simulated)."""
@@ -3221,6 +3436,9 @@ class PickfairApp:
                 "Il mercato e' chiuso. Non e' possibile piazzare scommesse.")
             return
         
+        # Legs larger than their best level: stakes and limit prices from the ladder depth
+        self.calculated_results = self._depth_dutching_results(self.calculated_results, self.bet_type_var.get())
+        
         total_stake = sum(r['stake'] for r in self.calculated_results)
         potential_profit = self.calculated_results[0].get('profitIfWins', 0)
         bet_type = self.bet_type_var.get()
@@ -3268,26 +3486,18 @@ class PickfairApp:
                 instructions = []
                 
                 if use_best_price:
-                    # Fetch fresh prices before placing
-                    book = self.client.get_market_book(market_id)
+                    # Fetch fresh prices before placing (one book call into the view)
                     current_prices = {}
-                    if book and book.get('runners'):
-                        for runner in book['runners']:
-                            sel_id = runner.get('selectionId')
-                            ex = runner.get('ex', {})
-                            if bet_type == 'BACK':
-                                backs = ex.get('availableToBack', [])
-                                if backs:
-                                    current_prices[sel_id] = backs[0].get('price', 1.01)
-                            else:  # LAY
-                                lays = ex.get('availableToLay', [])
-                                if lays:
-                                    current_prices[sel_id] = lays[0].get('price', 1000)
+                    view = self.market_view
+                    if view and view.market_id == market_id:
+                        self.client.refresh_market_view(view)
+                        current_prices = view.best_prices(bet_type)
                     
                     for r in self.calculated_results:
                         sel_id = r['selectionId']
-                        # Use current best price if available, otherwise use calculated price
-                        price = current_prices.get(sel_id, r['price'])
+                        # Use current best price if available, otherwise use calculated price;
+                        # depth legs keep their limit price (it sweeps the visible levels)
+                        price = r['price'] if 'limitPrice' in r else current_prices.get(sel_id, r['price'])
                         instructions.append({
                             'selectionId': sel_id,
                             'side': bet_type,
@@ -3376,6 +3586,18 @@ class PickfairApp:
             sim_settings = self.db.get_simulation_settings()
             virtual_balance = sim_settings.get('virtual_balance', 0)
             
+            # Match each selection against the live ladder
+            market_id = self.current_market['marketId']
+            result = self._get_paper_exchange().place_bets(market_id, [
+                {'selectionId': r['selectionId'], 'side': bet_type,
+                 'price': r['price'], 'size': r['stake']}
+                for r in self.calculated_results
+            ])
+            if result['status'] != 'SUCCESS':
+                self.place_btn.configure(state=tk.NORMAL)
+                messagebox.showerror("Errore Simulazione", f"Scommessa rifiutata: {result['errorCode']}")
+                return
+            
             # Deduct stake from virtual balance and increment bet count
             new_balance = virtual_balance - total_stake
             self.db.increment_simulation_bet_count(new_balance)
@@ -3383,19 +3605,28 @@ class PickfairApp:
             # Save simulation bet
             selections_info = [
                 {'name': r.get('runnerName', 'Unknown'), 
+                 'selectionId': r['selectionId'],
                  'price': r['price'], 
-                 'stake': r['stake']}
-                for r in self.calculated_results
+                 'stake': r['stake'],
+                 'reserved': r['stake'],
+                 'betId': report['betId'],
+                 'sizeMatched': report['sizeMatched'],
+                 'averagePriceMatched': report['averagePriceMatched']}
+                for r, report in zip(self.calculated_results, result['instructionReports'])
             ]
             
             self.db.save_simulation_bet(
                 event_name=self.current_event['name'],
-                market_id=self.current_market['marketId'],
+                market_id=market_id,
                 market_name=self.current_market['marketName'],
                 side=bet_type,
                 selections=selections_info,
                 total_stake=total_stake,
-                potential_profit=potential_profit
+                potential_profit=potential_profit,
+                status=self._paper_fill_status(
+                    sum(sel['sizeMatched'] for sel in selections_info),
+                    sum(sel['stake'] for sel in selections_info)
+                )
             )
             
             # Update display
@@ -4132,14 +4363,61 @@ class PickfairApp:
                         text_color=COLORS['text_tertiary']).pack(pady=(2, 10))
         
         create_metric_card(metrics_frame, "API Calls/min", metrics.get('api_calls_per_min', 0), "Ultimo minuto", 0)
-        create_metric_card(metrics_frame, "Latenza Media", f"{metrics.get('avg_latency_ms', 0)}ms", "Ultimi 100 call", 1)
+        create_metric_card(metrics_frame, "Latenza Media", f"{metrics.get('avg_latency_ms', 0)}ms", "Ultime 512 call", 1)
         create_metric_card(metrics_frame, "Replace Eseguiti", metrics.get('replace_executed', 0), "Ordini modificati", 2)
         create_metric_card(metrics_frame, "Replace Saltati", metrics.get('replace_skipped', 0), "Ottimizzazione", 3)
         create_metric_card(metrics_frame, "Uptime", f"{metrics.get('uptime_min', 0)} min", "Sessione corrente", 4)
         
+        create_metric_card(metrics_frame, "Latenza p50", f"{metrics.get('p50_latency_ms', 0)}ms", "Mediana", 0, row=1)
+        create_metric_card(metrics_frame, "Latenza p95", f"{metrics.get('p95_latency_ms', 0)}ms", "95 percentile", 1, row=1)
+        create_metric_card(metrics_frame, "Latenza p99", f"{metrics.get('p99_latency_ms', 0)}ms", "99 percentile", 2, row=1)
+        create_metric_card(metrics_frame, "Error Rate", f"{metrics.get('error_rate', 0)}%", "Ultime chiamate", 3, row=1)
+        
         for i in range(5):
             metrics_frame.columnconfigure(i, weight=1)
         
+        endpoints = metrics.get('endpoints', {})
+        if endpoints:
+            ctk.CTkLabel(parent, text="Latenza per Endpoint", 
+                         font=('Segoe UI', 12, 'bold'), text_color=COLORS['text_primary']).pack(anchor=tk.W, pady=(20, 10))
+            
+            columns = ('endpoint', 'calls_min', 'p50', 'p95', 'p99', 'errors')
+            endpoints_tree = ttk.Treeview(parent, columns=columns, show='headings', height=min(8, len(endpoints)))
+            for col, heading, width in [('endpoint', 'Endpoint', 200), ('calls_min', 'Calls/min', 80),
+                                        ('p50', 'p50 ms', 80), ('p95', 'p95 ms', 80),
+                                        ('p99', 'p99 ms', 80), ('errors', 'Errori %', 80)]:
+                endpoints_tree.heading(col, text=heading)
+                endpoints_tree.column(col, width=width, anchor=tk.W if col == 'endpoint' else tk.CENTER)
+            
+            for name, ep in sorted(endpoints.items(), key=lambda x: -x[1].get('calls_per_min', 0)):
+                endpoints_tree.insert('', tk.END, values=(
+                    name, ep.get('calls_per_min', 0), ep.get('p50_ms', 0),
+                    ep.get('p95_ms', 0), ep.get('p99_ms', 0), ep.get('error_rate', 0)
+                ))
+            endpoints_tree.pack(fill=tk.X, padx=5)
+        
+        ttfb = metrics.get('ttfb', {})
+        if ttfb:
+            after_idle = metrics.get('ttfb_after_idle', {})
+            ctk.CTkLabel(parent, text="Time To First Byte (HTTP)", 
+                         font=('Segoe UI', 12, 'bold'), text_color=COLORS['text_primary']).pack(anchor=tk.W, pady=(20, 5))
+            ctk.CTkLabel(parent, text=f"Prima chiamata dopo inattivita: p50 {after_idle.get('p50_ms', 0)}ms - "
+                                      f"p95 {after_idle.get('p95_ms', 0)}ms ({after_idle.get('calls', 0)} campioni)", 
+                         font=('Segoe UI', 10), text_color=COLORS['text_secondary']).pack(anchor=tk.W, pady=(0, 10))
+            
+            columns = ('method', 'calls', 'p50', 'p95', 'p99')
+            ttfb_tree = ttk.Treeview(parent, columns=columns, show='headings', height=min(8, len(ttfb)))
+            for col, heading, width in [('method', 'Metodo', 200), ('calls', 'Chiamate', 80),
+                                        ('p50', 'p50 ms', 80), ('p95', 'p95 ms', 80), ('p99', 'p99 ms', 80)]:
+                ttfb_tree.heading(col, text=heading)
+                ttfb_tree.column(col, width=width, anchor=tk.W if col == 'method' else tk.CENTER)
+            
+            for name, ep in sorted(ttfb.items(), key=lambda x: -x[1].get('calls', 0)):
+                ttfb_tree.insert('', tk.END, values=(
+                    name, ep.get('calls', 0), ep.get('p50_ms', 0), ep.get('p95_ms', 0), ep.get('p99_ms', 0)
+                ))
+            ttfb_tree.pack(fill=tk.X, padx=5)
+        
         ctk.CTkLabel(parent, text="Cache Market Book", 
                      font=('Segoe UI', 12, 'bold'), text_color=COLORS['text_primary']).pack(anchor=tk.W, pady=(20, 10))
         
@@ -6578,7 +6856,8 @@ Evento: {event_name}"""
         
         try:
             # Get unsettled bets from database
-            unsettled = self.db.get_unsettled_bets(limit=50)
+            unsettled_limit = 500
+            unsettled = self.db.get_unsettled_bets(limit=unsettled_limit)
             if not unsettled:
                 return
             
@@ -6587,8 +6866,14 @@ Evento: {event_name}"""
             if not bet_ids:
                 return
             
-            # Get cleared orders from Betfair
-            cleared = self.client.get_cleared_orders(bet_ids=bet_ids)
+            # Incremental sync from the persisted watermark (backfill on first run).
+            # Filter by bet id only when the unsettled list is complete, otherwise
+            # settlements of bets beyond the limit would be skipped by the watermark.
+            watermark = self.db.get_sync_state('cleared_orders_watermark')
+            cleared, new_watermark = self.client.sync_cleared_orders(
+                since=watermark,
+                bet_ids=bet_ids if len(unsettled) < unsettled_limit else None
+            )
             
             # Update database with outcomes
             for settled_bet in cleared:
@@ -6600,6 +6885,8 @@ Evento: {event_name}"""
                 if bet_id and outcome:
                     self.db.update_bet_outcome(bet_id, outcome, profit, settled_date)
             
+            self.db.set_sync_state('cleared_orders_watermark', new_watermark)
+            
             # Refresh statistics view if visible
             if hasattr(self, 'dashboard_stats_tab_frame'):
                 self.root.after(0, lambda: self._refresh_statistics_view(self.dashboard_stats_tab_frame))
@@ -6621,7 +6908,14 @@ Evento: {event_name}"""
     
     def _check_auto_cashout_triggers(self, rules):
         """Check if any auto-cashout rule should be triggered."""
-        if not self.client:
+        if not self.client or not rules:
+            return
+        
+        # One sync per cycle for all rules: order stream deltas between full snapshots
+        try:
+            matched = self.client.sync_current_orders().get('matched', [])
+        except Exception as e:
+            logging.error(f"Auto-cashout orders fetch error: {e}")
             return
         
         for rule in rules:
@@ -6631,10 +6925,6 @@ Evento: {event_name}"""
                 profit_target = rule['profit_target']
                 loss_limit = rule['loss_limit']
                 
-                # Get current orders to find the position
-                orders = self.client.get_current_orders()
-                matched = orders.get('matched', [])
-                
                 for order in matched:
                     if str(order.get('betId')) == str(bet_id):
                         selection_id = order.get('selectionId')
@@ -8754,24 +9044,37 @@ Evento: {event_name}"""
                             
                             for attempt in range(max_retries):
                                 success_count = 0
+                                unconfirmed = 0
                                 failed_bets = []
                                 
-                                for dr in dutching_result:
-                                    result = self.client.place_bet(
-                                        market_id=target_market['marketId'],
-                                        selection_id=dr['selectionId'],
-                                        side=bet_side,
-                                        price=dr['price'],
-                                        size=dr['stake']
-                                    )
+                                # All legs in one submit: one placeOrders (async with order stream)
+                                pending_legs = list(zip(dutching_result, self.client.submit_orders(
+                                    target_market['marketId'],
+                                    [{'selectionId': dr['selectionId'], 'side': bet_side,
+                                      'price': dr['price'], 'size': dr['stake']} for dr in dutching_result]
+                                )))
+                                for dr, future in pending_legs:
+                                    try:
+                                        result = future.result(timeout=30)
+                                    except FutureTimeoutError:
+                                        # Still in flight: may be on the market
+                                        result = {'status': 'UNKNOWN'}
+                                    except Exception as e:
+                                        logging.error(f"[AUTO-BET] Dutching leg {dr['selectionId']} failed: {e}")
+                                        result = {}
                                     if result.get('status') == 'SUCCESS':
                                         success_count += 1
+                                    elif result.get('status') == 'UNKNOWN':
+                                        # Not confirmed: never re-placed (would double the exposure)
+                                        logging.warning(f"[AUTO-BET] Dutching leg {dr['selectionId']} not confirmed, not retried")
+                                        unconfirmed += 1
                                     else:
                                         failed_bets.append(dr)
                                 
-                                if success_count == len(dutching_result):
+                                if not failed_bets:
                                     update_status('PLACED')
-                                    messagebox.showinfo("Auto-Bet Dutching", f"Dutching piazzato con successo!\n\n{bet_info}")
+                                    note = f"\n\n{unconfirmed} scommesse non confermate: verifica gli ordini" if unconfirmed else ""
+                                    messagebox.showinfo("Auto-Bet Dutching", f"Dutching piazzato con successo!\n\n{bet_info}{note}")
                                     break
                                 elif attempt < max_retries - 1:
                                     # Retry failed bets after delay
@@ -8951,13 +9254,25 @@ Evento: {event_name}"""
                 retry_delay = 10
                 
                 for attempt in range(max_retries):
-                    result = self.client.place_bet(
-                        market_id=target_market['marketId'],
-                        selection_id=target_runner['selectionId'],
-                        side=bet_side,
-                        price=target_runner['price'],
-                        size=stake
-                    )
+                    try:
+                        result = self.client.submit_order(
+                            market_id=target_market['marketId'],
+                            selection_id=target_runner['selectionId'],
+                            side=bet_side,
+                            price=target_runner['price'],
+                            size=stake
+                        ).result(timeout=30)
+                    except FutureTimeoutError:
+                        result = {'status': 'UNKNOWN'}
+                    except Exception as e:
+                        logging.error(f"[AUTO-BET] Order failed: {e}")
+                        result = {'status': 'FAILURE', 'errorCode': str(e)}
+                    
+                    if result.get('status') == 'UNKNOWN':
+                        # Not confirmed: may be on the market, a retry would double the exposure
+                        update_status('PLACED')
+                        messagebox.showwarning("Auto-Bet", f"Scommessa inviata ma non confermata: verifica gli ordini.\n\n{bet_info}")
+                        break
                     
                     if result.get('status') == 'SUCCESS':
                         update_status('PLACED')
@@ -9349,6 +9664,83 @@ Evento: {event_name}"""
             self.root.title(f"{APP_NAME} v{APP_VERSION}")
             self.sim_balance_label.configure(text="")
     
+    def _get_paper_exchange(self):
+        """Paper exchange for simulation mode, fed by the market stream."""
+        if self.paper_exchange is None:
+            self.paper_exchange = PaperExchange(
+                on_settle=lambda result: self.root.after(0, lambda: self._on_paper_settle(result))
+            )
+            if getattr(self, 'order_stream', None):
+                self.paper_exchange.attach_stream(self.order_stream)
+            self._paper_poll_loop()
+        return self.paper_exchange
+    
+    def _paper_poll_loop(self):
+        """Lapse/settle paper orders on markets not fed by stream or price polling."""
+        if not self.paper_exchange:
+            return
+        
+        def fetch():
+            try:
+                exchange = self.paper_exchange
+                market_ids = exchange.open_market_ids()
+                current = self.current_market['marketId'] if self.current_market else None
+                if current and (self.streaming_active or getattr(self, 'polling_fallback_id', None)):
+                    market_ids = [m for m in market_ids if m != current]
+                if not market_ids or not self.client:
+                    return
+                for book in self.client.get_market_books(market_ids, price_data=['EX_BEST_OFFERS']):
+                    exchange.on_market_book(book)
+            except Exception as e:
+                logging.debug(f"[PAPER] Market book poll error: {e}")
+        
+        threading.Thread(target=fetch, daemon=True).start()
+        # Every 10 seconds: only markets with open paper orders are fetched
+        self.root.after(10000, self._paper_poll_loop)
+    
+    @staticmethod
+    def _paper_fill_status(size_matched, size):
+        """Simulation bet status from the paper exchange fill."""
+        if size_matched >= size - 0.005:
+            return 'MATCHED'
+        if size_matched > 0:
+            return 'PARTIALLY_MATCHED'
+        return 'UNMATCHED'
+    
+    def _on_paper_settle(self, result):
+        """Settle simulation bets of a closed market (UI thread)."""
+        try:
+            rows = self.db.get_open_simulation_bets(result['marketId'])
+            bets = result['bets']
+            gross_by_row = {
+                row['id']: sum(bets.get(sel.get('betId'), 0.0) for sel in row['selections'])
+                for row in rows if any(sel.get('betId') in bets for sel in row['selections'])
+            }
+            if not gross_by_row:
+                return
+            
+            # Market commission split over the winning rows
+            winning = sum(g for g in gross_by_row.values() if g > 0)
+            settings = self.db.get_simulation_settings()
+            balance = settings.get('virtual_balance', 0)
+            for row in rows:
+                if row['id'] not in gross_by_row:
+                    continue
+                gross = gross_by_row[row['id']]
+                commission = result['commission'] * gross / winning if gross > 0 and winning > 0 else 0.0
+                profit = round(gross - commission, 2)
+                reserved = sum(sel.get('reserved', sel.get('stake', 0)) for sel in row['selections'])
+                balance += reserved + profit
+                outcome = 'won' if profit > 0 else 'lost' if profit < 0 else 'void'
+                self.db.settle_simulation_bet(row['id'], profit, outcome)
+            
+            self.db.update_simulation_balance(balance)
+            self._update_simulation_balance_display()
+            logging.info(f"[PAPER] Settled {len(gross_by_row)} simulation bets on {result['marketId']}: "
+                         f"P&L {result['profit']:.2f}")
+        except Exception as e:
+            logging.error(f"[PAPER] Settlement error: {e}")
+    
     def _update_simulation_balance_display(self):
         """Update simulation balance display."""
         if self.simulation_mode:
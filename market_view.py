@@ -0,0 +1,268 @@
+"""
+MarketView - Modello unico di mercato per Pickfair
+
+Un solo oggetto per mercato, costruito una volta da catalogue + prezzi
+(stream o REST) + ordini propri e condiviso da UI, dutching e cashout.
+
+- Runner indicizzati per selection_id (lookup O(1), niente join annidati)
+- Ladder compatte [[price, size], ...] ordinate dal migliore
+- Contatore di versione incrementato ad ogni modifica
+- Set di runner "dirty" per il refresh UI throttled
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Livelli di ladder conservati per lato
+LADDER_DEPTH = 3
+
+
+class RunnerView:
+    """Stato compatto di un runner."""
+
+    __slots__ = (
+        'selection_id', 'name', 'sort_priority', 'status',
+        'back', 'lay', 'ltp', 'tv',
+        'matched_back', 'matched_lay', 'unmatched_back', 'unmatched_lay',
+    )
+
+    def __init__(self, selection_id: int, name: str = '', sort_priority: int = 0,
+                 status: str = 'ACTIVE'):
+        self.selection_id = selection_id
+        self.name = name
+        self.sort_priority = sort_priority
+        self.status = status
+        self.back: List[List[float]] = []
+        self.lay: List[List[float]] = []
+        self.ltp: Optional[float] = None
+        self.tv: float = 0.0
+        self.matched_back = 0.0
+        self.matched_lay = 0.0
+        self.unmatched_back = 0.0
+        self.unmatched_lay = 0.0
+
+    @property
+    def back_price(self) -> Optional[float]:
+        return self.back[0][0] if self.back else None
+
+    @property
+    def back_size(self) -> float:
+        return self.back[0][1] if self.back else 0
+
+    @property
+    def lay_price(self) -> Optional[float]:
+        return self.lay[0][0] if self.lay else None
+
+    @property
+    def lay_size(self) -> float:
+        return self.lay[0][1] if self.lay else 0
+
+    def best(self, side: str) -> Optional[float]:
+        """Miglior prezzo disponibile per il lato indicato (BACK/LAY)."""
+        return self.back_price if side == 'BACK' else self.lay_price
+
+    def to_dict(self) -> Dict:
+        """Formato runner storico (get_market_with_prices)."""
+        return {
+            'selectionId': self.selection_id,
+            'runnerName': self.name,
+            'sortPriority': self.sort_priority,
+            'backPrice': self.back_price,
+            'layPrice': self.lay_price,
+            'backSize': self.back[0][1] if self.back else None,
+            'laySize': self.lay[0][1] if self.lay else None,
+            'status': self.status,
+        }
+
+
+class MarketView:
+    """
+    Vista versionata di un mercato.
+
+    Le scritture arrivano dal thread dello stream o dal polling REST,
+    le letture dal thread Tk: un lock protegge ladder e set dirty.
+    """
+
+    def __init__(self, market_id: str, market_name: str = '',
+                 start_time: Optional[str] = None):
+        self.market_id = market_id
+        self.market_name = market_name
+        self.start_time = start_time
+        self.status = 'OPEN'
+        self.inplay = False
+        self.version = 0
+        self.runners: Dict[int, RunnerView] = {}
+        self._dirty: Set[int] = set()
+        self._lock = threading.Lock()
+
+    # ==============================
+    # COSTRUZIONE
+    # ==============================
+
+    @classmethod
+    def from_catalogue(cls, catalogue) -> 'MarketView':
+        """Crea la vista da un MarketCatalogue (oggetto o dict raw)."""
+        if isinstance(catalogue, dict):
+            start = catalogue.get('marketStartTime')
+            view = cls(catalogue['marketId'], catalogue.get('marketName', ''), start)
+            for r in catalogue.get('runners') or []:
+                view._add_runner(r['selectionId'], r.get('runnerName', ''),
+                                 r.get('sortPriority', 0))
+            return view
+
+        start = catalogue.market_start_time
+        view = cls(catalogue.market_id, catalogue.market_name,
+                   start.isoformat() if start else None)
+        for r in catalogue.runners or []:
+            view._add_runner(r.selection_id, r.runner_name, r.sort_priority)
+        return view
+
+    def _add_runner(self, selection_id: int, name: str, sort_priority: int) -> RunnerView:
+        runner = RunnerView(selection_id, name, sort_priority)
+        self.runners[selection_id] = runner
+        return runner
+
+    def _runner(self, selection_id) -> RunnerView:
+        runner = self.runners.get(selection_id)
+        if runner is None:
+            runner = self._add_runner(selection_id, str(selection_id), len(self.runners) + 1)
+        return runner
+
+    # ==============================
+    # AGGIORNAMENTI PREZZI
+    # ==============================
+
+    def apply_book(self, book: Dict) -> Set[int]:
+        """
+        Applica un market book normalizzato (adapt_market_book_*).
+
+        Returns:
+            Set dei selection_id con prezzi/stato cambiati
+        """
+        changed = set()
+        with self._lock:
+            self.status = book.get('status') or self.status
+            self.inplay = bool(book.get('inplay'))
+            for rb in book.get('runners') or []:
+                runner = self._runner(rb['selectionId'])
+                back = (rb.get('back') or [])[:LADDER_DEPTH]
+                lay = (rb.get('lay') or [])[:LADDER_DEPTH]
+                status = rb.get('status') or runner.status
+                if back != runner.back or lay != runner.lay or status != runner.status:
+                    changed.add(runner.selection_id)
+                runner.back = back
+                runner.lay = lay
+                runner.status = status
+                if rb.get('lastPriceTraded') is not None:
+                    runner.ltp = rb['lastPriceTraded']
+                runner.tv = rb.get('totalMatched') or runner.tv
+            if changed:
+                self.version += 1
+                self._dirty |= changed
+        return changed
+
+    def apply_stream_update(self, update: Dict) -> bool:
+        """
+        Applica un update runner di BetfairStream (on_market_change).
+
+        Returns:
+            True se l'update riguarda questo mercato
+        """
+        if update.get('market_id') != self.market_id:
+            return False
+        selection_id = update.get('selection_id')
+        with self._lock:
+            runner = self._runner(selection_id)
+            back = update.get('back_prices')
+            lay = update.get('lay_prices')
+            if back is None and update.get('back_price'):
+                back = [[update['back_price'], update.get('back_size', 0)]]
+            if lay is None and update.get('lay_price'):
+                lay = [[update['lay_price'], update.get('lay_size', 0)]]
+            runner.back = list(back or [])[:LADDER_DEPTH]
+            runner.lay = list(lay or [])[:LADDER_DEPTH]
+            if update.get('ltp') is not None:
+                runner.ltp = update['ltp']
+            runner.tv = update.get('tv') or runner.tv
+            self.version += 1
+            self._dirty.add(selection_id)
+        return True
+
+    def apply_orders(self, orders: Iterable[Dict]) -> None:
+        """
+        Ricalcola l'esposizione propria per runner da ordini correnti
+        normalizzati (adapt_current_order_*).
+        """
+        with self._lock:
+            for runner in self.runners.values():
+                runner.matched_back = runner.matched_lay = 0.0
+                runner.unmatched_back = runner.unmatched_lay = 0.0
+            for order in orders:
+                if order.get('marketId') != self.market_id:
+                    continue
+                runner = self.runners.get(order.get('selectionId'))
+                if runner is None:
+                    continue
+                matched = order.get('sizeMatched') or 0
+                remaining = order.get('sizeRemaining') or 0
+                if order.get('side') == 'BACK':
+                    runner.matched_back += matched
+                    runner.unmatched_back += remaining
+                else:
+                    runner.matched_lay += matched
+                    runner.unmatched_lay += remaining
+            self.version += 1
+
+    # ==============================
+    # LETTURA
+    # ==============================
+
+    def pop_dirty(self) -> List[RunnerView]:
+        """Restituisce e azzera i runner modificati dall'ultimo refresh."""
+        with self._lock:
+            if not self._dirty:
+                return []
+            dirty, self._dirty = self._dirty, set()
+            return [self.runners[sid] for sid in dirty if sid in self.runners]
+
+    def get_runner(self, selection_id) -> Optional[RunnerView]:
+        """Lookup tollerante: accetta selection_id int o str."""
+        runner = self.runners.get(selection_id)
+        if runner is None and isinstance(selection_id, str) and selection_id.isdigit():
+            runner = self.runners.get(int(selection_id))
+        return runner
+
+    def ladder(self, selection_id, side: str) -> List[List[float]]:
+        """Copia della ladder [[price, size], ...] di un runner per il lato (BACK/LAY)."""
+        with self._lock:
+            runner = self.get_runner(selection_id)
+            if runner is None:
+                return []
+            return [list(lv) for lv in (runner.back if side == 'BACK' else runner.lay)]
+
+    def best_prices(self, side: str) -> Dict[int, float]:
+        """Mappa selection_id -> miglior prezzo per il lato (per dutching)."""
+        with self._lock:
+            prices = {}
+            for sid, runner in self.runners.items():
+                price = runner.best(side)
+                if price:
+                    prices[sid] = price
+            return prices
+
+    def to_dict(self) -> Dict:
+        """Formato mercato storico usato da UI e plugin."""
+        with self._lock:
+            runners = sorted(self.runners.values(), key=lambda r: r.sort_priority)
+            return {
+                'marketId': self.market_id,
+                'marketName': self.market_name,
+                'startTime': self.start_time,
+                'runners': [r.to_dict() for r in runners],
+                'status': self.status,
+                'inPlay': self.inplay,
+                'version': self.version,
+            }
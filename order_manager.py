@@ -26,15 +26,32 @@ Features:
     - Tick ladder Betfair ufficiale
     - Anti-loop protection
     - Cashout multi-selezione (green book)
+    - Copertura cross-mercato sulla stessa partita (ScorelineBook)
     - replaceOrders con fallback cancel+place
 """
 
 import time
 import logging
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+import threading
+from typing import Dict, List, Optional, Set, Tuple
 from enum import Enum
 
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# Tick ladder ufficiale (re-export per compatibilita)
+from tick_ladder import (
+    TICK_LADDER,
+    get_tick_size,
+    normalize_price,
+    next_tick_up,
+    next_tick_down,
+    ticks_difference,
+)
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -54,71 +71,8 @@ MAX_REPLACES = 5         # Max replace per ordine
 MIN_INTERVAL = 0.4       # Secondi minimi tra replace
 RESET_AFTER = 10.0       # Reset contatore dopo N secondi inattivita
 COMMISSION = 0.045       # Commissione Betfair Italia (4.5%)
-
-
-# ==============================================================================
-# TICK LADDER BETFAIR (UFFICIALE)
-# ==============================================================================
-
-TICK_LADDER = [
-    (1.01, 2.0, 0.01),
-    (2.0, 3.0, 0.02),
-    (3.0, 4.0, 0.05),
-    (4.0, 6.0, 0.1),
-    (6.0, 10.0, 0.2),
-    (10.0, 20.0, 0.5),
-    (20.0, 30.0, 1.0),
-    (30.0, 50.0, 2.0),
-    (50.0, 100.0, 5.0),
-    (100.0, 1000.0, 10.0),
-]
-
-
-def get_tick_size(price: float) -> float:
-    """Restituisce il tick size per un dato prezzo."""
-    for low, high, tick in TICK_LADDER:
-        if low <= price < high:
-            return tick
-    return 10.0
-
-
-def normalize_price(price: float) -> float:
-    """Normalizza prezzo al tick Betfair valido piu vicino."""
-    if price < 1.01:
-        return 1.01
-    if price >= 1000.0:
-        return 1000.0
-    
-    tick = get_tick_size(price)
-    return round(round(price / tick) * tick, 2)
-
-
-def next_tick_up(price: float) -> float:
-    """Prossimo tick superiore."""
-    tick = get_tick_size(price)
-    return normalize_price(price + tick)
-
-
-def next_tick_down(price: float) -> float:
-    """Prossimo tick inferiore."""
-    tick = get_tick_size(price)
-    return normalize_price(max(1.01, price - tick))
-
-
-def ticks_difference(price1: float, price2: float) -> int:
-    """Calcola quanti tick di differenza tra due prezzi."""
-    if price1 == price2:
-        return 0
-    
-    low, high = min(price1, price2), max(price1, price2)
-    ticks = 0
-    current = low
-    
-    while current < high and ticks < 1000:
-        current = next_tick_up(current)
-        ticks += 1
-    
-    return ticks if price1 < price2 else -ticks
+ORDER_RESULT_TIMEOUT = 30.0  # Secondi max di attesa esito ordine accodato
+MAX_REPLACE_INSTRUCTIONS = 60  # Limite Betfair istruzioni per replaceOrders
 
 
 # ==============================================================================
@@ -138,32 +92,76 @@ class OrderStatus(Enum):
     ERROR = "ERROR"             # Errore
 
 
-@dataclass
 class OrderState:
-    """Stato completo di un ordine."""
-    bet_id: str
-    market_id: str = ""
-    selection_id: int = 0
-    side: str = "BACK"
-    status: OrderStatus = OrderStatus.PLACED
-    
-    # Prezzi e stake
-    original_price: float = 0.0
-    current_price: float = 0.0
-    stake: float = 0.0
-    size_matched: float = 0.0
-    size_remaining: float = 0.0
-    
-    # Profitto
-    last_profit: float = 0.0
-    target_profit: float = 0.0
-    
-    # Tracking replace
-    replace_count: int = 0
-    last_action_ts: float = field(default_factory=time.time)
-    
-    # Mapping betId (se cambiato dopo replace)
-    new_bet_id: Optional[str] = None
+    """Stato completo di un ordine (slot compatti, niente __dict__)."""
+
+    __slots__ = (
+        'bet_id', 'market_id', 'selection_id', 'side', 'status',
+        'original_price', 'current_price', 'stake', 'size_matched', 'size_remaining',
+        'last_profit', 'target_profit',
+        'replace_count', 'last_action_ts',
+        'new_bet_id',
+    )
+
+    def __init__(
+        self,
+        bet_id: str,
+        market_id: str = "",
+        selection_id: int = 0,
+        side: str = "BACK",
+        status: OrderStatus = OrderStatus.PLACED,
+        original_price: float = 0.0,
+        current_price: float = 0.0,
+        stake: float = 0.0,
+        size_matched: float = 0.0,
+        size_remaining: float = 0.0,
+        last_profit: float = 0.0,
+        target_profit: float = 0.0,
+        replace_count: int = 0,
+        last_action_ts: Optional[float] = None,
+        new_bet_id: Optional[str] = None
+    ):
+        self.bet_id = bet_id
+        self.market_id = market_id
+        self.selection_id = selection_id
+        self.side = side
+        self.status = status
+
+        # Prezzi e stake
+        self.original_price = original_price
+        self.current_price = current_price
+        self.stake = stake
+        self.size_matched = size_matched
+        self.size_remaining = size_remaining
+
+        # Profitto
+        self.last_profit = last_profit
+        self.target_profit = target_profit
+
+        # Tracking replace
+        self.replace_count = replace_count
+        self.last_action_ts = time.time() if last_action_ts is None else last_action_ts
+
+        # Mapping betId (se cambiato dopo replace)
+        self.new_bet_id = new_bet_id
+
+    def to_dict(self) -> Dict:
+        """Copia piatta dello stato (status come stringa)."""
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['status'] = self.status.value
+        return data
+
+    def __repr__(self) -> str:
+        return (f"OrderState(bet_id={self.bet_id!r}, market_id={self.market_id!r}, "
+                f"selection_id={self.selection_id}, side={self.side}, status={self.status.value})")
+
+
+# Stati chiusi: esclusi da get_all_active, rimossi per primi dalla retention
+CLOSED_STATUSES = frozenset({OrderStatus.CASHED_OUT, OrderStatus.CANCELLED, OrderStatus.LOCKED})
+
+MAX_TRACKED_ORDERS = 5000        # Stati conservati al massimo
+STATE_RETENTION_HOURS = 24       # Eta massima di uno stato inattivo
+STATE_CLEANUP_INTERVAL = 300.0   # Secondi tra due pulizie automatiche
 
 
 class OrderStateManager:
@@ -174,52 +172,130 @@ class OrderStateManager:
     - No doppio cashout
     - No replace duplicati
     - No broadcast multipli
+
+    Thread-safe (stream, UI ed engine scrivono in concorrenza):
+    - Un RLock protegge store, alias e indici
+    - Alias betId vecchio -> nuovo con path compression
+    - Indici secondari per mercato, (mercato, selezione) e status
+    - Retention limitata: pulizia automatica per eta e numero massimo
     """
     
-    def __init__(self):
+    def __init__(self, max_orders: int = MAX_TRACKED_ORDERS,
+                 max_age_hours: float = STATE_RETENTION_HOURS):
         self.orders: Dict[str, OrderState] = {}
+        self.max_orders = max_orders
+        self.max_age_hours = max_age_hours
+        self._aliases: Dict[str, str] = {}
+        self._by_market: Dict[str, Set[str]] = {}
+        self._by_selection: Dict[Tuple[str, int], Set[str]] = {}
+        self._by_status: Dict[OrderStatus, Set[str]] = {}
+        self._lock = threading.RLock()
+        self._last_cleanup = time.time()
+
+    # ==============================
+    # ALIAS / INDICI (chiamare con lock)
+    # ==============================
+
+    def _resolve(self, bet_id: str) -> str:
+        """Segue gli alias fino al betId corrente e comprime il percorso."""
+        target = self._aliases.get(bet_id)
+        if target is None:
+            return bet_id
+        path = [bet_id]
+        while target in self._aliases:
+            path.append(target)
+            target = self._aliases[target]
+        for alias in path:
+            self._aliases[alias] = target
+        return target
+
+    def _index(self, state: OrderState):
+        bet_id = state.bet_id
+        self._by_market.setdefault(state.market_id, set()).add(bet_id)
+        self._by_selection.setdefault((state.market_id, state.selection_id), set()).add(bet_id)
+        self._by_status.setdefault(state.status, set()).add(bet_id)
+
+    def _unindex(self, state: OrderState):
+        bet_id = state.bet_id
+        for index, key in ((self._by_market, state.market_id),
+                           (self._by_selection, (state.market_id, state.selection_id)),
+                           (self._by_status, state.status)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(bet_id)
+                if not ids:
+                    del index[key]
+
+    def _insert(self, state: OrderState):
+        old = self.orders.get(state.bet_id)
+        if old is not None:
+            self._unindex(old)
+        self.orders[state.bet_id] = state
+        self._index(state)
+
+    def _remove(self, bet_id: str):
+        state = self.orders.pop(bet_id, None)
+        if state is not None:
+            self._unindex(state)
+
+    def _states(self, bet_ids) -> List[OrderState]:
+        return [self.orders[b] for b in bet_ids if b in self.orders]
+
+    # ==============================
+    # API
+    # ==============================
+
+    def resolve(self, bet_id: str) -> str:
+        """betId corrente per un betId originale (dopo eventuali replace)."""
+        with self._lock:
+            return self._resolve(bet_id)
     
     def get(self, bet_id: str) -> Optional[OrderState]:
         """Ottieni stato ordine (segue mapping betId)."""
-        # Segui catena di mapping
-        current = bet_id
-        while current in self.orders and self.orders[current].new_bet_id:
-            current = self.orders[current].new_bet_id
-        return self.orders.get(current)
+        with self._lock:
+            return self.orders.get(self._resolve(bet_id))
     
     def get_or_create(self, bet_id: str, **kwargs) -> OrderState:
         """Ottieni o crea stato ordine."""
-        state = self.get(bet_id)
-        if state is None:
-            state = OrderState(bet_id=bet_id, **kwargs)
-            self.orders[bet_id] = state
-        return state
+        with self._lock:
+            state = self.orders.get(self._resolve(bet_id))
+            if state is None:
+                state = OrderState(bet_id=bet_id, **kwargs)
+                self._insert(state)
+                self._maybe_cleanup()
+            return state
     
     def update(self, bet_id: str, **kwargs) -> OrderState:
         """Aggiorna stato ordine."""
-        state = self.get_or_create(bet_id)
-        for key, value in kwargs.items():
-            if hasattr(state, key):
-                setattr(state, key, value)
-        return state
+        with self._lock:
+            state = self.get_or_create(bet_id)
+            self._unindex(state)
+            for key, value in kwargs.items():
+                if key != 'bet_id' and hasattr(state, key):
+                    setattr(state, key, value)
+            self._index(state)
+            return state
     
     def set_status(self, bet_id: str, status: OrderStatus) -> bool:
         """Cambia stato ordine con validazione."""
-        state = self.get(bet_id)
-        if state is None:
-            return False
-        
-        # Validazione transizioni
-        if state.status == OrderStatus.LOCKED:
-            logger.warning(f"[STATE] {bet_id} is LOCKED, cannot change status")
-            return False
-        
-        if state.status == OrderStatus.CASHED_OUT:
-            logger.warning(f"[STATE] {bet_id} already CASHED_OUT")
-            return False
-        
-        old_status = state.status
-        state.status = status
+        with self._lock:
+            state = self.orders.get(self._resolve(bet_id))
+            if state is None:
+                return False
+            
+            # Validazione transizioni
+            if state.status == OrderStatus.LOCKED:
+                logger.warning(f"[STATE] {bet_id} is LOCKED, cannot change status")
+                return False
+            
+            if state.status == OrderStatus.CASHED_OUT:
+                logger.warning(f"[STATE] {bet_id} already CASHED_OUT")
+                return False
+            
+            old_status = state.status
+            self._unindex(state)
+            state.status = status
+            self._index(state)
         logger.info(f"[STATE] {bet_id}: {old_status.value} -> {status.value}")
         return True
     
@@ -229,25 +305,31 @@ class OrderStateManager:
         if state is None:
             return False, "Ordine non trovato"
         
-        if state.status in [OrderStatus.LOCKED, OrderStatus.CASHED_OUT, 
-                           OrderStatus.CANCELLED, OrderStatus.MATCHED]:
-            return False, f"Status: {state.status.value}"
+        status = state.status
+        if status in (OrderStatus.LOCKED, OrderStatus.CASHED_OUT,
+                      OrderStatus.CANCELLED, OrderStatus.MATCHED):
+            return False, f"Status: {status.value}"
         
-        if state.status == OrderStatus.REPLACING:
+        if status == OrderStatus.REPLACING:
             return False, "Replace gia in corso"
         
         return True, "OK"
     
     def record_replace(self, bet_id: str, new_bet_id: Optional[str] = None):
         """Registra un replace effettuato."""
-        state = self.get(bet_id)
-        if state:
+        with self._lock:
+            current = self._resolve(bet_id)
+            state = self.orders.get(current)
+            if state is None:
+                return
             state.replace_count += 1
             state.last_action_ts = time.time()
-            if new_bet_id and new_bet_id != bet_id:
+            if new_bet_id and new_bet_id != current:
+                # Il nuovo betId sostituisce il vecchio: alias + nuovo stato
                 state.new_bet_id = new_bet_id
-                # Crea nuovo stato per nuovo betId
-                self.orders[new_bet_id] = OrderState(
+                self._remove(current)
+                self._aliases[current] = new_bet_id
+                self._insert(OrderState(
                     bet_id=new_bet_id,
                     market_id=state.market_id,
                     selection_id=state.selection_id,
@@ -255,19 +337,90 @@ class OrderStateManager:
                     status=OrderStatus.PLACED,
                     original_price=state.original_price,
                     stake=state.stake
-                )
+                ))
+
+    # ==============================
+    # QUERY INDICIZZATE
+    # ==============================
+
+    def by_market(self, market_id: str) -> List[OrderState]:
+        """Stati correnti di un mercato."""
+        with self._lock:
+            return self._states(self._by_market.get(market_id, ()))
+
+    def by_selection(self, market_id: str, selection_id: int) -> List[OrderState]:
+        """Stati correnti di una selezione."""
+        with self._lock:
+            return self._states(self._by_selection.get((market_id, selection_id), ()))
+
+    def by_status(self, status: OrderStatus) -> List[OrderState]:
+        """Stati correnti con lo status dato."""
+        with self._lock:
+            return self._states(self._by_status.get(status, ()))
     
     def get_all_active(self) -> List[OrderState]:
         """Tutti gli ordini attivi (non chiusi)."""
-        closed = [OrderStatus.CASHED_OUT, OrderStatus.CANCELLED, OrderStatus.LOCKED]
-        return [o for o in self.orders.values() if o.status not in closed and o.new_bet_id is None]
+        with self._lock:
+            return [
+                state
+                for status, ids in self._by_status.items()
+                if status not in CLOSED_STATUSES
+                for state in self._states(ids)
+            ]
+
+    def snapshot(self, market_id: Optional[str] = None,
+                 status: Optional[OrderStatus] = None) -> List[Dict]:
+        """
+        Copia coerente degli stati (presa sotto lock), filtrabile per
+        mercato e/o status. Le copie si possono leggere senza lock.
+        """
+        with self._lock:
+            if market_id is not None:
+                ids = self._by_market.get(market_id, set())
+                if status is not None:
+                    ids = ids & self._by_status.get(status, set())
+            elif status is not None:
+                ids = self._by_status.get(status, ())
+            else:
+                ids = self.orders
+            return [state.to_dict() for state in self._states(ids)]
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    # ==============================
+    # RETENTION
+    # ==============================
+
+    def _maybe_cleanup(self):
+        now = time.time()
+        if len(self.orders) > self.max_orders or now - self._last_cleanup >= STATE_CLEANUP_INTERVAL:
+            self.cleanup_old(self.max_age_hours)
     
-    def cleanup_old(self, max_age_hours: int = 24):
-        """Rimuovi ordini vecchi."""
-        cutoff = time.time() - (max_age_hours * 3600)
-        to_remove = [k for k, v in self.orders.items() if v.last_action_ts < cutoff]
-        for k in to_remove:
-            del self.orders[k]
+    def cleanup_old(self, max_age_hours: float = STATE_RETENTION_HOURS):
+        """
+        Rimuovi ordini vecchi; oltre max_orders rimuove i piu vecchi,
+        prima i chiusi. Elimina anche gli alias rimasti orfani.
+        """
+        with self._lock:
+            now = time.time()
+            self._last_cleanup = now
+            cutoff = now - (max_age_hours * 3600)
+            for bet_id in [k for k, v in self.orders.items() if v.last_action_ts < cutoff]:
+                self._remove(bet_id)
+
+            excess = len(self.orders) - self.max_orders
+            if excess > 0:
+                oldest = sorted(
+                    self.orders.values(),
+                    key=lambda s: (s.status not in CLOSED_STATUSES, s.last_action_ts)
+                )
+                for state in oldest[:excess]:
+                    self._remove(state.bet_id)
+
+            for alias in list(self._aliases):
+                if self._resolve(alias) not in self.orders:
+                    del self._aliases[alias]
 
 
 # Singleton globale
@@ -506,87 +659,327 @@ class ReplaceGuard:
 # ==============================================================================
 # CASHOUT MULTI-SELEZIONE (GREEN BOOK)
 # ==============================================================================
+#
+# pi_k = P&L attuale se vince il runner k. Portare ogni esito allo stesso
+# livello h richiede sul runner k un valore v_k = h - pi_k:
+#
+#     v_k > 0  ->  BACK  stake v_k / B_k        v_k < 0  ->  LAY  stake -v_k / L_k
+#
+# e il profitto garantito e' G(h) = h - S(h), con S(h) = stake BACK - stake LAY.
+# G e' concava e lineare a tratti (pendenza 1 - sum 1/B sui runner sotto h
+# - sum 1/L su quelli sopra): il massimo cade su un breakpoint h = pi_k,
+# cioe' un runner che non va coperto. Runner senza prezzo restano scoperti e
+# limitano h al loro pi. Profitto piatto => commissione sul totale.
+#
+# Stake sotto il minimo Betfair (stessa regola di optimal_hedge in
+# scoreline_engine): si fissa al valore ammesso piu vicino (0 o il minimo),
+# il runner diventa un esito fisso che limita h come uno scoperto e il
+# livello si ricalcola sugli altri.
+
+GREEN_MIN_VALUE = 0.01   # EUR - sotto questa variazione il runner non si copre
+GREEN_MIN_STAKE = 1.0    # EUR - stake minimo Betfair per una copertura
+
+
+def _green_prices(price) -> Tuple[Optional[float], Optional[float]]:
+    """(back, lay) da un prezzo singolo o da {'back', 'lay'}."""
+    if isinstance(price, dict):
+        back, lay = price.get('back'), price.get('lay')
+    else:
+        back = lay = price
+    back = back if back and back > 1 else None
+    lay = lay if lay and lay > 1 else None
+    return back, lay
+
+
+def _positions_pnl(positions: List[Dict], selection_ids) -> Dict[int, float]:
+    """P&L lordo per runner vincente, O(posizioni + runner)."""
+    base = 0.0
+    winner = {sel_id: 0.0 for sel_id in selection_ids}
+    for pos in positions:
+        stake = pos['stake']
+        if pos['side'] == 'BACK':
+            base -= stake
+            winner[pos['selectionId']] += stake * pos['price']
+        else:
+            base += stake
+            winner[pos['selectionId']] -= stake * pos['price']
+    return {sel_id: base + value for sel_id, value in winner.items()}
+
+
+def _green_level(priced: List[Tuple[float, float, float]], cap: float) -> float:
+    """
+    Livello h che massimizza G(h) = h - S(h) con h <= cap.
+
+    priced: [(pi, back, lay)] dei runner copribili. Sweep sui breakpoint
+    ordinati con somme prefisso/suffisso: O(n log n).
+    """
+    items = sorted(priced)
+    inv_lay = sum(1.0 / lay for _, _, lay in items)
+    pi_lay = sum(pi / lay for pi, _, lay in items)
+    inv_back = pi_back = 0.0
+    best_level, best_value = None, float('-inf')
+
+    for pi, back, lay in items:
+        inv_lay -= 1.0 / lay
+        pi_lay -= pi / lay
+        if pi <= cap:
+            value = pi - (pi * inv_back - pi_back) + (pi_lay - pi * inv_lay)
+            if value > best_value:
+                best_level, best_value = pi, value
+        inv_back += 1.0 / back
+        pi_back += pi / back
+
+    # Runner scoperti: h non puo superare il loro pi
+    if cap < float('inf') and _green_value(cap, items) > best_value:
+        best_level = cap
+    return best_level
+
+
+def _green_value(level: float, priced: List[Tuple[float, float, float]]) -> float:
+    """G(h) diretto, O(n)."""
+    spent = 0.0
+    for pi, back, lay in priced:
+        if level > pi:
+            spent += (level - pi) / back
+        else:
+            spent -= (pi - level) / lay
+    return level - spent
+
+
+def _green_hedge(sel_id, value: float, back: float, lay: float, stake: Optional[float] = None) -> Optional[Dict]:
+    """Copertura che sposta l'esito del runner di value (None se trascurabile)."""
+    if value >= GREEN_MIN_VALUE:
+        side, price = 'BACK', back
+    elif value <= -GREEN_MIN_VALUE:
+        side, price = 'LAY', lay
+    else:
+        return None
+    if stake is None:
+        stake = abs(value) / price
+    return {
+        'selectionId': sel_id,
+        'side': side,
+        'stake': round(stake, 2),
+        'price': price,
+        'pnlChange': round(value, 2)
+    }
+
+
+def _green_solve(
+    pnl: Dict[int, float],
+    prices: Dict[int, Tuple[Optional[float], Optional[float]]],
+    min_stake: float = GREEN_MIN_STAKE
+) -> Dict[int, Dict]:
+    """
+    Coperture al livello ottimo con stake >= min_stake.
+
+    Gli stake sotto il minimo si fissano a 0 o a min_stake (il piu vicino);
+    il runner diventa un esito fisso e il livello si ricalcola sugli altri.
+    """
+    fixed: Dict[int, Dict] = {}
+    while True:
+        # P&L con le coperture fissate: esito del runner +stake*prezzo, tutti -stake
+        spent = sum(h['stake'] if h['side'] == 'BACK' else -h['stake'] for h in fixed.values())
+        shifted = {sel_id: pi - spent for sel_id, pi in pnl.items()}
+        for sel_id, hedge in fixed.items():
+            signed = hedge['stake'] if hedge['side'] == 'BACK' else -hedge['stake']
+            shifted[sel_id] += signed * hedge['price']
+        
+        priced = []
+        cap = float('inf')
+        for sel_id, pi in shifted.items():
+            back, lay = prices.get(sel_id, (None, None))
+            if back is None or lay is None or sel_id in fixed:
+                cap = min(cap, pi)
+            else:
+                priced.append((pi, back, lay))
+        level = _green_level(priced, cap) if priced else None
+        
+        hedges = {}
+        if level is not None:
+            for sel_id, pi in shifted.items():
+                back, lay = prices.get(sel_id, (None, None))
+                if back is None or lay is None or sel_id in fixed:
+                    continue
+                hedge = _green_hedge(sel_id, level - pi, back, lay)
+                if hedge is not None:
+                    hedges[sel_id] = hedge
+        
+        small = [h for h in hedges.values() if h['stake'] < min_stake]
+        if not small:
+            break
+        for hedge in small:
+            if hedge['stake'] >= min_stake / 2.0:
+                hedge['stake'] = min_stake
+                signed = min_stake if hedge['side'] == 'BACK' else -min_stake
+                hedge['pnlChange'] = round(signed * hedge['price'], 2)
+            else:
+                hedge['stake'] = 0.0
+            fixed[hedge['selectionId']] = hedge
+    
+    hedges.update((sel_id, h) for sel_id, h in fixed.items() if h['stake'] > 0)
+    return hedges
+
+
+def _green_result(
+    pnl: Dict[int, float],
+    hedges: Dict[int, Dict],
+    commission: float
+) -> Tuple[Dict[int, Dict], float]:
+    """Profitto garantito netto con le coperture effettivamente tenute (stake in centesimi)."""
+    # P&L finale con gli stake arrotondati
+    spent = 0.0
+    final = dict(pnl)
+    for sel_id, hedge in hedges.items():
+        signed = hedge['stake'] if hedge['side'] == 'BACK' else -hedge['stake']
+        spent += signed
+        final[sel_id] += signed * hedge['price']
+    worst = min(final.values()) - spent if final else 0.0
+    guaranteed = worst * (1 - commission) if worst > 0 else worst
+    return hedges, round(guaranteed, 2)
+
 
 def calculate_green_book(
     positions: List[Dict],
-    live_prices: Dict[int, float],
+    live_prices: Dict[int, object],
     commission: float = COMMISSION
 ) -> Tuple[Dict[int, Dict], float]:
     """
     Cashout multi-selezione per profitto netto uniforme (Green Book).
     
-    Risolve sistema per garantire stesso profitto su tutte le selezioni.
+    Copertura esatta: ogni runner riceve il BACK o LAY che porta il suo
+    esito al livello comune ottimo, tenendo conto che ogni stake sposta
+    anche gli esiti degli altri runner.
     
     Args:
         positions: Lista posizioni [{'selectionId', 'side', 'stake', 'price'}]
-        live_prices: {selectionId: live_price}
+        live_prices: {selectionId: price} oppure {selectionId: {'back', 'lay'}};
+            i runner quotati senza posizioni entrano come esiti del mercato
         commission: Commissione
     
     Returns:
         (hedges, guaranteed_profit)
-        hedges = {selectionId: {'side': 'LAY', 'stake': X, 'price': Y}}
+        hedges = {selectionId: {'side': 'BACK'|'LAY', 'stake': X, 'price': Y}}
     """
     if not positions or not live_prices:
         return {}, 0
     
-    # Calcola P&L per ogni outcome
-    selection_ids = set(p['selectionId'] for p in positions)
-    pnl = {sel_id: 0.0 for sel_id in selection_ids}
-    
-    # Per ogni selezione, calcola P&L se quella vince
-    for sel_id in selection_ids:
-        for pos in positions:
-            stake = pos['stake']
-            price = pos['price']
-            side = pos['side']
-            pos_sel = pos['selectionId']
-            
-            if pos_sel == sel_id:
-                # Questa posizione e' sulla selezione vincente
-                if side == 'BACK':
-                    pnl[sel_id] += stake * (price - 1)
-                else:  # LAY
-                    pnl[sel_id] -= stake * (price - 1)
-            else:
-                # Questa posizione e' su altra selezione
-                if side == 'BACK':
-                    pnl[sel_id] -= stake  # Perdiamo stake
-                else:  # LAY
-                    pnl[sel_id] += stake  # Vinciamo stake
+    selection_ids = set(p['selectionId'] for p in positions) | set(live_prices)
+    pnl = _positions_pnl(positions, selection_ids)
+    prices = {sel_id: _green_prices(price) for sel_id, price in live_prices.items()}
     
-    # Trova P&L minimo (profitto garantito attuale)
-    min_pnl = min(pnl.values())
+    hedges, guaranteed = _green_result(pnl, _green_solve(pnl, prices), commission)
     
-    # Calcola hedge necessari per uniformare
-    hedges = {}
+    logger.info(f"[GREEN BOOK] P&L by selection: {pnl}")
+    logger.info(f"[GREEN BOOK] Guaranteed profit: {guaranteed:.2f}, Hedges: {len(hedges)}")
+    
+    return hedges, guaranteed
+
+
+def calculate_green_book_batch(
+    books: Dict[str, Tuple[List[Dict], Dict[int, object]]],
+    commission: float = COMMISSION
+) -> Dict[str, Tuple[Dict[int, Dict], float]]:
+    """
+    Green book di tutti i mercati aperti in una chiamata.
+    
+    Con NumPy i livelli ottimi si calcolano insieme su una matrice
+    mercati x candidati x runner (G valutata su tutti i breakpoint);
+    senza NumPy si ricade su calculate_green_book per mercato.
+    
+    Args:
+        books: {marketId: (positions, live_prices)}
+    
+    Returns:
+        {marketId: (hedges, guaranteed_profit)}
+    """
+    if not HAS_NUMPY:
+        return {
+            market_id: calculate_green_book(positions, live_prices, commission)
+            for market_id, (positions, live_prices) in books.items()
+        }
     
-    for sel_id in selection_ids:
-        live_price = live_prices.get(sel_id)
-        if not live_price or live_price <= 1:
+    results = {}
+    rows = []
+    for market_id, (positions, live_prices) in books.items():
+        if not positions or not live_prices:
+            results[market_id] = ({}, 0)
             continue
-        
-        excess_pnl = pnl[sel_id] - min_pnl
-        
-        if excess_pnl > 0.01:  # Soglia minima
-            # Dobbiamo ridurre il P&L su questa selezione
-            # Piazziamo LAY per ridurre il guadagno se vince
-            hedge_stake = excess_pnl / (live_price - 1)
-            
+        selection_ids = list(set(p['selectionId'] for p in positions) | set(live_prices))
+        pnl = _positions_pnl(positions, selection_ids)
+        quotes = [_green_prices(live_prices.get(sel_id)) for sel_id in selection_ids]
+        rows.append((market_id, selection_ids, pnl, quotes))
+    if not rows:
+        return results
+    
+    # Matrici mercati x runner, padding NaN; runner senza back+lay = scoperti
+    width = max(len(sel_ids) for _, sel_ids, _, _ in rows)
+    nan = float('nan')
+    pi_rows, back_rows, lay_rows = [], [], []
+    for _, sel_ids, pnl, quotes in rows:
+        pad = [nan] * (width - len(sel_ids))
+        pi_rows.append([pnl[sel_id] for sel_id in sel_ids] + pad)
+        back_rows.append([b if b is not None and l is not None else nan for b, l in quotes] + pad)
+        lay_rows.append([l if b is not None and l is not None else nan for b, l in quotes] + pad)
+    pi = np.array(pi_rows)
+    back = np.array(back_rows)
+    lay = np.array(lay_rows)
+    
+    present = ~np.isnan(pi)
+    priced = present & ~np.isnan(back)
+    has_priced = priced.any(axis=1)
+    cap = np.where(present & ~priced, pi, np.inf).min(axis=1)
+    
+    # G su tutti i breakpoint (limitati al cap) + il cap stesso
+    candidates = np.concatenate([np.where(priced, pi, np.nan), cap[:, None]], axis=1)
+    candidates = np.minimum(candidates, cap[:, None])
+    candidates[~np.isfinite(candidates)] = np.nan
+    diff = candidates[:, :, None] - np.where(priced, pi, 0.0)[:, None, :]
+    inv_back = np.where(priced, 1.0 / np.where(priced, back, 1.0), 0.0)
+    inv_lay = np.where(priced, 1.0 / np.where(priced, lay, 1.0), 0.0)
+    spent = ((np.maximum(diff, 0.0) * inv_back[:, None, :]).sum(axis=2)
+             - (np.maximum(-diff, 0.0) * inv_lay[:, None, :]).sum(axis=2))
+    value = np.where(np.isnan(candidates), -np.inf, candidates - spent)
+    levels = candidates[np.arange(len(rows)), value.argmax(axis=1)]
+    
+    # Coperture in centesimi e P&L finale con gli stake arrotondati
+    change = np.where(priced, levels[:, None] - pi, 0.0)
+    is_back = change >= GREEN_MIN_VALUE
+    is_lay = change <= -GREEN_MIN_VALUE
+    stake = np.round(np.where(is_back, change * inv_back, np.where(is_lay, -change * inv_lay, 0.0)), 2)
+    signed = np.where(is_back, stake, -stake)
+    price = np.where(is_back, back, np.where(is_lay, lay, 0.0))
+    final = np.where(present, pi + signed * price, np.inf)
+    worst = final.min(axis=1) - signed.sum(axis=1)
+    guaranteed = np.round(np.where(worst > 0, worst * (1 - commission), worst), 2)
+    
+    # Uscita in dict: liste Python (l'accesso elemento per elemento a NumPy e' lento)
+    active = (is_back | is_lay) & has_priced[:, None]
+    back_side = is_back.tolist()
+    stakes = stake.tolist()
+    prices = price.tolist()
+    changes = np.round(change, 2).tolist()
+    guaranteed = guaranteed.tolist()
+    for r, (market_id, sel_ids, _, _) in enumerate(rows):
+        cols = np.flatnonzero(active[r]).tolist()
+        if any(stakes[r][c] < GREEN_MIN_STAKE for c in cols):
+            # Stake sotto il minimo: fissaggio e nuovo livello come calculate_green_book
+            results[market_id] = calculate_green_book(*books[market_id], commission=commission)
+            continue
+        hedges = {}
+        for c in cols:
+            sel_id = sel_ids[c]
             hedges[sel_id] = {
                 'selectionId': sel_id,
-                'side': 'LAY',
-                'stake': round(hedge_stake, 2),
-                'price': live_price,
-                'reducesProfit': round(excess_pnl, 2)
+                'side': 'BACK' if back_side[r][c] else 'LAY',
+                'stake': stakes[r][c],
+                'price': prices[r][c],
+                'pnlChange': changes[r][c]
             }
+        results[market_id] = (hedges, guaranteed[r])
     
-    # Profitto garantito netto
-    guaranteed = min_pnl * (1 - commission) if min_pnl > 0 else min_pnl
-    
-    logger.info(f"[GREEN BOOK] P&L by selection: {pnl}")
-    logger.info(f"[GREEN BOOK] Guaranteed profit: {guaranteed:.2f}, Hedges: {len(hedges)}")
-    
-    return hedges, round(guaranteed, 2)
+    logger.debug(f"[GREEN BOOK] Batch: {len(rows)} mercati")
+    return results
 
 
 # ==============================================================================
@@ -619,15 +1012,11 @@ class OrderManagerPro:
         self.profit_threshold = profit_threshold
         self.state_manager = ORDER_STATES
         self.guard = ReplaceGuard(min_interval, max_replaces)
-        self.bet_id_map: Dict[str, str] = {}
         self.history: List[Dict] = []
     
     def get_current_bet_id(self, original: str) -> str:
         """Segui catena mapping betId."""
-        current = original
-        while current in self.bet_id_map:
-            current = self.bet_id_map[current]
-        return current
+        return self.state_manager.resolve(original)
     
     def smart_replace(
         self,
@@ -656,6 +1045,70 @@ class OrderManagerPro:
         7. Fallback cancel+place
         8. Update state
         """
+        result, plan = self._prepare_replace(
+            bet_id, market_id, selection_id, side, current_price, best_price,
+            size_remaining, stake, total_stake, priority, min_ticks
+        )
+        if plan is None:
+            return result
+        
+        current_bet_id = plan['betId']
+        target_price = plan['targetPrice']
+        
+        # 6. Set status REPLACING
+        self.state_manager.set_status(current_bet_id, OrderStatus.REPLACING)
+        
+        logger.info(f"[REPLACE PRO] {side} {current_bet_id}: {current_price} -> {target_price} (delta +{result['deltaProfit']})")
+        
+        # 7. Try replaceOrders
+        report = {}
+        try:
+            response = self.client.replace_orders(
+                market_id=market_id,
+                bet_id=current_bet_id,
+                new_price=target_price
+            )
+            
+            reports = response.get('instructionReports', [])
+            report = reports[0] if reports else {}
+            if response.get('status') == 'SUCCESS':
+                return self._apply_replace_report(plan, result, report)
+            
+            logger.warning(f"[REPLACE PRO] Failed: {response.get('status')}")
+            
+        except Exception as e:
+            logger.error(f"[REPLACE PRO] Exception: {e}")
+        
+        # 8. Fallback: cancel+place, o solo place se la cancel e' gia avvenuta
+        self.state_manager.set_status(current_bet_id, OrderStatus.PLACED)
+        cancelled = report.get('cancelStatus') == 'SUCCESS'
+        return self._fallback(
+            market_id, selection_id, side, 
+            target_price, (report.get('sizeCancelled') or size_remaining) if cancelled else size_remaining,
+            current_bet_id, cancelled=cancelled
+        )
+    
+    def _prepare_replace(
+        self,
+        bet_id: str,
+        market_id: str,
+        selection_id: int,
+        side: str,
+        current_price: float,
+        best_price: float,
+        size_remaining: float,
+        stake: float,
+        total_stake: float,
+        priority: QueuePriority,
+        min_ticks: int
+    ) -> Tuple[Dict, Optional[Dict]]:
+        """
+        Check 1-5 di smart_replace (state, priority, tick, profit, guard)
+        senza chiamate API.
+        
+        Returns:
+            (result, plan) - plan e' None se il replace non va eseguito
+        """
         result = {
             'success': False,
             'action': None,
@@ -667,7 +1120,7 @@ class OrderManagerPro:
         }
         
         current_bet_id = self.get_current_bet_id(bet_id)
-        state = self.state_manager.get_or_create(
+        self.state_manager.get_or_create(
             current_bet_id,
             market_id=market_id,
             selection_id=selection_id,
@@ -681,7 +1134,7 @@ class OrderManagerPro:
         can_modify, reason = self.state_manager.can_modify(current_bet_id)
         if not can_modify:
             result['reason'] = f"State: {reason}"
-            return result
+            return result, None
         
         # 2. Applica priority
         target_price = apply_priority(best_price, side, priority)
@@ -701,7 +1154,7 @@ class OrderManagerPro:
         
         if not should:
             result['reason'] = reason
-            return result
+            return result, None
         
         result['deltaProfit'] = round(new_profit - old_profit, 2)
         
@@ -709,72 +1162,163 @@ class OrderManagerPro:
         can_replace, guard_reason = self.guard.can_replace(current_bet_id)
         if not can_replace:
             result['reason'] = f"Guard: {guard_reason}"
-            return result
+            return result, None
         
-        # 6. Set status REPLACING
-        self.state_manager.set_status(current_bet_id, OrderStatus.REPLACING)
+        plan = {
+            'betId': current_bet_id,
+            'marketId': market_id,
+            'selectionId': selection_id,
+            'side': side,
+            'currentPrice': current_price,
+            'targetPrice': target_price,
+            'sizeRemaining': size_remaining,
+            'stake': stake,
+            'newProfit': new_profit,
+        }
+        return result, plan
+    
+    def _apply_replace_report(self, plan: Dict, result: Dict, report: Dict) -> Dict:
+        """Aggiorna guard, stato, betId e log da un instruction report riuscito."""
+        current_bet_id = plan['betId']
+        target_price = plan['targetPrice']
+        self.guard.record(current_bet_id)
         
-        logger.info(f"[REPLACE PRO] {side} {current_bet_id}: {current_price} -> {target_price} (delta +{result['deltaProfit']})")
+        new_bet_id = report.get('newBetId')
+        if new_bet_id and new_bet_id != current_bet_id:
+            self.state_manager.record_replace(current_bet_id, new_bet_id)
+            result['newBetId'] = new_bet_id
+        else:
+            new_bet_id = None
         
-        # 7. Try replaceOrders
-        try:
-            response = self.client.replace_orders(
-                market_id=market_id,
+        # Update state
+        self.state_manager.update(
+            new_bet_id or current_bet_id,
+            current_price=target_price,
+            last_profit=plan['newProfit'],
+            status=OrderStatus.PLACED
+        )
+        
+        result['success'] = True
+        result['action'] = 'REPLACE'
+        result['reason'] = 'SUCCESS'
+        
+        if _bet_logger:
+            _bet_logger.log_order_replaced(
+                market_id=plan['marketId'],
+                selection_id=str(plan['selectionId']),
+                side=plan['side'],
+                old_stake=plan['stake'],
+                old_price=plan['currentPrice'],
+                new_stake=plan['stake'],
+                new_price=target_price,
                 bet_id=current_bet_id,
-                new_price=target_price
+                new_bet_id=new_bet_id
             )
+        
+        self._record(result)
+        return result
+    
+    def batch_smart_replace(
+        self,
+        orders: List[Dict],
+        live_prices: Dict[int, Dict],
+        priority: QueuePriority = QueuePriority.BACK,
+        min_ticks: int = 1
+    ) -> List[Dict]:
+        """
+        Replace intelligente di piu ordini, raggruppati per mercato.
+        
+        Flow:
+        1. Check di smart_replace su tutti gli ordini (nessuna chiamata API)
+        2. Una replaceOrders (replace_orders_batch) per mercato
+        3. Stato/guard/log aggiornati dai singoli report
+        4. Cancel+place solo per le istruzioni fallite
+        
+        Returns:
+            Lista risultati, nello stesso ordine di orders
+        """
+        results: List[Optional[Dict]] = [None] * len(orders)
+        by_market: Dict[str, List[Tuple[int, Dict, Dict]]] = {}
+        seen = set()
+        
+        for i, order in enumerate(orders):
+            sel_id = order.get('selectionId')
+            side = order.get('side', 'BACK')
             
-            if response.get('status') == 'SUCCESS':
-                self.guard.record(current_bet_id)
-                
-                reports = response.get('instructionReports', [])
-                new_bet_id = None
-                if reports:
-                    new_bet_id = reports[0].get('newBetId')
-                    if new_bet_id and new_bet_id != current_bet_id:
-                        self.bet_id_map[current_bet_id] = new_bet_id
-                        self.state_manager.record_replace(current_bet_id, new_bet_id)
-                        result['newBetId'] = new_bet_id
-                
-                # Update state
-                self.state_manager.update(
-                    new_bet_id or current_bet_id,
-                    current_price=target_price,
-                    last_profit=new_profit,
-                    status=OrderStatus.PLACED
-                )
-                
-                result['success'] = True
-                result['action'] = 'REPLACE'
-                result['reason'] = 'SUCCESS'
-                
-                if _bet_logger:
-                    _bet_logger.log_order_replaced(
-                        market_id=market_id,
-                        selection_id=str(selection_id),
-                        side=side,
-                        old_stake=stake,
-                        old_price=current_price,
-                        new_stake=stake,
-                        new_price=target_price,
-                        bet_id=current_bet_id,
-                        new_bet_id=new_bet_id
-                    )
-                
-                self._record(result)
-                return result
+            prices = live_prices.get(sel_id, {})
+            best = prices.get('back' if side == 'BACK' else 'lay')
             
-            logger.warning(f"[REPLACE PRO] Failed: {response.get('status')}")
+            if not best:
+                results[i] = {'success': False, 'reason': 'No live price'}
+                continue
             
+            result, plan = self._prepare_replace(
+                order.get('betId'),
+                order.get('marketId'),
+                sel_id,
+                side,
+                order.get('price', 0),
+                best,
+                order.get('sizeRemaining', 0),
+                order.get('stake', 0),
+                order.get('totalStake', order.get('stake', 0)),
+                priority,
+                min_ticks
+            )
+            if plan is not None and plan['betId'] in seen:
+                result['reason'] = 'Duplicate in batch'
+                plan = None
+            results[i] = result
+            if plan is not None:
+                seen.add(plan['betId'])
+                by_market.setdefault(plan['marketId'], []).append((i, result, plan))
+        
+        for market_id, items in by_market.items():
+            for start in range(0, len(items), MAX_REPLACE_INSTRUCTIONS):
+                chunk = items[start:start + MAX_REPLACE_INSTRUCTIONS]
+                for i, result, plan in self._replace_market_chunk(market_id, chunk):
+                    results[i] = result
+        
+        return results
+    
+    def _replace_market_chunk(self, market_id: str, chunk: List[Tuple[int, Dict, Dict]]):
+        """Una replace_orders_batch per chunk; fallback per ordine sui fallimenti."""
+        for _, _, plan in chunk:
+            self.state_manager.set_status(plan['betId'], OrderStatus.REPLACING)
+        
+        logger.info(f"[REPLACE PRO] Batch {market_id}: {len(chunk)} ordini in una replaceOrders")
+        
+        reports = []
+        try:
+            response = self.client.replace_orders_batch(market_id, [
+                {'betId': plan['betId'], 'newPrice': plan['targetPrice']}
+                for _, _, plan in chunk
+            ])
+            reports = response.get('instructionReports') or []
+            if response.get('status') != 'SUCCESS':
+                logger.warning(f"[REPLACE PRO] Batch {market_id} status: {response.get('status')}")
         except Exception as e:
-            logger.error(f"[REPLACE PRO] Exception: {e}")
+            logger.error(f"[REPLACE PRO] Batch {market_id} exception: {e}")
         
-        # 8. Fallback cancel+place
-        self.state_manager.set_status(current_bet_id, OrderStatus.PLACED)
-        return self._fallback(
-            market_id, selection_id, side, 
-            target_price, size_remaining, current_bet_id
-        )
+        by_bet_id = {r.get('originalBetId'): r for r in reports}
+        done = []
+        for i, result, plan in chunk:
+            report = by_bet_id.get(plan['betId'])
+            if report and report.get('status') == 'SUCCESS':
+                done.append((i, self._apply_replace_report(plan, result, report), plan))
+                continue
+            
+            # replaceOrders non annulla la cancel se la place fallisce (anche
+            # per colpa di un'altra istruzione del chunk): cancel gia avvenuta
+            # -> solo place del residuo cancellato
+            self.state_manager.set_status(plan['betId'], OrderStatus.PLACED)
+            cancelled = bool(report) and report.get('cancelStatus') == 'SUCCESS'
+            size = (report.get('sizeCancelled') or plan['sizeRemaining']) if cancelled else plan['sizeRemaining']
+            done.append((i, self._fallback(
+                market_id, plan['selectionId'], plan['side'],
+                plan['targetPrice'], size, plan['betId'], cancelled=cancelled
+            ), plan))
+        return done
     
     def _fallback(
         self,
@@ -783,9 +1327,10 @@ class OrderManagerPro:
         side: str,
         price: float,
         size: float,
-        original_bet_id: str
+        original_bet_id: str,
+        cancelled: bool = False
     ) -> Dict:
-        """Fallback cancel + place."""
+        """Fallback cancel + place (cancelled=True: ordine gia cancellato, solo place)."""
         result = {
             'success': False,
             'action': 'CANCEL_PLACE',
@@ -797,10 +1342,13 @@ class OrderManagerPro:
         
         try:
             # Cancel
-            cancel = self.client.cancel_orders(market_id, [original_bet_id])
-            if cancel.get('status') != 'SUCCESS':
-                result['reason'] = f"Cancel failed: {cancel.get('status')}"
-                return result
+            if cancelled:
+                result['action'] = 'PLACE'
+            else:
+                cancel = self.client.cancel_orders(market_id, [original_bet_id])
+                if cancel.get('status') != 'SUCCESS':
+                    result['reason'] = f"Cancel failed: {cancel.get('status')}"
+                    return result
             
             # Place
             place = self.client.place_bet(market_id, selection_id, side, price, round(size, 2))
@@ -808,7 +1356,6 @@ class OrderManagerPro:
             if place.get('status') == 'SUCCESS':
                 new_bet_id = place.get('betId')
                 if new_bet_id:
-                    self.bet_id_map[original_bet_id] = new_bet_id
                     self.state_manager.record_replace(original_bet_id, new_bet_id)
                     result['newBetId'] = new_bet_id
                 
@@ -839,7 +1386,7 @@ class OrderManagerPro:
         Args:
             market_id: ID mercato
             positions: Lista posizioni aperte
-            live_prices: Quote live {selectionId: price}
+            live_prices: Quote live {selectionId: price} o {selectionId: {'back', 'lay'}}
         
         Returns:
             Dict con risultato e profitto garantito
@@ -854,15 +1401,28 @@ class OrderManagerPro:
         hedges, guaranteed = calculate_green_book(positions, live_prices)
         result['guaranteedProfit'] = guaranteed
         
+        # Tutte le coperture vengono accodate insieme: la coda del client le
+        # unisce in un'unica placeOrders per il mercato
+        pending = []
         for sel_id, hedge in hedges.items():
             try:
-                place = self.client.place_bet(
+                future = self.client.submit_order(
                     market_id=market_id,
                     selection_id=sel_id,
                     side=hedge['side'],
                     price=hedge['price'],
                     size=hedge['stake']
                 )
+                pending.append((sel_id, hedge, future))
+            except Exception as e:
+                result['errors'].append({
+                    'selectionId': sel_id,
+                    'error': str(e)
+                })
+        
+        for sel_id, hedge, future in pending:
+            try:
+                place = future.result(timeout=ORDER_RESULT_TIMEOUT)
                 
                 if place.get('status') == 'SUCCESS':
                     result['hedges'].append({
@@ -873,7 +1433,7 @@ class OrderManagerPro:
                 else:
                     result['errors'].append({
                         'selectionId': sel_id,
-                        'error': place.get('status')
+                        'error': place.get('errorCode') or place.get('status')
                     })
                     
             except Exception as e:
@@ -888,6 +1448,85 @@ class OrderManagerPro:
         
         return result
     
+    def cross_market_hedge(
+        self,
+        book,
+        mode: str = 'equalize',
+        floor: float = 0.0,
+        markets: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        Copertura su tutti i mercati collegati di una partita.
+
+        Args:
+            book: ScorelineBook dell'evento (posizioni e prezzi stream)
+            mode: 'equalize' (P&L piatto) o 'floor' (nessun esito sotto floor)
+            floor: soglia per mode='floor'
+            markets: limita le coperture a questi mercati
+
+        Returns:
+            Dict con coperture piazzate, P&L peggiore atteso ed errori
+        """
+        plan = book.optimal_hedge(mode=mode, floor=floor, markets=markets)
+        result = {
+            'success': False,
+            'hedges': [],
+            'worstCase': plan['worstCase'],
+            'worstNet': plan['worstNet'],
+            'errors': []
+        }
+        if not plan['feasible']:
+            result['errors'].append({'error': f"Floor {floor:.2f} non raggiungibile"})
+            return result
+
+        # Accodate insieme: la coda del client raggruppa per mercato
+        pending = []
+        for hedge in plan['hedges']:
+            try:
+                future = self.client.submit_order(
+                    market_id=hedge['marketId'],
+                    selection_id=hedge['selectionId'],
+                    side=hedge['side'],
+                    price=hedge['price'],
+                    size=hedge['stake']
+                )
+                pending.append((hedge, future))
+            except Exception as e:
+                result['errors'].append({
+                    'marketId': hedge['marketId'],
+                    'selectionId': hedge['selectionId'],
+                    'error': str(e)
+                })
+
+        for hedge, future in pending:
+            try:
+                place = future.result(timeout=ORDER_RESULT_TIMEOUT)
+                if place.get('status') == 'SUCCESS':
+                    result['hedges'].append({
+                        **hedge,
+                        'betId': place.get('betId'),
+                        'status': 'SUCCESS'
+                    })
+                else:
+                    result['errors'].append({
+                        'marketId': hedge['marketId'],
+                        'selectionId': hedge['selectionId'],
+                        'error': place.get('errorCode') or place.get('status')
+                    })
+            except Exception as e:
+                result['errors'].append({
+                    'marketId': hedge['marketId'],
+                    'selectionId': hedge['selectionId'],
+                    'error': str(e)
+                })
+
+        result['success'] = len(result['errors']) == 0
+        logger.info(
+            f"[CROSS HEDGE] {mode}: {len(result['hedges'])}/{len(plan['hedges'])} coperture, "
+            f"worst {plan['worstBefore']:.2f} -> {plan['worstCase']:.2f}"
+        )
+        return result
+    
     def _record(self, result: Dict):
         """Registra nella history."""
         self.history.append({
@@ -904,7 +1543,6 @@ class OrderManagerPro:
     def reset(self):
         """Reset completo."""
         self.guard.reset()
-        self.bet_id_map.clear()
         self.history.clear()
 
 
@@ -932,32 +1570,4 @@ def batch_smart_replace(
     Returns:
         Lista risultati
     """
-    results = []
-    
-    for order in orders:
-        sel_id = order.get('selectionId')
-        side = order.get('side', 'BACK')
-        
-        prices = live_prices.get(sel_id, {})
-        best = prices.get('back' if side == 'BACK' else 'lay')
-        
-        if not best:
-            results.append({'success': False, 'reason': 'No live price'})
-            continue
-        
-        result = manager.smart_replace(
-            bet_id=order.get('betId'),
-            market_id=order.get('marketId'),
-            selection_id=sel_id,
-            side=side,
-            current_price=order.get('price', 0),
-            best_price=best,
-            size_remaining=order.get('sizeRemaining', 0),
-            stake=order.get('stake', 0),
-            total_stake=order.get('totalStake', order.get('stake', 0)),
-            priority=priority,
-            min_ticks=min_ticks
-        )
-        results.append(result)
-    
-    return results
+    return manager.batch_smart_replace(orders, live_prices, priority, min_ticks)
@@ -0,0 +1,245 @@
+"""
+Order Queue - Micro-batching per mercato degli ordini Pickfair
+
+Le istruzioni per lo stesso mercato che arrivano entro pochi millisecondi
+vengono unite in un'unica chiamata placeOrders (max 200 istruzioni per
+chiamata, limite Betfair). Ogni istruzione riceve la propria Future,
+risolta con il suo instruction report:
+
+    {'status', 'betId', 'placedDate', 'averagePriceMatched', 'sizeMatched',
+     'errorCode', 'customerRef'}
+
+Mercati diversi vengono inviati in parallelo su un piccolo pool di thread.
+
+placeOrders e' atomico: un'istruzione non valida fa fallire tutto il batch
+(ERROR_IN_ORDER sulle altre). Se il batch unisce piu chiamate submit_many,
+le chiamate colpevoli ricevono il proprio errore e le altre vengono
+reinviate ciascuna da sola, cosi' i chiamanti restano indipendenti.
+
+Con async_placement (order stream connesso) i batch di una sola chiamata
+partono con il piazzamento async di Betfair: le Future sono risolte dallo
+stream senza attendere il round trip sincrono.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCH_WINDOW_MS = 5.0        # finestra di raccolta per mercato
+MAX_INSTRUCTIONS = 200       # limite Betfair istruzioni per placeOrders
+DISPATCH_WORKERS = 4
+ERROR_IN_ORDER = 'ERROR_IN_ORDER'   # istruzione valida fallita per colpa del batch
+
+
+class _MarketBatch:
+    __slots__ = ('deadline', 'items')
+
+    def __init__(self, deadline: float):
+        self.deadline = deadline
+        self.items: List = []
+
+
+class MarketOrderQueue:
+    """
+    Coda ordini con micro-batch per mercato.
+
+    Il client deve esporre place_bets(market_id, instructions) con la
+    risposta standard {'status', 'customerRef', 'instructionReports'};
+    con async_placement anche place_bets(..., async_=True) con 'futures'.
+    """
+
+    def __init__(self, client, window_ms: float = BATCH_WINDOW_MS,
+                 max_batch: int = MAX_INSTRUCTIONS, workers: int = DISPATCH_WORKERS,
+                 async_placement: Optional[Callable[[], bool]] = None):
+        self.client = client
+        self.async_placement = async_placement
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._batches: Dict[str, _MarketBatch] = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='order-queue')
+        self._running = True
+        self._groups = 0            # id della chiamata submit_many (per lo split)
+        self.stats = {'instructions': 0, 'calls': 0, 'splits': 0, 'async_calls': 0}
+        self._thread = threading.Thread(target=self._run, name='MarketOrderQueue', daemon=True)
+        self._thread.start()
+
+    # ==============================
+    # API
+    # ==============================
+
+    def submit(self, market_id: str, selection_id: int, side: str,
+               price: float, size: float) -> Future:
+        """Accoda una istruzione LIMIT e ritorna la sua Future."""
+        return self.submit_many(market_id, [{
+            'selectionId': selection_id,
+            'side': side,
+            'price': price,
+            'size': size
+        }])[0]
+
+    def submit_many(self, market_id: str, instructions: List[Dict]) -> List[Future]:
+        """Accoda piu istruzioni dello stesso mercato (una Future ciascuna)."""
+        futures = []
+        ready = []
+        with self._cond:
+            # Controllo sotto lock: dopo il flush finale nessuna Future resta orfana
+            if not self._running:
+                raise RuntimeError("Order queue fermata")
+            self._groups += 1
+            group = self._groups
+            for inst in instructions:
+                future = Future()
+                futures.append(future)
+                batch = self._batches.get(market_id)
+                if batch is None:
+                    batch = self._batches[market_id] = _MarketBatch(time.monotonic() + self.window)
+                batch.items.append((inst, future, group))
+                if len(batch.items) >= self.max_batch:
+                    # Batch pieno: invio immediato senza attendere la finestra
+                    ready.append(self._batches.pop(market_id).items)
+            self._cond.notify()
+        for items in ready:
+            self._submit_dispatch(market_id, items)
+        return futures
+
+    def stop(self):
+        """Invia i batch pendenti e ferma la coda; le Future non inviate falliscono."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+        with self._cond:
+            leftover = [batch.items for batch in self._batches.values()]
+            self._batches.clear()
+        for items in leftover:
+            self._fail(items, RuntimeError("Order queue fermata"))
+        self._executor.shutdown(wait=False)
+
+    # ==============================
+    # FLUSH
+    # ==============================
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._batches:
+                    self._cond.wait()
+                now = time.monotonic()
+                if self._running:
+                    next_deadline = min(b.deadline for b in self._batches.values())
+                    if next_deadline > now:
+                        self._cond.wait(next_deadline - now)
+                        continue
+                due = [
+                    (market_id, batch.items)
+                    for market_id, batch in list(self._batches.items())
+                    if not self._running or batch.deadline <= now
+                ]
+                for market_id, _ in due:
+                    del self._batches[market_id]
+                running = self._running
+            for market_id, items in due:
+                self._submit_dispatch(market_id, items)
+            if not running and not self._batches:
+                return
+
+    def _submit_dispatch(self, market_id: str, items: List, split: bool = True):
+        try:
+            self._executor.submit(self._dispatch, market_id, items, split)
+        except RuntimeError as e:
+            # Executor gia chiuso da stop()
+            self._fail(items, e)
+
+    @staticmethod
+    def _fail(items: List, error: Exception):
+        for _, future, _ in items:
+            if not future.done():
+                future.set_exception(error)
+
+    def _dispatch(self, market_id: str, items: List, split: bool = True):
+        """Una chiamata placeOrders per batch; distribuisce i report alle Future."""
+        groups = {group for _, _, group in items}
+        # Async solo per una singola chiamata: un batch async fallito non si puo' dividere
+        use_async = len(groups) == 1 and self.async_placement is not None and self.async_placement()
+        with self._cond:
+            self.stats['calls'] += 1
+            self.stats['instructions'] += len(items)
+            if use_async:
+                self.stats['async_calls'] += 1
+        try:
+            if use_async:
+                response = self.client.place_bets(market_id, [inst for inst, _, _ in items], async_=True)
+                self._chain(items, response)
+                return
+            response = self.client.place_bets(market_id, [inst for inst, _, _ in items])
+        except Exception as e:
+            logger.error(f"[ORDER QUEUE] placeOrders {market_id} ({len(items)} istruzioni) fallito: {e}")
+            self._fail(items, e)
+            return
+
+        reports = response.get('instructionReports') or []
+        status = response.get('status', 'UNKNOWN')
+        if len(items) > 1:
+            logger.debug(f"[ORDER QUEUE] {market_id}: {len(items)} istruzioni in una chiamata ({status})")
+
+        if split and status == 'FAILURE' and len(groups) > 1:
+            self._split(market_id, items, reports, response)
+            return
+
+        for i, (_, future, _) in enumerate(items):
+            future.set_result(self._report(reports[i] if i < len(reports) else None, status, response))
+
+    @staticmethod
+    def _chain(items: List, response: Dict):
+        """Collega le Future async del client (risolte dallo stream) a quelle della coda."""
+        customer_ref = response.get('customerRef')
+
+        def forward(source: Future, target: Future):
+            if target.done():
+                return
+            error = source.exception()
+            if error is not None:
+                target.set_exception(error)
+                return
+            report = dict(source.result())
+            report.setdefault('errorCode', None)
+            report['customerRef'] = customer_ref
+            target.set_result(report)
+
+        for (_, future, _), source in zip(items, response.get('futures') or []):
+            source.add_done_callback(lambda done, target=future: forward(done, target))
+
+    @staticmethod
+    def _report(report: Optional[Dict], status: str, response: Dict) -> Dict:
+        report = dict(report) if report else {'status': status, 'betId': None, 'sizeMatched': 0}
+        report.setdefault('errorCode', response.get('errorCode'))
+        report['customerRef'] = response.get('customerRef')
+        return report
+
+    def _split(self, market_id: str, items: List, reports: List, response: Dict):
+        """
+        Batch fallito con piu chiamate unite: le chiamate con un errore
+        proprio lo ricevono, le altre vengono reinviate una per una.
+        Senza un colpevole identificabile (errore a livello di batch) si
+        reinviano tutte.
+        """
+        culprits = {
+            group for i, (_, _, group) in enumerate(items)
+            if i < len(reports) and (reports[i].get('errorCode') or ERROR_IN_ORDER) != ERROR_IN_ORDER
+        }
+        retry: Dict[int, List] = {}
+        for i, item in enumerate(items):
+            if item[2] in culprits:
+                item[1].set_result(self._report(reports[i] if i < len(reports) else None, 'FAILURE', response))
+            else:
+                retry.setdefault(item[2], []).append(item)
+        with self._cond:
+            self.stats['splits'] += 1
+        logger.info(f"[ORDER QUEUE] {market_id}: batch fallito, reinvio separato di {len(retry)} chiamate")
+        for group_items in retry.values():
+            self._dispatch(market_id, group_items, split=False)
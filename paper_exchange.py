@@ -0,0 +1,701 @@
+"""
+Paper Exchange - Exchange simulato sul ladder dello stream per Pickfair
+
+La simulazione registrava ogni scommessa come MATCHED al prezzo richiesto.
+PaperExchange invece abbina contro il ladder reale (stream live o replay):
+
+    piazzamento   match immediato sui livelli che incrociano il prezzo, al
+                  prezzo del livello e fino alla size visibile; il resto
+                  resta in coda al prezzo richiesto
+    coda          stake davanti a noi = size visibile al nostro prezzo
+                  all'ingresso; il volume scambiato (trd) a quel prezzo la
+                  consuma prima di riempire l'ordine, le cancellazioni
+                  altrui la riducono; scambi a prezzi peggiori per la
+                  controparte riempiono subito
+    cancel        totale o parziale (sizeReduction); replace = cancel del
+                  residuo + nuovo ordine al nuovo prezzo (coda persa)
+    lapse         ordini LAPSE non abbinati all'in-play e alla chiusura
+    settlement    runner WINNER/LOSER/REMOVED del marketDefinition,
+                  commissione sulla vincita netta del mercato
+
+L'interfaccia ricalca BetfairClient (place_bets, submit_order, cancel_orders,
+replace_orders, get_current_orders, get_account_funds) cosi' gli engine di
+trading girano sul paper exchange senza modifiche.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tick_ladder import is_valid_price
+
+logger = logging.getLogger(__name__)
+
+COMMISSION = 0.045            # Commissione Betfair Italia (4.5%)
+MIN_BET_SIZE = 0.01           # Size minima accettata (gli stake Betfair sono in centesimi)
+SIZE_EPS = 1e-9
+
+BACK = 'BACK'
+LAY = 'LAY'
+EXECUTABLE = 'EXECUTABLE'
+EXECUTION_COMPLETE = 'EXECUTION_COMPLETE'
+
+
+# ==============================================================================
+# ORDINE SIMULATO
+# ==============================================================================
+
+@dataclass
+class PaperOrder:
+    """Ordine sul paper exchange (stessi campi dell'ordine normalizzato)."""
+    bet_id: str
+    market_id: str
+    selection_id: int
+    side: str
+    price: float
+    size: float
+    persistence: str = 'LAPSE'
+    customer_ref: Optional[str] = None
+    size_matched: float = 0.0
+    matched_value: float = 0.0          # sum(size * prezzo) dei fill
+    size_cancelled: float = 0.0
+    size_lapsed: float = 0.0
+    queue_ahead: float = 0.0            # stake altrui davanti in coda al nostro prezzo
+    placed_at: float = field(default_factory=time.time)
+    sequence: int = 0
+
+    @property
+    def size_remaining(self) -> float:
+        remaining = self.size - self.size_matched - self.size_cancelled - self.size_lapsed
+        return round(remaining, 2) if remaining > SIZE_EPS else 0.0
+
+    @property
+    def average_price_matched(self) -> float:
+        return round(self.matched_value / self.size_matched, 4) if self.size_matched > 0 else 0.0
+
+    @property
+    def status(self) -> str:
+        return EXECUTABLE if self.size_remaining > 0 else EXECUTION_COMPLETE
+
+    @property
+    def liability(self) -> float:
+        """Esposizione massima riservata dall'ordine (size non cancellata/scaduta)."""
+        size = self.size - self.size_cancelled - self.size_lapsed
+        return size if self.side == BACK else size * (self.price - 1)
+
+    def fill(self, size: float, price: float) -> float:
+        size = min(size, self.size_remaining)
+        if size <= SIZE_EPS:
+            return 0.0
+        self.size_matched = round(self.size_matched + size, 2)
+        self.matched_value += size * price
+        return size
+
+    def to_dict(self) -> Dict:
+        """Forma normalizzata (come adapt_current_order_raw)."""
+        return {
+            'betId': self.bet_id,
+            'marketId': self.market_id,
+            'selectionId': self.selection_id,
+            'side': self.side,
+            'price': self.price,
+            'size': self.size,
+            'sizeMatched': self.size_matched,
+            'sizeRemaining': self.size_remaining,
+            'sizeCancelled': round(self.size_cancelled, 2),
+            'sizeLapsed': round(self.size_lapsed, 2),
+            'averagePriceMatched': self.average_price_matched,
+            'status': self.status,
+            'persistenceType': self.persistence,
+            'placedDate': datetime.fromtimestamp(self.placed_at, tz=timezone.utc).isoformat(),
+            'customerOrderRef': self.customer_ref
+        }
+
+
+class _RunnerBook:
+    """Ladder visibile di un runner e ordini simulati in coda."""
+
+    __slots__ = ('back', 'lay', 'traded', 'taken', 'orders')
+
+    def __init__(self):
+        self.back: List[List[float]] = []       # available to back (lay altrui), migliore prima
+        self.lay: List[List[float]] = []        # available to lay (back altrui), migliore prima
+        self.traded: Dict[float, float] = {}    # prezzo -> volume scambiato cumulato
+        self.taken: Dict[Tuple[str, float], float] = {}  # liquidita gia presa da noi per livello
+        self.orders: List[PaperOrder] = []      # ordini con residuo in coda
+
+    def visible(self, ladder: str, price: float) -> Optional[float]:
+        """Size visibile a un prezzo (None se il prezzo e' fuori dai livelli noti)."""
+        levels = self.back if ladder == BACK else self.lay
+        for level_price, size in levels:
+            if abs(level_price - price) < 1e-9:
+                return max(size - self.taken.get((ladder, level_price), 0.0), 0.0)
+        if levels and ((ladder == BACK and price > levels[-1][0]) or
+                       (ladder == LAY and price < levels[-1][0])):
+            return 0.0
+        return None
+
+
+# ==============================================================================
+# PAPER EXCHANGE
+# ==============================================================================
+
+class PaperExchange:
+    """
+    Exchange simulato alimentato da BetfairStream o da un replay.
+
+    Uso tipico:
+        exchange = PaperExchange(balance=1000.0, on_settle=callback)
+        exchange.attach_stream(stream)
+        exchange.place_bet(market_id, selection_id, 'BACK', 2.5, 10.0)
+        exchange.get_current_orders([market_id])
+    """
+
+    def __init__(self, commission: float = COMMISSION, balance: Optional[float] = None,
+                 on_order_change: Optional[Callable[[Dict], None]] = None,
+                 on_settle: Optional[Callable[[Dict], None]] = None):
+        self.commission = commission
+        self.balance = balance
+        self.on_order_change = on_order_change
+        self.on_settle = on_settle
+
+        self._books: Dict[Tuple[str, int], _RunnerBook] = {}
+        self._orders: Dict[str, PaperOrder] = {}
+        self._market_state: Dict[str, Dict] = {}
+        self._bet_ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._stream = None
+        self.settled: List[Dict] = []
+
+    # ==============================
+    # STREAM / REPLAY
+    # ==============================
+
+    def attach_stream(self, stream):
+        """Sottoscrive prezzi, volumi e marketDefinition di BetfairStream."""
+        self._stream = stream
+        stream.add_market_listener(self.on_market_update)
+        stream.add_definition_listener(self.on_market_definition)
+        logger.info("[PAPER] Paper exchange collegato allo stream mercati")
+
+    def detach_stream(self):
+        if self._stream is not None:
+            self._stream.remove_market_listener(self.on_market_update)
+            self._stream.remove_definition_listener(self.on_market_definition)
+            self._stream = None
+
+    def replay(self, messages: Iterable[Dict]) -> int:
+        """
+        Riproduce update registrati: dict runner come quelli dello stream
+        oppure {'market_id', 'market_definition'}.
+
+        Returns:
+            Numero di messaggi applicati
+        """
+        count = 0
+        for message in messages:
+            if 'market_definition' in message:
+                self.on_market_definition(message['market_id'], message['market_definition'])
+            else:
+                self.on_market_update(message)
+            count += 1
+        return count
+
+    def on_market_book(self, book: Dict):
+        """
+        Market book REST normalizzato (adapt_market_book_*), per il polling
+        senza stream: ladder dei runner e stato/esiti come marketDefinition.
+
+        Senza volume scambiato per prezzo gli ordini in coda si abbinano solo
+        quando il ladder li incrocia.
+        """
+        market_id = book['marketId']
+        for runner in book.get('runners') or []:
+            if runner.get('status', 'ACTIVE') == 'ACTIVE':
+                self.on_market_update({
+                    'market_id': market_id,
+                    'selection_id': runner['selectionId'],
+                    'back_prices': runner.get('back') or [],
+                    'lay_prices': runner.get('lay') or []
+                })
+        self.on_market_definition(market_id, {
+            'status': book.get('status'),
+            'inPlay': bool(book.get('inplay')),
+            'runners': [{'id': r['selectionId'], 'status': r.get('status')} for r in book.get('runners') or []]
+        })
+
+    def open_market_ids(self) -> List[str]:
+        """Mercati con ordini non ancora regolati."""
+        with self._lock:
+            return sorted({o.market_id for o in self._orders.values()})
+
+    def _book(self, market_id: str, selection_id: int) -> _RunnerBook:
+        key = (market_id, selection_id)
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = _RunnerBook()
+            # Base del volume cumulato dalla cache dello stream: il trd arriva
+            # come totale per prezzo, senza base conteremmo volume gia scambiato
+            cache = self._stream.get_market_cache(market_id) if self._stream else None
+            runner = (cache or {}).get('runners', {}).get(selection_id)
+            if runner:
+                book.traded = dict(runner.get('traded') or {})
+                self._set_ladder(book, BACK, runner.get('back') or [])
+                self._set_ladder(book, LAY, runner.get('lay') or [])
+        return book
+
+    def on_market_update(self, update: Dict):
+        """Listener BetfairStream: nuovo ladder e volume scambiato di un runner."""
+        market_id = update.get('market_id')
+        selection_id = update.get('selection_id')
+        if market_id is None or selection_id is None:
+            return
+        changed = []
+        with self._lock:
+            book = self._book(market_id, selection_id)
+            back = update.get('back_prices')
+            lay = update.get('lay_prices')
+            if back is None and update.get('back_price'):
+                back = [[update['back_price'], update.get('back_size') or 0.0]]
+            if lay is None and update.get('lay_price'):
+                lay = [[update['lay_price'], update.get('lay_size') or 0.0]]
+            if back is not None:
+                self._set_ladder(book, BACK, back)
+            if lay is not None:
+                self._set_ladder(book, LAY, lay)
+
+            for price, cumulative in update.get('traded') or []:
+                volume = cumulative - book.traded.get(price, 0.0)
+                book.traded[price] = cumulative
+                if volume > SIZE_EPS and book.orders:
+                    changed.extend(self._trade(book, price, volume))
+
+            if book.orders:
+                self._shrink_queues(book)
+                changed.extend(self._cross_resting(book))
+        self._notify(changed)
+
+    def _set_ladder(self, book: _RunnerBook, ladder: str, levels: List[List[float]]):
+        levels = [list(level) for level in levels if level[1] > 0]
+        levels.sort(key=lambda level: -level[0] if ladder == BACK else level[0])
+        if ladder == BACK:
+            book.back = levels
+        else:
+            book.lay = levels
+        # Liquidita presa da noi: resta sottratta finche' il livello esiste
+        prices = {level[0] for level in levels}
+        for key in [k for k in book.taken if k[0] == ladder and k[1] not in prices]:
+            del book.taken[key]
+
+    def _state(self, market_id: str) -> Dict:
+        """
+        Stato del mercato (status, inPlay) alla prima lettura.
+
+        L'exchange puo' nascere a stream gia avviato: senza la definizione in
+        cache un mercato gia in-play sembrerebbe passare in-play al primo
+        delta (lapse di tutti gli ordini) e si accetterebbero ordini su un
+        mercato sospeso.
+        """
+        state = self._market_state.get(market_id)
+        if state is None:
+            cache = self._stream.get_market_cache(market_id) if self._stream else None
+            definition = (cache or {}).get('definition') or {}
+            state = self._market_state[market_id] = {
+                'inPlay': bool(definition.get('inPlay')),
+                'status': definition.get('status') or (cache or {}).get('status') or 'OPEN'
+            }
+        return state
+
+    def on_market_definition(self, market_id: str, definition: Dict):
+        """Listener marketDefinition: lapse all'in-play, settlement alla chiusura."""
+        changed = []
+        with self._lock:
+            state = self._state(market_id)
+            status = definition.get('status') or state['status']
+            in_play = bool(definition.get('inPlay', state['inPlay']))
+
+            if in_play and not state['inPlay']:
+                changed.extend(self._lapse(market_id, persist_ok=True))
+            state['inPlay'] = in_play
+            state['status'] = status
+
+            if status == 'CLOSED' and not state.get('settled'):
+                results = {runner.get('id'): runner.get('status') for runner in definition.get('runners') or []}
+                if any(result in ('WINNER', 'PLACED') for result in results.values()):
+                    changed.extend(self._lapse(market_id, persist_ok=False))
+                    settlement = self._settle(market_id, results)
+                    state['settled'] = True
+                else:
+                    settlement = None
+            else:
+                settlement = None
+        self._notify(changed)
+        if settlement and self.on_settle:
+            try:
+                self.on_settle(settlement)
+            except Exception as e:
+                logger.error(f"[PAPER] Errore callback settlement: {e}")
+
+    # ==============================
+    # MATCHING
+    # ==============================
+
+    def _take(self, book: _RunnerBook, order: PaperOrder) -> bool:
+        """Match aggressivo sui livelli che incrociano il prezzo dell'ordine."""
+        ladder = BACK if order.side == BACK else LAY
+        levels = book.back if ladder == BACK else book.lay
+        filled = False
+        for level_price, size in levels:
+            crosses = level_price >= order.price if order.side == BACK else level_price <= order.price
+            if not crosses or order.size_remaining <= 0:
+                break
+            key = (ladder, level_price)
+            available = size - book.taken.get(key, 0.0)
+            if available <= SIZE_EPS:
+                continue
+            matched = order.fill(available, level_price)
+            if matched > 0:
+                book.taken[key] = book.taken.get(key, 0.0) + matched
+                filled = True
+        return filled
+
+    def _trade(self, book: _RunnerBook, price: float, volume: float) -> List[PaperOrder]:
+        """
+        Volume scambiato a `price`: consuma le code e riempie gli ordini.
+
+        Un ordine allo stesso prezzo si riempie dopo la coda davanti; uno a
+        prezzo migliore per la controparte (BACK sotto, LAY sopra) si riempie
+        subito, dal migliore, con un unico pool di volume.
+        """
+        changed = []
+        crossing_pool = volume
+        crossing = sorted(
+            (o for o in book.orders if (o.side == BACK and o.price < price) or
+             (o.side == LAY and o.price > price)),
+            key=lambda o: (o.price if o.side == BACK else -o.price, o.sequence)
+        )
+        for order in crossing:
+            if crossing_pool <= SIZE_EPS:
+                break
+            matched = order.fill(crossing_pool, order.price)
+            crossing_pool -= matched
+            if matched > 0:
+                changed.append(order)
+
+        for order in book.orders:
+            if abs(order.price - price) > 1e-9:
+                continue
+            ahead = min(order.queue_ahead, volume)
+            order.queue_ahead -= ahead
+            if volume - ahead > SIZE_EPS and order.fill(volume - ahead, order.price) > 0:
+                changed.append(order)
+        return changed
+
+    def _shrink_queues(self, book: _RunnerBook):
+        """Le cancellazioni altrui riducono la coda davanti (mai sotto la size visibile)."""
+        for order in book.orders:
+            # Un BACK in coda sta nel ladder available-to-lay e viceversa
+            visible = book.visible(LAY if order.side == BACK else BACK, order.price)
+            if visible is not None:
+                own_ahead = sum(o.size_remaining for o in book.orders
+                                if o.side == order.side and o.price == order.price and o.sequence < order.sequence)
+                order.queue_ahead = min(order.queue_ahead, visible + own_ahead)
+
+    def _cross_resting(self, book: _RunnerBook) -> List[PaperOrder]:
+        """Ordini in coda incrociati dal ladder: si abbinano al proprio prezzo."""
+        changed = []
+        for order in book.orders:
+            ladder = BACK if order.side == BACK else LAY
+            levels = book.back if ladder == BACK else book.lay
+            for level_price, size in levels:
+                crosses = level_price >= order.price if order.side == BACK else level_price <= order.price
+                if not crosses or order.size_remaining <= 0:
+                    break
+                key = (ladder, level_price)
+                available = size - book.taken.get(key, 0.0)
+                matched = order.fill(available, order.price) if available > SIZE_EPS else 0.0
+                if matched > 0:
+                    book.taken[key] = book.taken.get(key, 0.0) + matched
+                    changed.append(order)
+        self._prune(book)
+        return changed
+
+    def _prune(self, book: _RunnerBook):
+        book.orders = [o for o in book.orders if o.size_remaining > 0]
+
+    # ==============================
+    # API STILE BetfairClient
+    # ==============================
+
+    def _exposure(self) -> float:
+        return sum(o.liability for o in self._orders.values()
+                   if not self._market_state.get(o.market_id, {}).get('settled'))
+
+    def _report(self, order: Optional[PaperOrder], error: Optional[str] = None) -> Dict:
+        if order is None:
+            return {'status': 'FAILURE', 'betId': None, 'placedDate': None,
+                    'averagePriceMatched': None, 'sizeMatched': 0, 'errorCode': error}
+        return {
+            'status': 'SUCCESS',
+            'betId': order.bet_id,
+            'placedDate': order.to_dict()['placedDate'],
+            'averagePriceMatched': order.average_price_matched,
+            'sizeMatched': order.size_matched,
+            'errorCode': None
+        }
+
+    def _validate(self, market_id: str, side: str, price: float, size: float,
+                  reserved: float = 0.0) -> Optional[str]:
+        """Codice errore Betfair dell'istruzione (None se valida); reserved = liability gia impegnata nel batch."""
+        if side not in (BACK, LAY):
+            return 'INVALID_BET_TYPE'
+        if not is_valid_price(price):
+            return 'INVALID_ODDS'
+        if round(size, 2) < MIN_BET_SIZE:
+            return 'INVALID_BET_SIZE'
+        if self._state(market_id)['status'] in ('SUSPENDED', 'CLOSED'):
+            return 'MARKET_NOT_OPEN_FOR_BETTING'
+        liability = size if side == BACK else size * (price - 1)
+        if self.balance is not None and liability + reserved > self.balance - self._exposure() + SIZE_EPS:
+            return 'INSUFFICIENT_FUNDS'
+        return None
+
+    def _place(self, market_id: str, selection_id: int, side: str, price: float, size: float,
+               persistence: str = 'LAPSE', customer_ref: Optional[str] = None) -> Tuple[Optional[PaperOrder], Optional[str]]:
+        error = self._validate(market_id, side, price, size)
+        if error:
+            return None, error
+
+        sequence = next(self._bet_ids)
+        order = PaperOrder(
+            bet_id=f"P{sequence}", market_id=market_id, selection_id=selection_id,
+            side=side, price=price, size=round(size, 2), persistence=persistence,
+            customer_ref=customer_ref, sequence=sequence
+        )
+
+        book = self._book(market_id, selection_id)
+        self._take(book, order)
+        if order.size_remaining > 0:
+            # In coda dietro la size visibile e i nostri ordini gia a quel prezzo
+            visible = book.visible(LAY if side == BACK else BACK, price) or 0.0
+            own = sum(o.size_remaining for o in book.orders if o.side == side and o.price == price)
+            order.queue_ahead = visible + own
+            book.orders.append(order)
+        self._orders[order.bet_id] = order
+        logger.debug(f"[PAPER] {side} {size}@{price} sel={selection_id}: matched {order.size_matched}")
+        return order, None
+
+    def place_bets(self, market_id: str, instructions: List[Dict], customer_ref: Optional[str] = None) -> Dict:
+        """
+        placeOrders simulato: instructions [{'selectionId', 'side', 'price', 'size'}].
+
+        Atomico come Betfair: se un'istruzione non e' valida nessun ordine
+        viene piazzato e le altre riportano ERROR_IN_ORDER.
+        """
+        reports = []
+        changed = []
+        with self._lock:
+            errors = []
+            reserved = 0.0
+            for instruction in instructions:
+                side, price, size = instruction['side'], instruction['price'], instruction['size']
+                errors.append(self._validate(market_id, side, price, size, reserved))
+                reserved += size if side == BACK else size * (price - 1)
+            if any(errors):
+                failed = next(error for error in errors if error)
+                return {
+                    'status': 'FAILURE',
+                    'marketId': market_id,
+                    'customerRef': customer_ref,
+                    'errorCode': failed,
+                    'instructionReports': [self._report(None, error or 'ERROR_IN_ORDER') for error in errors]
+                }
+
+            for instruction in instructions:
+                order, error = self._place(
+                    market_id, instruction['selectionId'], instruction['side'],
+                    instruction['price'], instruction['size'],
+                    instruction.get('persistenceType', 'LAPSE'), customer_ref
+                )
+                reports.append(self._report(order, error))
+                if order is not None:
+                    changed.append(order)
+        self._notify(changed)
+        failed = [r['errorCode'] for r in reports if r['status'] != 'SUCCESS']
+        return {
+            'status': 'FAILURE' if failed else 'SUCCESS',
+            'marketId': market_id,
+            'customerRef': customer_ref,
+            'errorCode': failed[0] if failed else None,
+            'instructionReports': reports
+        }
+
+    def place_bet(self, market_id, selection_id, side, price, size, persistence_type='LAPSE'):
+        return self.place_bets(market_id, [{
+            'selectionId': selection_id, 'side': side, 'price': price,
+            'size': size, 'persistenceType': persistence_type
+        }])
+
+    def submit_order(self, market_id, selection_id, side, price, size) -> Future:
+        """Come BetfairClient.submit_order: Future con l'instruction report."""
+        future = Future()
+        future.set_result(self.place_bet(market_id, selection_id, side, price, size)['instructionReports'][0])
+        return future
+
+    def cancel_orders(self, market_id, bet_ids=None, size_reduction: Optional[float] = None) -> Dict:
+        """Cancella il residuo (o size_reduction) degli ordini del mercato."""
+        reports = []
+        changed = []
+        with self._lock:
+            if bet_ids:
+                targets = [self._orders.get(str(bet_id)) for bet_id in bet_ids]
+            else:
+                targets = [o for o in self._orders.values() if o.market_id == market_id]
+            for order in targets:
+                if order is None or order.market_id != market_id or order.size_remaining <= 0:
+                    if bet_ids:
+                        reports.append({'status': 'FAILURE', 'sizeCancelled': 0,
+                                        'errorCode': 'BET_TAKEN_OR_LAPSED'})
+                    continue
+                remaining = order.size_remaining
+                cancelled = remaining if size_reduction is None else min(size_reduction, remaining)
+                order.size_cancelled = round(order.size_cancelled + cancelled, 2)
+                self._prune(self._book(order.market_id, order.selection_id))
+                reports.append({'status': 'SUCCESS', 'sizeCancelled': round(cancelled, 2)})
+                changed.append(order)
+        self._notify(changed)
+        failed = any(r['status'] != 'SUCCESS' for r in reports)
+        return {'status': 'FAILURE' if failed else 'SUCCESS', 'instructionReports': reports}
+
+    def replace_orders(self, market_id, bet_id, new_price) -> Dict:
+        """Cancel del residuo + nuovo ordine al nuovo prezzo (nuovo betId, coda da capo)."""
+        with self._lock:
+            order = self._orders.get(str(bet_id))
+            if order is None or order.market_id != market_id or order.size_remaining <= 0:
+                return {'status': 'FAILURE', 'instructionReports': [{
+                    'status': 'FAILURE', 'originalBetId': bet_id, 'newBetId': None,
+                    'sizeCancelled': 0, 'sizeMatched': 0, 'averagePriceMatched': 0,
+                    'errorCode': 'BET_TAKEN_OR_LAPSED'
+                }]}
+            if not is_valid_price(new_price):
+                return {'status': 'FAILURE', 'instructionReports': [{
+                    'status': 'FAILURE', 'originalBetId': bet_id, 'newBetId': None,
+                    'sizeCancelled': 0, 'sizeMatched': 0, 'averagePriceMatched': 0,
+                    'errorCode': 'INVALID_ODDS'
+                }]}
+            remaining = order.size_remaining
+            order.size_cancelled = round(order.size_cancelled + remaining, 2)
+            self._prune(self._book(order.market_id, order.selection_id))
+            new_order, error = self._place(market_id, order.selection_id, order.side, new_price,
+                                           remaining, order.persistence, order.customer_ref)
+        self._notify([o for o in (order, new_order) if o is not None])
+        return {
+            'status': 'SUCCESS' if new_order else 'FAILURE',
+            'instructionReports': [{
+                'status': 'SUCCESS' if new_order else 'FAILURE',
+                'originalBetId': bet_id,
+                'newBetId': new_order.bet_id if new_order else None,
+                'sizeCancelled': remaining,
+                'sizeMatched': new_order.size_matched if new_order else 0,
+                'averagePriceMatched': new_order.average_price_matched if new_order else 0,
+                'errorCode': error
+            }]
+        }
+
+    def get_current_orders(self, market_ids=None, bet_ids=None) -> Dict:
+        """Ordini non ancora regolati, divisi come BetfairClient.get_current_orders."""
+        result = {'matched': [], 'unmatched': [], 'partiallyMatched': []}
+        wanted = {str(b) for b in bet_ids} if bet_ids else None
+        with self._lock:
+            for order in self._orders.values():
+                if market_ids and order.market_id not in market_ids:
+                    continue
+                if wanted is not None and order.bet_id not in wanted:
+                    continue
+                data = order.to_dict()
+                if order.size_remaining == 0 and order.size_matched > 0:
+                    result['matched'].append(data)
+                elif order.size_remaining > 0 and order.size_matched > 0:
+                    result['partiallyMatched'].append(data)
+                elif order.size_remaining > 0:
+                    result['unmatched'].append(data)
+        return result
+
+    def get_account_funds(self) -> Dict:
+        with self._lock:
+            exposure = self._exposure()
+            balance = self.balance or 0.0
+        return {'available': balance - exposure, 'exposure': -exposure, 'total': balance}
+
+    # ==============================
+    # LAPSE E SETTLEMENT
+    # ==============================
+
+    def _lapse(self, market_id: str, persist_ok: bool) -> List[PaperOrder]:
+        changed = []
+        for order in self._orders.values():
+            if order.market_id != market_id or order.size_remaining <= 0:
+                continue
+            if persist_ok and order.persistence == 'PERSIST':
+                continue
+            order.size_lapsed = round(order.size_lapsed + order.size_remaining, 2)
+            changed.append(order)
+        for (book_market, _), book in self._books.items():
+            if book_market == market_id:
+                self._prune(book)
+        return changed
+
+    def _settle(self, market_id: str, results: Dict[int, str]) -> Dict:
+        """Regola la parte abbinata; commissione sulla vincita netta del mercato."""
+        bets = {}
+        gross = 0.0
+        for order in [o for o in self._orders.values() if o.market_id == market_id]:
+            result = results.get(order.selection_id)
+            matched = order.size_matched
+            avg = order.average_price_matched
+            if result in ('WINNER', 'PLACED'):
+                profit = matched * (avg - 1) if order.side == BACK else -matched * (avg - 1)
+            elif result == 'LOSER':
+                profit = -matched if order.side == BACK else matched
+            else:
+                profit = 0.0        # REMOVED / non regolato: stake restituito
+            bets[order.bet_id] = round(profit, 2) + 0.0
+            gross += profit
+            del self._orders[order.bet_id]
+
+        commission = gross * self.commission if gross > 0 else 0.0
+        profit = round(gross - commission, 2)
+        if self.balance is not None:
+            self.balance += profit
+        settlement = {
+            'marketId': market_id,
+            'grossProfit': round(gross, 2),
+            'commission': round(commission, 2),
+            'profit': profit,
+            'winners': [sel_id for sel_id, result in results.items() if result in ('WINNER', 'PLACED')],
+            'bets': bets,
+            'settledDate': datetime.now(timezone.utc).isoformat()
+        }
+        self.settled.append(settlement)
+        for key in [k for k in self._books if k[0] == market_id]:
+            del self._books[key]
+        logger.info(f"[PAPER] Mercato {market_id} regolato: {len(bets)} ordini, P&L {profit:.2f}")
+        return settlement
+
+    def _notify(self, orders: List[PaperOrder]):
+        if not self.on_order_change or not orders:
+            return
+        seen = set()
+        for order in orders:
+            if order.bet_id in seen:
+                continue
+            seen.add(order.bet_id)
+            try:
+                self.on_order_change(order.to_dict())
+            except Exception as e:
+                logger.error(f"[PAPER] Errore callback ordine: {e}")
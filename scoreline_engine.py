@@ -0,0 +1,745 @@
+"""
+Scoreline Engine - P&L per esito su tutti i mercati di una partita
+
+Mappa i runner di Match Odds, Correct Score, Over/Under, BTTS e Primo
+Tempo su una griglia comune di risultati (gol casa/trasferta al primo
+tempo e al finale, ht <= ft). Ogni runner e' una colonna indicatrice
+della griglia; per ogni colonna si tiene
+
+    value = sum(sign * size * price)     stake = sum(sign * size)
+
+(sign +1 BACK, -1 LAY), quindi il P&L della partita per ogni esito e'
+
+    pnl = I @ value - sum(stake)
+
+Fill e prezzi dello stream aggiornano il vettore in modo incrementale
+(O(esiti) per fill, O(1) per tick); recompute() rifa' il prodotto intero.
+
+optimal_hedge() cerca le coperture piu economiche su tutti i mercati
+della partita per rendere il P&L piatto (minimi quadrati non negativi) o
+per garantire un minimo su ogni esito (LP), lavorando sulle righe distinte
+della griglia: abbastanza veloce da rieseguirlo ad ogni update prezzi.
+"""
+
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+logger = logging.getLogger(__name__)
+
+MAX_GOALS = 7                 # gol massimi per squadra al finale nella griglia
+INITIAL_COLUMNS = 64
+
+DRAW_NAMES = ('the draw', 'draw', 'pareggio', 'x')
+YES_NAMES = ('yes', 'si', 'sì', 'gg', 'goal')
+NO_NAMES = ('no', 'ng', 'no goal', 'nogoal')
+
+_SCORE_RE = re.compile(r'^\s*(\d+)\s*-\s*(\d+)\s*$')
+_LINE_RE = re.compile(r'(\d+(?:\.\d+)?)')
+
+# Hedge cross-mercato
+HEDGE_MIN_STAKE = 1.0         # stake minimo Betfair per una copertura
+HEDGE_STAKE_COST = 0.001      # costo per unita di stake anche a spread nullo
+HEDGE_COST_WEIGHT = 1.0       # peso del costo contro la piattezza (equalize)
+HEDGE_RIDGE = 1e-9            # regolarizzazione numerica (colonne collineari)
+HEDGE_MAX_PIVOTS = 2000       # iterazioni max di NNLS (equalize) e simplesso (floor)
+HEDGE_EPS = 1e-9
+
+
+# ==============================================================================
+# GRIGLIA RISULTATI
+# ==============================================================================
+
+def build_scoreline_grid(max_goals: int = MAX_GOALS):
+    """
+    Tutti gli esiti (ht_home, ht_away, ft_home, ft_away) con ht <= ft.
+
+    Returns:
+        Quattro array int della stessa lunghezza
+    """
+    per_team = [(ht, ft) for ft in range(max_goals + 1) for ht in range(ft + 1)]
+    ht_home, ft_home, ht_away, ft_away = [], [], [], []
+    for h_ht, h_ft in per_team:
+        for a_ht, a_ft in per_team:
+            ht_home.append(h_ht)
+            ft_home.append(h_ft)
+            ht_away.append(a_ht)
+            ft_away.append(a_ft)
+    return (np.array(ht_home), np.array(ht_away), np.array(ft_home), np.array(ft_away))
+
+
+def _goal_line(market_type: str, runner_name: str) -> Optional[float]:
+    """Linea O/U dal nome runner ('Over 2.5 Goals') o dal tipo (OVER_UNDER_25)."""
+    match = _LINE_RE.search(runner_name)
+    if match:
+        return float(match.group(1))
+    digits = market_type.rsplit('_', 1)[-1]
+    if digits.isdigit():
+        return int(digits) / 10.0
+    return None
+
+
+def _result_mask(home, away, runner: Dict, home_name: Optional[str], away_name: Optional[str]):
+    """Runner 1X2: casa, trasferta o pareggio (per nome o sortPriority)."""
+    name = (runner.get('runnerName') or '').strip().lower()
+    if name in DRAW_NAMES:
+        return home == away
+    if home_name and name == home_name.lower():
+        return home > away
+    if away_name and name == away_name.lower():
+        return away > home
+    priority = runner.get('sortPriority')
+    if priority == 1:
+        return home > away
+    if priority == 2:
+        return away > home
+    return None
+
+
+def _score_mask(home, away, name: str, quoted: List[Tuple[int, int]]):
+    """Runner risultato esatto, compresi 'Any Other ...' / 'Any Unquoted'."""
+    match = _SCORE_RE.match(name)
+    if match:
+        return (home == int(match.group(1))) & (away == int(match.group(2)))
+
+    listed = np.zeros(home.shape, dtype=bool)
+    for h, a in quoted:
+        listed |= (home == h) & (away == a)
+    lowered = name.lower()
+    if 'home' in lowered:
+        return ~listed & (home > away)
+    if 'away' in lowered:
+        return ~listed & (away > home)
+    if 'draw' in lowered:
+        return ~listed & (home == away)
+    if 'unquoted' in lowered or 'other' in lowered:
+        return ~listed
+    return None
+
+
+# ==============================================================================
+# SOLVER HEDGE
+# ==============================================================================
+#
+# Una copertura di stake s sul runner j sposta il P&L per esito di
+#
+#     BACK a prezzo b:  s * (b * I_j - 1)      LAY a prezzo l:  s * (1 - l * I_j)
+#
+# equalize: minimi quadrati non negativi sul P&L centrato (scarto dalla media)
+#           + costo lineare, che tra coperture equivalenti (es. Match Odds
+#           contro Correct Score) sceglie le piu economiche.
+# floor:    LP  min cost @ x  con  A x >= floor - base, x >= 0, risolto sul
+#           duale (max r @ u, A^T u <= cost, u >= 0): con costi positivi la
+#           base di slack e' gia ammissibile, niente fase I.
+
+def _nnls(gram, rhs, max_iterations: int):
+    """
+    Active set di Lawson-Hanson per  min 1/2 x^T G x - h^T x  con x >= 0
+    (G definita positiva).
+    """
+    k = len(rhs)
+    x = np.zeros(k)
+    passive = np.zeros(k, dtype=bool)
+    rejected = np.zeros(k, dtype=bool)
+    gradient = rhs.copy()
+    iterations = 0
+
+    while iterations < max_iterations:
+        candidates = np.where(passive | rejected, -np.inf, gradient)
+        j = int(candidates.argmax())
+        if candidates[j] <= HEDGE_EPS:
+            break
+        passive[j] = True
+        while iterations < max_iterations:
+            iterations += 1
+            cols = np.flatnonzero(passive)
+            z = np.zeros(k)
+            z[cols] = np.linalg.solve(gram[np.ix_(cols, cols)], rhs[cols])
+            if (z[cols] > 0).all():
+                x = z
+                break
+            # Passo verso z fermandosi sul primo stake che si azzera
+            blocking = cols[z[cols] <= 0]
+            step = x[blocking] - z[blocking]
+            alpha = float(np.min(np.where(step > 0, x[blocking] / np.where(step > 0, step, 1.0), 0.0)))
+            x = x + alpha * (z - x)
+            passive &= x > HEDGE_EPS
+            x[~passive] = 0.0
+        # Colonna entrata e subito uscita (errore numerico): non riprovarla
+        # finche' l'insieme attivo non cambia davvero
+        if passive[j]:
+            rejected[:] = False
+        else:
+            rejected[j] = True
+        gradient = rhs - gram @ x
+    return x, iterations
+
+
+def _equalize_hedge(A, base, cost, weight: float):
+    """
+    min 1/2 ||centrato(base + A x)||^2 + weight * cost @ x,  x >= 0
+
+    Il costo lineare tiene la soluzione sparsa (poche coperture, le piu
+    economiche); colonne scalate a norma unitaria per il condizionamento.
+
+    Returns:
+        (stake per candidato, iterazioni)
+    """
+    centered = A - A.mean(axis=0)
+    scale = np.linalg.norm(centered, axis=0)
+    scale[scale <= 0] = 1.0
+    centered /= scale
+    gram = centered.T @ centered + HEDGE_RIDGE * np.eye(A.shape[1])
+    rhs = centered.T @ (base.mean() - base) - weight * cost / scale
+    x, iterations = _nnls(gram, rhs, HEDGE_MAX_PIVOTS)
+    return x / scale, iterations
+
+
+def _floor_hedge(A, target, cost):
+    """
+    Returns:
+        (stake per candidato o None se il floor non e' raggiungibile, pivot)
+    """
+    m, k = A.shape
+    tableau = np.zeros((k + 1, m + k + 1))
+    tableau[:k, :m] = A.T
+    tableau[:k, m:m + k] = np.eye(k)
+    tableau[:k, -1] = cost
+    tableau[-1, :m] = -target
+    basis = list(range(m, m + k))
+
+    bland = False
+    stalled = 0
+    objective = 0.0
+    for pivots in range(HEDGE_MAX_PIVOTS):
+        reduced = tableau[-1, :-1]
+        if bland:
+            candidates = np.flatnonzero(reduced < -HEDGE_EPS)
+            if len(candidates) == 0:
+                break
+            j = int(candidates[0])
+        else:
+            j = int(reduced.argmin())
+            if reduced[j] >= -HEDGE_EPS:
+                break
+
+        column = tableau[:-1, j]
+        positive = np.flatnonzero(column > HEDGE_EPS)
+        if len(positive) == 0:
+            return None, pivots
+        ratios = tableau[positive, -1] / column[positive]
+        best = ratios.min()
+        ties = positive[ratios <= best + HEDGE_EPS]
+        i = int(min(ties, key=lambda row: basis[row]))
+
+        tableau[i] /= tableau[i, j]
+        factors = tableau[:, j].copy()
+        factors[i] = 0.0
+        tableau -= np.outer(factors, tableau[i])
+        basis[i] = j
+
+        # Pivot degeneri ripetuti: passa a Bland (niente cicli)
+        if tableau[-1, -1] <= objective + HEDGE_EPS:
+            stalled += 1
+            bland = bland or stalled > k
+        else:
+            stalled = 0
+        objective = tableau[-1, -1]
+    else:
+        logger.warning("[SCORELINE] Hedge floor: limite pivot raggiunto")
+
+    # Prezzi duali dei vincoli A^T u <= cost = stake del primale
+    return np.maximum(tableau[-1, m:m + k], 0.0), pivots
+
+
+# ==============================================================================
+# SCORELINE BOOK
+# ==============================================================================
+
+class ScorelineBook:
+    """
+    Esposizione di una partita su tutti i mercati collegati.
+
+    Uso tipico:
+        book = ScorelineBook(event_id)
+        book.add_market(market_id, 'MATCH_ODDS', runners, home='Inter', away='Milan')
+        book.attach_stream(stream)
+        book.apply_orders(current_orders)      # ad ogni refresh ordini
+        book.pnl(), book.worst_case(), book.mark_to_market()
+    """
+
+    def __init__(self, event_id: Optional[str] = None, max_goals: int = MAX_GOALS,
+                 commission: float = 4.5):
+        if not HAS_NUMPY:
+            raise RuntimeError("ScorelineBook richiede NumPy")
+        self.event_id = event_id
+        self.commission_mult = 1 - (commission / 100.0)
+        self.ht_home, self.ht_away, self.ft_home, self.ft_away = build_scoreline_grid(max_goals)
+        self.max_goals = max_goals
+        self.n_outcomes = len(self.ft_home)
+
+        self._columns: Dict[Tuple[str, int], int] = {}
+        self._column_keys: List[Tuple[str, int]] = []
+        self._markets: Dict[str, List[int]] = {}
+        self._indicator = np.zeros((self.n_outcomes, INITIAL_COLUMNS))
+        self._value = np.zeros(INITIAL_COLUMNS)
+        self._stake = np.zeros(INITIAL_COLUMNS)
+        self._back = np.full(INITIAL_COLUMNS, np.nan)
+        self._lay = np.full(INITIAL_COLUMNS, np.nan)
+        self._pnl = np.zeros(self.n_outcomes)
+
+        # betId -> (colonna, sign, size matchata, valore matchato) gia applicati
+        self._bets: Dict[str, Tuple[int, int, float, float]] = {}
+        self._lock = threading.RLock()
+        self._stream = None
+        self.version = 0
+
+        # Struttura colonne (cambia solo con add_market) e cache per l'hedge
+        self._structure = 0
+        self._atom_cache = None
+
+    # ==============================
+    # MERCATI
+    # ==============================
+
+    def _masks_for(self, market_type: str, runners: List[Dict],
+                   home: Optional[str], away: Optional[str]) -> Dict[int, 'np.ndarray']:
+        """Maschere della griglia per ogni runner mappabile del mercato."""
+        code = (market_type or '').upper()
+        masks = {}
+
+        if code in ('MATCH_ODDS', 'HALF_TIME'):
+            h, a = (self.ft_home, self.ft_away) if code == 'MATCH_ODDS' else (self.ht_home, self.ht_away)
+            for runner in runners:
+                mask = _result_mask(h, a, runner, home, away)
+                if mask is not None:
+                    masks[runner['selectionId']] = mask
+
+        elif code in ('CORRECT_SCORE', 'HALF_TIME_SCORE'):
+            h, a = (self.ft_home, self.ft_away) if code == 'CORRECT_SCORE' else (self.ht_home, self.ht_away)
+            names = [(r['selectionId'], (r.get('runnerName') or '').strip()) for r in runners]
+            quoted = [
+                (int(m.group(1)), int(m.group(2)))
+                for m in (_SCORE_RE.match(n) for _, n in names) if m
+            ]
+            for selection_id, name in names:
+                mask = _score_mask(h, a, name, quoted)
+                if mask is not None:
+                    masks[selection_id] = mask
+
+        elif code.startswith('OVER_UNDER') or code.startswith('FIRST_HALF_GOALS'):
+            if code.startswith('OVER_UNDER'):
+                goals = self.ft_home + self.ft_away
+            else:
+                goals = self.ht_home + self.ht_away
+            for runner in runners:
+                name = (runner.get('runnerName') or '').lower()
+                line = _goal_line(code, name)
+                if line is None:
+                    continue
+                if name.startswith('over'):
+                    masks[runner['selectionId']] = goals > line
+                elif name.startswith('under'):
+                    masks[runner['selectionId']] = goals < line
+
+        elif code == 'BOTH_TEAMS_TO_SCORE':
+            both = (self.ft_home > 0) & (self.ft_away > 0)
+            for runner in runners:
+                name = (runner.get('runnerName') or '').strip().lower()
+                if name in YES_NAMES:
+                    masks[runner['selectionId']] = both
+                elif name in NO_NAMES:
+                    masks[runner['selectionId']] = ~both
+
+        return masks
+
+    def add_market(self, market_id: str, market_type: str, runners: List[Dict],
+                   home: Optional[str] = None, away: Optional[str] = None) -> int:
+        """
+        Registra i runner di un mercato come colonne della griglia.
+
+        Args:
+            runners: [{'selectionId', 'runnerName', 'sortPriority'}]
+            home, away: nomi squadre per riconoscere i runner 1X2
+
+        Returns:
+            Numero di runner mappati
+        """
+        masks = self._masks_for(market_type, runners, home, away)
+        if not masks:
+            logger.debug(f"[SCORELINE] Mercato {market_id} ({market_type}) non mappabile")
+            return 0
+
+        with self._lock:
+            remapped = False
+            for selection_id, mask in masks.items():
+                key = (market_id, selection_id)
+                col = self._columns.get(key)
+                if col is None:
+                    col = self._new_column(key)
+                else:
+                    remapped = remapped or self._value[col] != 0
+                self._indicator[:, col] = mask
+            if remapped:
+                self.recompute()
+            self._structure += 1
+            self.version += 1
+        logger.info(f"[SCORELINE] {market_type} {market_id}: {len(masks)}/{len(runners)} runner mappati")
+        return len(masks)
+
+    def _new_column(self, key: Tuple[str, int]) -> int:
+        col = len(self._column_keys)
+        if col >= self._value.shape[0]:
+            grow = self._value.shape[0]
+            self._indicator = np.hstack([self._indicator, np.zeros((self.n_outcomes, grow))])
+            self._value = np.concatenate([self._value, np.zeros(grow)])
+            self._stake = np.concatenate([self._stake, np.zeros(grow)])
+            self._back = np.concatenate([self._back, np.full(grow, np.nan)])
+            self._lay = np.concatenate([self._lay, np.full(grow, np.nan)])
+        self._columns[key] = col
+        self._column_keys.append(key)
+        self._markets.setdefault(key[0], []).append(col)
+        return col
+
+    def has_runner(self, market_id: str, selection_id: int) -> bool:
+        return (market_id, selection_id) in self._columns
+
+    # ==============================
+    # FILL E ORDINI
+    # ==============================
+
+    def _apply(self, col: int, sign: int, size: float, value: float):
+        """Aggiorna colonna e P&L incrementale per un delta matchato."""
+        signed_value = sign * value
+        signed_size = sign * size
+        self._value[col] += signed_value
+        self._stake[col] += signed_size
+        self._pnl += self._indicator[:, col] * signed_value
+        self._pnl -= signed_size
+        self.version += 1
+
+    def add_fill(self, market_id: str, selection_id: int, side: str,
+                 price: float, size: float) -> bool:
+        """Aggiunge una quantita matchata (fill) a prezzo dato."""
+        col = self._columns.get((market_id, selection_id))
+        if col is None or size <= 0:
+            return False
+        with self._lock:
+            self._apply(col, 1 if side == 'BACK' else -1, size, size * price)
+        return True
+
+    def apply_orders(self, orders: List[Dict]) -> int:
+        """
+        Applica ordini normalizzati (listCurrentOrders / order stream).
+
+        Solo la variazione di sizeMatched rispetto all'ultima chiamata viene
+        aggiunta, al valore sizeMatched * averagePriceMatched.
+
+        Returns:
+            Numero di ordini con nuovi fill
+        """
+        changed = 0
+        with self._lock:
+            for order in orders:
+                col = self._columns.get((order.get('marketId'), order.get('selectionId')))
+                if col is None:
+                    continue
+                bet_id = str(order.get('betId'))
+                size = order.get('sizeMatched') or 0.0
+                value = size * (order.get('averagePriceMatched') or 0.0)
+                sign = 1 if order.get('side') == 'BACK' else -1
+                _, _, old_size, old_value = self._bets.get(bet_id, (col, sign, 0.0, 0.0))
+                if size == old_size and value == old_value:
+                    continue
+                self._apply(col, sign, size - old_size, value - old_value)
+                self._bets[bet_id] = (col, sign, size, value)
+                changed += 1
+        return changed
+
+    # ==============================
+    # PREZZI (STREAM)
+    # ==============================
+
+    def update_price(self, market_id: str, selection_id: int,
+                     back: Optional[float], lay: Optional[float]) -> bool:
+        col = self._columns.get((market_id, selection_id))
+        if col is None:
+            return False
+        self._back[col] = back if back else np.nan
+        self._lay[col] = lay if lay else np.nan
+        return True
+
+    def on_market_update(self, update: Dict):
+        """Listener per BetfairStream.add_market_listener (un runner per update)."""
+        self.update_price(
+            update.get('market_id'), update.get('selection_id'),
+            update.get('back_price'), update.get('lay_price')
+        )
+
+    def attach_stream(self, stream):
+        """Sottoscrive il book agli update mercato di BetfairStream."""
+        self._stream = stream
+        stream.add_market_listener(self.on_market_update)
+        logger.info(f"[SCORELINE] Evento {self.event_id} sottoscritto allo stream mercati")
+
+    def detach_stream(self):
+        """Annulla la sottoscrizione allo stream."""
+        if self._stream is not None:
+            self._stream.remove_market_listener(self.on_market_update)
+            self._stream = None
+
+    # ==============================
+    # P&L
+    # ==============================
+
+    def _used(self) -> int:
+        return len(self._column_keys)
+
+    def recompute(self) -> 'np.ndarray':
+        """Prodotto completo I @ value - sum(stake) (riallinea l'incrementale)."""
+        with self._lock:
+            n = self._used()
+            self._pnl = self._indicator[:, :n] @ self._value[:n] - self._stake[:n].sum()
+            return self._pnl.copy()
+
+    def pnl(self, net: bool = False) -> 'np.ndarray':
+        """
+        P&L della partita per ogni esito della griglia.
+
+        net=True applica la commissione sulla vincita netta di ogni mercato.
+        """
+        with self._lock:
+            if not net:
+                return self._pnl.copy()
+            return self._net_pnl(self._indicator, self._value, self._stake)
+
+    def _net_pnl(self, indicator, value, stake) -> 'np.ndarray':
+        """P&L con commissione applicata alla vincita netta di ogni mercato."""
+        total = np.zeros(indicator.shape[0])
+        for cols in self._markets.values():
+            market = indicator[:, cols] @ value[cols] - stake[cols].sum()
+            total += np.where(market > 0, market * self.commission_mult, market)
+        return total
+
+    def worst_case(self, net: bool = False) -> float:
+        return float(self.pnl(net).min())
+
+    def best_case(self, net: bool = False) -> float:
+        return float(self.pnl(net).max())
+
+    def pnl_by_score(self, net: bool = False) -> 'np.ndarray':
+        """Matrice (gol casa x gol trasferta) del P&L peggiore sui parziali del primo tempo."""
+        values = self.pnl(net)
+        size = self.max_goals + 1
+        grid = np.full((size, size), np.inf)
+        np.minimum.at(grid, (self.ft_home, self.ft_away), values)
+        return grid
+
+    def mark_to_market(self) -> Dict:
+        """
+        Valore se ogni runner venisse chiuso ora ai prezzi dello stream.
+
+        Chiudere la colonna j (value v, stake c) al prezzo q costa h = v / q
+        di stake opposto (LAY se v > 0 al prezzo lay, BACK altrimenti) e lascia
+        h - c su ogni esito. Colonne senza prezzo restano aperte.
+        """
+        with self._lock:
+            n = self._used()
+            value = self._value[:n]
+            stake = self._stake[:n]
+            price = np.where(value > 0, self._lay[:n], self._back[:n])
+            open_cols = value != 0
+            priced = open_cols & np.isfinite(price) & (price > 1.0)
+            closed = np.where(priced, value / np.where(priced, price, 1.0) - stake, 0.0)
+            unpriced = open_cols & ~priced
+            return {
+                'value': round(float(closed.sum()), 2),
+                'byMarket': {
+                    market_id: round(float(closed[cols].sum()), 2)
+                    for market_id, cols in self._markets.items()
+                },
+                'unpricedRunners': [self._column_keys[i] for i in np.flatnonzero(unpriced)]
+            }
+
+    def exposure(self) -> Dict:
+        """Riepilogo per UI/log."""
+        values = self.pnl()
+        worst = int(values.argmin())
+        return {
+            'eventId': self.event_id,
+            'worstCase': round(float(values[worst]), 2),
+            'bestCase': round(float(values.max()), 2),
+            'worstScore': (int(self.ht_home[worst]), int(self.ht_away[worst]),
+                           int(self.ft_home[worst]), int(self.ft_away[worst])),
+            'runners': self._used(),
+            'markets': len(self._markets),
+            'bets': len(self._bets)
+        }
+
+    # ==============================
+    # HEDGE CROSS-MERCATO
+    # ==============================
+
+    def _atoms(self):
+        """Righe distinte della matrice indicatrice: gli esiti che nessun mercato distingue hanno lo stesso P&L."""
+        if self._atom_cache is None or self._atom_cache[0] != self._structure:
+            n = self._used()
+            rows, first = np.unique(self._indicator[:, :n] > 0, axis=0, return_index=True)
+            self._atom_cache = (self._structure, rows.astype(float), first)
+        return self._atom_cache[1], self._atom_cache[2]
+
+    def optimal_hedge(self, mode: str = 'equalize', floor: float = 0.0,
+                      markets: Optional[List[str]] = None,
+                      min_stake: float = HEDGE_MIN_STAKE) -> Dict:
+        """
+        Coperture piu economiche su tutti i mercati della partita.
+
+        Ogni runner prezzato offre un BACK al prezzo back e un LAY al prezzo
+        lay dello stream; il costo di una copertura e' lo spread pagato
+        rispetto al mid piu HEDGE_STAKE_COST per unita di stake.
+
+        Args:
+            mode: 'equalize' (P&L il piu piatto possibile su tutti gli esiti) o
+                  'floor' (nessun esito sotto `floor` al minimo costo)
+            markets: limita le coperture a questi mercati (default tutti)
+
+        Returns:
+            Dict con hedges [{'marketId', 'selectionId', 'side', 'price', 'stake'}],
+            P&L peggiore/migliore prima e dopo (lordo e netto) e costo stimato
+        """
+        if mode not in ('equalize', 'floor'):
+            raise ValueError(f"Modalita hedge non valida: {mode}")
+
+        with self._lock:
+            n = self._used()
+            rows, first = self._atoms()
+            base = self._pnl[first]
+            back = self._back[:n].copy()
+            lay = self._lay[:n].copy()
+            value = self._value[:n].copy()
+            stake = self._stake[:n].copy()
+            keys = list(self._column_keys)
+            allowed = np.ones(n, dtype=bool)
+            if markets is not None:
+                allowed[:] = False
+                for market_id in markets:
+                    allowed[self._markets.get(market_id, [])] = True
+
+        back_ok = allowed & np.isfinite(back) & (back > 1.0)
+        lay_ok = allowed & np.isfinite(lay) & (lay > 1.0)
+        back = np.where(back_ok, back, np.nan)
+        lay = np.where(lay_ok, lay, np.nan)
+
+        # Spread pagato rispetto al mid (zero se manca uno dei due lati)
+        both = back_ok & lay_ok
+        mid = np.where(both, (np.nan_to_num(back) + np.nan_to_num(lay)) / 2.0, 1.0)
+        back_cost = np.where(both, np.maximum(1.0 - np.nan_to_num(back) / mid, 0.0), 0.0) + HEDGE_STAKE_COST
+        lay_cost = np.where(both, np.maximum(np.nan_to_num(lay) / mid - 1.0, 0.0), 0.0) + HEDGE_STAKE_COST
+
+        result = {
+            'mode': mode,
+            'feasible': True,
+            'hedges': [],
+            'worstBefore': round(float(base.min()), 2),
+            'worstCase': round(float(base.min()), 2),
+            'bestCase': round(float(base.max()), 2),
+            'worstNet': round(float(self._net_pnl(rows, value, stake).min()), 2),
+            'cost': 0.0,
+            'iterations': 0
+        }
+        if not (back_ok.any() or lay_ok.any()):
+            return result
+
+        back_cols = np.flatnonzero(back_ok)
+        lay_cols = np.flatnonzero(lay_ok)
+        A = np.hstack([
+            rows[:, back_cols] * back[back_cols] - 1.0,
+            1.0 - rows[:, lay_cols] * lay[lay_cols]
+        ])
+        cost = np.concatenate([back_cost[back_cols], lay_cost[lay_cols]])
+
+        # Lato opposto dello stesso runner per ogni candidato
+        opposite = np.full(A.shape[1], -1)
+        lay_index = {int(col): len(back_cols) + i for i, col in enumerate(lay_cols)}
+        for i, col in enumerate(back_cols):
+            j = lay_index.get(int(col))
+            if j is not None:
+                opposite[i], opposite[j] = j, i
+
+        # Stake sotto il minimo Betfair: fissati al valore ammesso piu vicino
+        # (0 o il minimo) bloccando anche il lato opposto del runner, poi il
+        # resto si risolve di nuovo compensando
+        x = np.zeros(A.shape[1])
+        free = np.ones(A.shape[1], dtype=bool)
+        while free.any():
+            x[free] = 0.0
+            shifted = base + A @ x
+            if mode == 'equalize':
+                solution, iterations = _equalize_hedge(A[:, free], shifted, cost[free], HEDGE_COST_WEIGHT)
+            else:
+                solution, iterations = _floor_hedge(A[:, free], floor - shifted, cost[free])
+            result['iterations'] += iterations
+            if solution is None:
+                result['feasible'] = False
+                logger.info(f"[SCORELINE] Hedge floor {floor:.2f} non raggiungibile")
+                return result
+            x[free] = solution
+            small = free & (x > 0) & (x < min_stake)
+            if not small.any():
+                break
+            for k in np.flatnonzero(small):
+                o = opposite[k]
+                if o >= 0 and x[o] > 0:
+                    # L'altro lato e' gia attivo: questo si scarta
+                    x[k] = 0.0
+                else:
+                    x[k] = min_stake if x[k] >= min_stake / 2.0 else 0.0
+                    if o >= 0 and free[o]:
+                        x[o] = 0.0
+                        free[o] = False
+                free[k] = False
+
+        back_stakes = np.zeros(n)
+        lay_stakes = np.zeros(n)
+        back_stakes[back_cols] = x[:len(back_cols)]
+        lay_stakes[lay_cols] = x[len(back_cols):]
+
+        back_stakes = np.round(back_stakes, 2)
+        lay_stakes = np.round(lay_stakes, 2)
+
+        value += back_stakes * np.nan_to_num(back) - lay_stakes * np.nan_to_num(lay)
+        stake += back_stakes - lay_stakes
+        after = rows @ value - stake.sum()
+
+        for col in np.flatnonzero(back_stakes + lay_stakes):
+            market_id, selection_id = keys[col]
+            for side, size, price in (('BACK', back_stakes[col], back[col]),
+                                      ('LAY', lay_stakes[col], lay[col])):
+                if size > 0:
+                    result['hedges'].append({
+                        'marketId': market_id,
+                        'selectionId': selection_id,
+                        'side': side,
+                        'price': float(price),
+                        'stake': float(size)
+                    })
+
+        spread_cost = (back_cost - HEDGE_STAKE_COST) @ back_stakes + (lay_cost - HEDGE_STAKE_COST) @ lay_stakes
+        result.update({
+            'worstCase': round(float(after.min()), 2),
+            'bestCase': round(float(after.max()), 2),
+            'worstNet': round(float(self._net_pnl(rows, value, stake).min()), 2),
+            'cost': round(float(spread_cost), 2)
+        })
+        logger.debug(
+            f"[SCORELINE] Hedge {mode}: {len(result['hedges'])} coperture, "
+            f"worst {result['worstBefore']} -> {result['worstCase']}"
+        )
+        return result
@@ -0,0 +1,167 @@
+"""
+Tick Ladder - Scala prezzi Betfair precalcolata per Pickfair
+
+Unica definizione della ladder ufficiale (1.01 - 1000, 350 prezzi validi)
+condivisa da order_manager, trading_engine_pro e BetfairClient.
+Tutte le operazioni lavorano per bisect o aritmetica sugli indici:
+
+    normalize_price / get_tick_size / tick_index      O(log n)
+    next_tick_up / next_tick_down / tick_offset       O(log n)
+    ticks_difference                                  O(log n)
+
+Varianti batch NumPy (normalize_prices, tick_indices,
+ticks_difference_batch) per vettori di prezzi.
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import List, Sequence
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+# ==============================================================================
+# LADDER UFFICIALE
+# ==============================================================================
+
+TICK_LADDER = [
+    (1.01, 2.0, 0.01),
+    (2.0, 3.0, 0.02),
+    (3.0, 4.0, 0.05),
+    (4.0, 6.0, 0.1),
+    (6.0, 10.0, 0.2),
+    (10.0, 20.0, 0.5),
+    (20.0, 30.0, 1.0),
+    (30.0, 50.0, 2.0),
+    (50.0, 100.0, 5.0),
+    (100.0, 1000.0, 10.0),
+]
+
+MIN_PRICE = 1.01
+MAX_PRICE = 1000.0
+
+
+def _build_prices() -> List[float]:
+    """Tutti i prezzi validi, calcolati in centesimi (niente drift float)."""
+    cents = [101]
+    for low, high, tick in TICK_LADDER:
+        step = int(round(tick * 100))
+        value = int(round(low * 100))
+        end = int(round(high * 100))
+        while value + step <= end:
+            value += step
+            cents.append(value)
+    return [c / 100.0 for c in cents]
+
+
+PRICES: List[float] = _build_prices()
+_LAST = len(PRICES) - 1
+
+# Limiti inferiori delle bande e relativo tick, per get_tick_size
+_BAND_LOWS = [low for low, _, _ in TICK_LADDER]
+_BAND_TICKS = [tick for _, _, tick in TICK_LADDER]
+
+if HAS_NUMPY:
+    PRICES_ARRAY = np.array(PRICES)
+
+
+# ==============================================================================
+# OPERAZIONI SCALARI
+# ==============================================================================
+
+def get_tick_size(price: float) -> float:
+    """Tick size della banda che contiene il prezzo (10.0 fuori range)."""
+    if price < MIN_PRICE or price >= MAX_PRICE:
+        return 10.0
+    return _BAND_TICKS[bisect_right(_BAND_LOWS, price) - 1]
+
+
+def tick_index(price: float) -> int:
+    """Indice nella ladder del prezzo valido piu vicino."""
+    if price <= MIN_PRICE:
+        return 0
+    if price >= MAX_PRICE:
+        return _LAST
+    i = bisect_left(PRICES, price)
+    # A parita di distanza vince il tick superiore (come round())
+    if price - PRICES[i - 1] < PRICES[i] - price:
+        return i - 1
+    return i
+
+
+def price_at(index: int) -> float:
+    """Prezzo all'indice dato, limitato agli estremi della ladder."""
+    return PRICES[min(max(index, 0), _LAST)]
+
+
+def is_valid_price(price: float) -> bool:
+    """True se il prezzo e' esattamente un tick Betfair."""
+    i = bisect_left(PRICES, price - 1e-9)
+    return i <= _LAST and abs(PRICES[i] - price) < 1e-9
+
+
+def normalize_price(price: float) -> float:
+    """Normalizza al tick Betfair valido piu vicino."""
+    return PRICES[tick_index(price)]
+
+
+def tick_offset(price: float, ticks: int) -> float:
+    """Prezzo spostato di N tick (negativo = verso il basso)."""
+    return price_at(tick_index(price) + ticks)
+
+
+def next_tick_up(price: float) -> float:
+    """Prossimo tick superiore."""
+    return tick_offset(price, 1)
+
+
+def next_tick_down(price: float) -> float:
+    """Prossimo tick inferiore."""
+    return tick_offset(price, -1)
+
+
+def ticks_difference(price1: float, price2: float) -> int:
+    """Tick con segno da price1 a price2 (positivo se price2 > price1)."""
+    return tick_index(price2) - tick_index(price1)
+
+
+# ==============================================================================
+# OPERAZIONI BATCH (NUMPY)
+# ==============================================================================
+
+def tick_indices(prices: Sequence[float]):
+    """Indici ladder dei tick piu vicini per un vettore di prezzi."""
+    if not HAS_NUMPY:
+        return [tick_index(p) for p in prices]
+    values = np.clip(np.asarray(prices, dtype=float), MIN_PRICE, MAX_PRICE)
+    upper = np.clip(np.searchsorted(PRICES_ARRAY, values, side='left'), 1, _LAST)
+    lower = upper - 1
+    take_lower = (values - PRICES_ARRAY[lower]) < (PRICES_ARRAY[upper] - values)
+    return np.where(take_lower, lower, upper)
+
+
+def normalize_prices(prices: Sequence[float]):
+    """normalize_price vettoriale."""
+    if not HAS_NUMPY:
+        return [normalize_price(p) for p in prices]
+    return PRICES_ARRAY[tick_indices(prices)]
+
+
+def tick_offsets(prices: Sequence[float], ticks):
+    """tick_offset vettoriale (ticks scalare o vettore)."""
+    if not HAS_NUMPY:
+        if isinstance(ticks, (int, float)):
+            ticks = [ticks] * len(prices)
+        return [tick_offset(p, int(t)) for p, t in zip(prices, ticks)]
+    idx = np.clip(tick_indices(prices) + np.asarray(ticks, dtype=int), 0, _LAST)
+    return PRICES_ARRAY[idx]
+
+
+def ticks_difference_batch(prices1: Sequence[float], prices2: Sequence[float]):
+    """ticks_difference vettoriale."""
+    if not HAS_NUMPY:
+        return [ticks_difference(a, b) for a, b in zip(prices1, prices2)]
+    return tick_indices(prices2) - tick_indices(prices1)
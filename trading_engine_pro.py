@@ -24,14 +24,29 @@ Moduli:
 """
 
 import asyncio
+import functools
+import threading
 import time
 import logging
 import sqlite3
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from enum import Enum
 from pathlib import Path
 
+import tick_ladder
+from dutching import (
+    MIXED_DEGENERATE,
+    MIXED_OK,
+    _solve_mixed_matrix,
+    solve_mixed_stakes,
+    solve_mixed_stakes_batch,
+)
+from tick_ladder import TICK_LADDER, get_tick_size, next_tick_up, next_tick_down
+
 try:
     import numpy as np
     HAS_NUMPY = True
@@ -52,74 +67,32 @@ TRAILING_GAP = 0.80          # EUR gap trailing cashout
 TELEGRAM_RATE_LIMIT = 0.35   # Secondi tra messaggi Telegram
 MAX_TELEGRAM_RETRY = 3       # Retry massimi Telegram
 FLOOD_WAIT_BASE = 1.5        # Secondi base flood wait
+STREAM_EVAL_INTERVAL = 0.2   # Secondi minimi tra due valutazioni della stessa selezione
+EXECUTION_WORKERS = 8        # Thread per chiamate Betfair dalle coroutine
+LOOP_LAG_INTERVAL = 0.1      # Secondi tra campioni di lag del loop
+LOOP_LAG_WINDOW = 600        # Campioni di lag conservati
+LOOP_LAG_WARN_MS = 250.0     # Soglia warning lag loop
 
 
 # ==============================================================================
 # TICK LADDER BETFAIR
 # ==============================================================================
 
-TICK_LADDER = [
-    (1.01, 2.0, 0.01),
-    (2.0, 3.0, 0.02),
-    (3.0, 4.0, 0.05),
-    (4.0, 6.0, 0.1),
-    (6.0, 10.0, 0.2),
-    (10.0, 20.0, 0.5),
-    (20.0, 30.0, 1.0),
-    (30.0, 50.0, 2.0),
-    (50.0, 100.0, 5.0),
-    (100.0, 1000.0, 10.0),
-]
-
-
-def get_tick_size(price: float) -> float:
-    """Tick size per un dato prezzo."""
-    for low, high, tick in TICK_LADDER:
-        if low <= price < high:
-            return tick
-    logger.debug(f"[TICK] Price {price} fuori range, usando tick=10.0")
-    return 10.0
-
-
 def normalize_price(price: float) -> float:
     """Normalizza al tick Betfair valido."""
-    original = price
-    if price < 1.01:
+    if price < tick_ladder.MIN_PRICE:
         logger.warning(f"[TICK] Price {price} < 1.01, normalizzato a 1.01")
-        return 1.01
-    if price >= 1000.0:
-        logger.warning(f"[TICK] Price {price} >= 1000, normalizzato a 1000.0")
-        return 1000.0
-    tick = get_tick_size(price)
-    normalized = round(round(price / tick) * tick, 2)
-    if normalized != original:
-        logger.debug(f"[TICK] Normalizzato: {original} -> {normalized} (tick={tick})")
+    elif price > tick_ladder.MAX_PRICE:
+        logger.warning(f"[TICK] Price {price} > 1000, normalizzato a 1000.0")
+    normalized = tick_ladder.normalize_price(price)
+    if normalized != price:
+        logger.debug(f"[TICK] Normalizzato: {price} -> {normalized}")
     return normalized
 
 
-def next_tick_up(price: float) -> float:
-    """Prossimo tick superiore."""
-    return normalize_price(price + get_tick_size(price))
-
-
-def next_tick_down(price: float) -> float:
-    """Prossimo tick inferiore."""
-    return normalize_price(max(1.01, price - get_tick_size(price)))
-
-
 def ticks_between(price1: float, price2: float) -> int:
     """Numero di tick tra due prezzi."""
-    if price1 == price2:
-        return 0
-    low, high = min(price1, price2), max(price1, price2)
-    ticks = 0
-    current = low
-    while current < high and ticks < 500:
-        current = next_tick_up(current)
-        ticks += 1
-    if ticks >= 500:
-        logger.warning(f"[TICK] ticks_between overflow: {price1} -> {price2}, capped at 500")
-    return ticks
+    return abs(tick_ladder.ticks_difference(price1, price2))
 
 
 # ==============================================================================
@@ -170,10 +143,35 @@ class BetState:
             self.size_remaining = self.stake
 
 
+# Stati finali: posizione non piu seguita ne' tracciata
+CLOSED_BET_STATUSES = (BetStatus.CASHED_OUT, BetStatus.CANCELLED)
+
+
 # ==============================================================================
 # 1. MIXED BACK+LAY SOLVER (NumPy)
 # ==============================================================================
 
+def mixed_coefficients(sides, prices, commission: float = COMMISSION):
+    """
+    Coefficienti (d, o) del sistema misto: impatto della bet j sull'esito
+    j (d_j) e su ogni altro esito (o_j).
+    
+    BACK: d = (price-1) * (1-comm), o = -1
+    LAY:  d = -(price-1),           o = (1-comm)
+    
+    prices puo essere una lista (n) o una matrice (m, n) con NumPy.
+    """
+    if HAS_NUMPY and not isinstance(prices, list):
+        p = np.asarray(prices, dtype=float)
+        is_back = np.asarray([s == 'BACK' for s in sides])
+        d = np.where(is_back, (p - 1) * (1 - commission), -(p - 1))
+        o = np.where(is_back, -1.0, 1 - commission) * np.ones_like(p)
+        return d, o
+    d = [(p - 1) * (1 - commission) if s == 'BACK' else -(p - 1) for s, p in zip(sides, prices)]
+    o = [-1.0 if s == 'BACK' else (1 - commission) for s in sides]
+    return d, o
+
+
 def calculate_mixed_dutching_numpy(
     bets: List[Dict],
     target_profit: float,
@@ -191,14 +189,12 @@ def calculate_mixed_dutching_numpy(
         (stakes, guaranteed_profit)
     
     Sistema: A * x = b
-        A = matrice impatto ogni bet su ogni esito
+        A = 1·oᵀ + diag(d - o) (impatto ogni bet su ogni esito)
         x = stakes da calcolare
         b = target profit per ogni esito
+    Risolto in forma chiusa O(n) (dutching.solve_mixed_stakes); la
+    matrice densa resta solo per i casi degeneri.
     """
-    if not HAS_NUMPY:
-        logger.error("[MIXED] NumPy non disponibile!")
-        return [], 0
-    
     n = len(bets)
     if n == 0:
         logger.warning("[MIXED] Nessuna bet fornita")
@@ -207,77 +203,58 @@ def calculate_mixed_dutching_numpy(
     logger.info(f"[MIXED] Risolvo sistema {n}x{n} per target={target_profit:.2f} EUR")
     logger.debug(f"[MIXED] Input bets: {bets}")
     
-    # Costruisci matrice A e vettore b
-    A = []
-    b = []
+    diag, off = mixed_coefficients([b['side'] for b in bets], [b['price'] for b in bets], commission)
+    stakes, status = solve_mixed_stakes(diag, off, target_profit)
+    logger.debug(f"[MIXED] Soluzione forma chiusa: {stakes} ({status})")
     
-    for i in range(n):
-        row = []
-        for j, bet in enumerate(bets):
-            price = bet['price']
-            side = bet['side']
-            
-            if i == j:
-                # Impatto su se stesso (se vince questa selezione)
-                if side == 'BACK':
-                    # BACK: vinciamo (price-1) * stake - commissione
-                    row.append((price - 1) * (1 - commission))
-                else:
-                    # LAY: perdiamo (price-1) * stake
-                    row.append(-(price - 1))
-            else:
-                # Impatto su altri esiti
-                if side == 'BACK':
-                    # BACK su altra selezione: perdiamo stake
-                    row.append(-1)
-                else:
-                    # LAY su altra selezione: vinciamo stake - commissione
-                    row.append(1 * (1 - commission))
-        
-        A.append(row)
-        b.append(target_profit)
-    
-    try:
-        A_np = np.array(A, dtype=float)
-        b_np = np.array(b, dtype=float)
-        
-        logger.debug(f"[MIXED] Matrice A:\n{A_np}")
-        logger.debug(f"[MIXED] Vettore b: {b_np}")
-        
-        # Verifica determinante
-        det = np.linalg.det(A_np)
-        logger.debug(f"[MIXED] Determinante matrice: {det:.6f}")
-        
-        if abs(det) < 1e-10:
-            logger.error(f"[MIXED] Matrice quasi singolare! det={det}")
-        
-        # Risolvi sistema
-        stakes = np.linalg.solve(A_np, b_np)
-        logger.debug(f"[MIXED] Soluzione grezza: {stakes}")
-        
-        # Verifica soluzione valida (stake positivi)
-        if np.any(stakes < 0):
+    if status != MIXED_OK:
+        if not HAS_NUMPY:
+            logger.error(f"[MIXED] Soluzione {status}: serve NumPy per least squares")
+            return [], 0
+        if status == MIXED_DEGENERATE:
+            logger.error("[MIXED] Matrice quasi singolare, uso least squares")
+        else:
             logger.warning(f"[MIXED] Soluzione con stake negativi: {stakes}")
             logger.info("[MIXED] Provo least squares per approssimazione...")
-            stakes, residuals, rank, s = np.linalg.lstsq(A_np, b_np, rcond=None)
-            stakes = np.maximum(stakes, 0)
-            logger.info(f"[MIXED] Least squares: stakes={stakes}, residuals={residuals}")
-        
-        stakes_list = [round(s, 2) for s in stakes.tolist()]
-        total_stake = sum(stakes_list)
-        
-        # Verifica profitto reale
-        logger.info(f"[MIXED] SUCCESSO: stakes={stakes_list}, total={total_stake:.2f}")
-        
-        return stakes_list, target_profit
-        
-    except np.linalg.LinAlgError as e:
-        logger.error(f"[MIXED] ERRORE Sistema singolare: {e}")
-        logger.error(f"[MIXED] Matrice A: {A}")
-        return [], 0
-    except Exception as e:
-        logger.error(f"[MIXED] ERRORE Inatteso: {type(e).__name__}: {e}")
-        return [], 0
+        try:
+            stakes = [max(x, 0.0) for x in _solve_mixed_matrix(diag, off, target_profit)]
+        except np.linalg.LinAlgError as e:
+            logger.error(f"[MIXED] ERRORE Sistema singolare: {e}")
+            return [], 0
+        logger.info(f"[MIXED] Least squares: stakes={stakes}")
+    
+    stakes_list = [round(s, 2) for s in stakes]
+    total_stake = sum(stakes_list)
+    
+    logger.info(f"[MIXED] SUCCESSO: stakes={stakes_list}, total={total_stake:.2f}")
+    
+    return stakes_list, target_profit
+
+
+def calculate_mixed_dutching_batch(
+    sides: List[str],
+    prices,
+    targets,
+    commission: float = COMMISSION
+):
+    """
+    Mixed dutching per molti scenari (quote, target) in una passata.
+    
+    Args:
+        sides: lato di ogni bet ('BACK'/'LAY'), comune agli scenari
+        prices: matrice (m, n) delle quote
+        targets: vettore (m,) dei profitti target
+    
+    Returns:
+        (stakes (m, n) arrotondati, status per scenario)
+    """
+    if HAS_NUMPY:
+        d, o = mixed_coefficients(sides, np.atleast_2d(np.asarray(prices, dtype=float)), commission)
+        stakes, status = solve_mixed_stakes_batch(d, o, targets)
+        return np.round(stakes, 2), status
+    rows = [mixed_coefficients(sides, list(p), commission) for p in prices]
+    stakes, status = solve_mixed_stakes_batch([r[0] for r in rows], [r[1] for r in rows], targets)
+    return [[round(x, 2) for x in row] for row in stakes], status
 
 
 def calculate_mixed_dutching_fallback(
@@ -319,9 +296,8 @@ def calculate_mixed_dutching_fallback(
         return stakes, target_profit
     
     else:
-        # Misto senza NumPy: non supportato
-        logger.error("[MIXED FALLBACK] BACK+LAY misto richiede NumPy!")
-        return [], 0
+        # Misto: la forma chiusa O(n) non richiede NumPy
+        return calculate_mixed_dutching_numpy(bets, target_profit, commission)
 
 
 def calculate_mixed_dutching(
@@ -342,6 +318,122 @@ def calculate_mixed_dutching(
         return calculate_mixed_dutching_fallback(bets, target_profit, commission)
 
 
+# ==============================================================================
+# ESECUZIONE ASYNC (CHIAMATE BETFAIR FUORI DAL LOOP)
+# ==============================================================================
+
+class AsyncExecutionLayer:
+    """
+    Esegue le chiamate bloccanti del client Betfair su un pool di thread.
+    
+    Le coroutine degli engine fanno await senza bloccare il loop: molte
+    posizioni possono seguire il prezzo o chiudere in cashout in parallelo.
+    """
+    
+    def __init__(self, betfair_client, max_workers: int = EXECUTION_WORKERS):
+        self.client = betfair_client
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.metrics = {'calls': 0, 'errors': 0, 'in_flight': 0, 'max_in_flight': 0}
+        self.start()
+    
+    def start(self):
+        """Crea il pool (anche dopo uno shutdown: l'engine puo' ripartire)."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='engine-exec')
+    
+    async def call(self, method: str, **kwargs):
+        """await di client.<method>(**kwargs) eseguito nel pool."""
+        loop = asyncio.get_event_loop()
+        fn = functools.partial(getattr(self.client, method), **kwargs)
+        self.start()
+        self.metrics['calls'] += 1
+        self.metrics['in_flight'] += 1
+        self.metrics['max_in_flight'] = max(self.metrics['max_in_flight'], self.metrics['in_flight'])
+        try:
+            return await loop.run_in_executor(self._pool, fn)
+        except Exception:
+            self.metrics['errors'] += 1
+            raise
+        finally:
+            self.metrics['in_flight'] -= 1
+    
+    async def place_bet(self, **kwargs) -> Dict:
+        return await self.call('place_bet', **kwargs)
+    
+    async def replace_orders(self, **kwargs) -> Dict:
+        return await self.call('replace_orders', **kwargs)
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+# Un solo pool per client: gli engine creati senza executor lo condividono
+_SHARED_EXECUTORS: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+_SHARED_LOCK = threading.Lock()
+
+
+def shared_execution_layer(betfair_client) -> AsyncExecutionLayer:
+    """AsyncExecutionLayer condiviso per client (AutoFollow + TrailingCashout)."""
+    with _SHARED_LOCK:
+        try:
+            layer = _SHARED_EXECUTORS.get(betfair_client)
+            if layer is None:
+                layer = _SHARED_EXECUTORS[betfair_client] = AsyncExecutionLayer(betfair_client)
+        except TypeError:
+            # Client non referenziabile debolmente: pool dedicato
+            layer = AsyncExecutionLayer(betfair_client)
+    return layer
+
+
+class LoopLagMonitor:
+    """
+    Misura il ritardo del loop: dorme interval secondi e registra di
+    quanto si sveglia in ritardo. Lag alto = qualcosa blocca il loop.
+    """
+    
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, window: int = LOOP_LAG_WINDOW):
+        self.interval = interval
+        self.samples: deque = deque(maxlen=window)
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+    
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - expected) * 1000)
+            self.samples.append(lag_ms)
+            if lag_ms > self.max_lag_ms:
+                self.max_lag_ms = lag_ms
+            if lag_ms > LOOP_LAG_WARN_MS:
+                logger.warning(f"[LOOP LAG] Loop bloccato per {lag_ms:.0f}ms")
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+    
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+    
+    def get_metrics(self) -> Dict:
+        if not self.samples:
+            return {'samples': 0, 'last_ms': 0.0, 'avg_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+        ordered = sorted(self.samples)
+        return {
+            'samples': len(ordered),
+            'last_ms': round(self.samples[-1], 2),
+            'avg_ms': round(sum(ordered) / len(ordered), 2),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+            'max_ms': round(self.max_lag_ms, 2),
+        }
+
+
 # ==============================================================================
 # 2. AUTO-FOLLOW BEST PRICE + TICK LADDER DINAMICO
 # ==============================================================================
@@ -426,9 +518,11 @@ class AutoFollowEngine:
         self,
         betfair_client,
         profit_threshold: float = PROFIT_THRESHOLD,
-        cooldown: float = REPLACE_COOLDOWN
+        cooldown: float = REPLACE_COOLDOWN,
+        executor: Optional[AsyncExecutionLayer] = None
     ):
         self.client = betfair_client
+        self.executor = executor or shared_execution_layer(betfair_client)
         self.profit_threshold = profit_threshold
         self.cooldown = cooldown
         self.states: Dict[str, BetState] = {}
@@ -504,6 +598,10 @@ class AutoFollowEngine:
             'reason': None
         }
         
+        if bet.status in (BetStatus.REPLACING, BetStatus.HEDGING):
+            result['reason'] = "Operazione in corso"
+            return result
+        
         should, target, reason = self.should_follow(bet, best_back, best_lay)
         
         if not should:
@@ -519,7 +617,7 @@ class AutoFollowEngine:
         
         try:
             logger.debug(f"[AUTO-FOLLOW] Chiamata replaceOrders: market={bet.market_id}, betId={bet.bet_id}, price={target}")
-            response = self.client.replace_orders(
+            response = await self.executor.replace_orders(
                 market_id=bet.market_id,
                 bet_id=bet.bet_id,
                 new_price=target
@@ -567,64 +665,201 @@ class AutoFollowEngine:
 # 3. CASHOUT LIVE CON TRAILING PROFIT
 # ==============================================================================
 
+# Colonne di PositionBook
+POSITION_BOOK_COLUMNS = ('side', 'stake', 'entry', 'peak', 'live_back', 'live_lay', 'selection', 'active')
+
+
+class PositionBook:
+    """
+    Posizioni del trailing in array NumPy, una riga per posizione.
+    
+    Colonne: side (+1 BACK / -1 LAY), stake, prezzo ingresso, picco di
+    profitto, prezzi live back/lay, attiva. Una sola passata vettoriale
+    calcola profitto corrente, nuovo picco e trigger per tutte le righe.
+    """
+    
+    def __init__(self, capacity: int = 256):
+        self.bet_ids: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self._by_selection: Dict[int, List[int]] = {}
+        self.size = 0
+        self._alloc(capacity)
+    
+    def _alloc(self, capacity: int):
+        old = self.size
+        
+        for name in POSITION_BOOK_COLUMNS:
+            dtype = bool if name == 'active' else (np.int64 if name == 'selection' else float)
+            new = np.zeros(capacity, dtype=dtype)
+            arr = getattr(self, name, None)
+            if arr is not None:
+                new[:old] = arr[:old]
+            setattr(self, name, new)
+        self.capacity = capacity
+    
+    def add(self, bet: BetState):
+        if bet.bet_id in self.rows:
+            self.remove(bet.bet_id)
+        if self.size == self.capacity:
+            self._alloc(self.capacity * 2)
+        row = self.size
+        self.size += 1
+        self.bet_ids.append(bet.bet_id)
+        self.rows[bet.bet_id] = row
+        self._by_selection.setdefault(bet.selection_id, []).append(row)
+        self.side[row] = 1.0 if bet.side == 'BACK' else -1.0
+        self.stake[row] = bet.stake
+        self.entry[row] = bet.price
+        self.selection[row] = bet.selection_id
+        self.peak[row] = bet.max_profit
+        self.live_back[row] = self.live_lay[row] = 0.0
+        self.active[row] = True
+    
+    def update(self, bet: BetState):
+        """Riallinea lato, stake e prezzo di ingresso dopo un replace (prezzi live e picco restano)."""
+        row = self.rows.get(bet.bet_id)
+        if row is None:
+            return
+        self.side[row] = 1.0 if bet.side == 'BACK' else -1.0
+        self.stake[row] = bet.stake
+        self.entry[row] = bet.price
+        self.peak[row] = bet.max_profit
+    
+    def remove(self, bet_id: str):
+        row = self.rows.pop(bet_id, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self.bet_ids[row] = None
+        if self.size > 64 and len(self.rows) < self.size // 2:
+            self._compact()
+    
+    def _compact(self):
+        keep = np.nonzero(self.active[:self.size])[0]
+        for name in POSITION_BOOK_COLUMNS:
+            arr = getattr(self, name)
+            arr[:len(keep)] = arr[keep]
+        self.bet_ids = [self.bet_ids[i] for i in keep]
+        self.size = len(keep)
+        self.rows = {bet_id: i for i, bet_id in enumerate(self.bet_ids)}
+        self._by_selection = {}
+        for row, selection_id in enumerate(self.selection[:self.size].tolist()):
+            self._by_selection.setdefault(selection_id, []).append(row)
+    
+    def set_peak(self, bet_id: str, peak: float):
+        row = self.rows.get(bet_id)
+        if row is not None:
+            self.peak[row] = peak
+    
+    def set_prices(self, selection_id: int, back: float, lay: float):
+        """Aggiorna i prezzi live di tutte le righe di una selezione."""
+        rows = self._by_selection.get(selection_id)
+        if rows:
+            self.live_back[rows] = back or 0.0
+            self.live_lay[rows] = lay or 0.0
+    
+    def evaluate(self, trailing_gap: float, commission: float):
+        """
+        Passata vettoriale su tutte le righe.
+        
+        Prezzo di chiusura: lay per BACK, back per LAY.
+        hedge  = stake * entry / prezzo
+        profit = side * (hedge - stake), commissione sul positivo
+        
+        Returns:
+            (profit, hedge, righe con nuovo picco, righe in trigger)
+        """
+        n = self.size
+        side = self.side[:n]
+        price = np.where(side > 0, self.live_lay[:n], self.live_back[:n])
+        valid = self.active[:n] & (price > 1.0)
+        hedge = self.stake[:n] * self.entry[:n] / np.where(valid, price, 1.0)
+        profit = side * (hedge - self.stake[:n])
+        profit = np.round(np.where(profit > 0, profit * (1 - commission), profit), 2)
+        profit[~valid] = 0.0
+        
+        peak = self.peak[:n]
+        new_peak = valid & (profit > peak)
+        peak[new_peak] = profit[new_peak]
+        
+        trigger = valid & (peak > 0) & (profit < peak - trailing_gap)
+        return profit, np.round(hedge, 2), np.nonzero(new_peak)[0], np.nonzero(trigger)[0]
+
+
 class TrailingCashoutEngine:
     """
     Cashout con trailing profit - chiude quando ritraccia.
     
     Logica:
-        1. Traccia max_profit per ogni posizione
+        1. Traccia max_profit per ogni posizione (BACK e LAY)
         2. Se profit scende sotto max - trailing_gap -> CASHOUT
+    
+    Con NumPy monitor_all valuta tutte le posizioni in una passata
+    vettoriale (PositionBook); senza NumPy ciclo su check_trailing.
     """
     
     def __init__(
         self,
         betfair_client,
         trailing_gap: float = TRAILING_GAP,
-        commission: float = COMMISSION
+        commission: float = COMMISSION,
+        executor: Optional[AsyncExecutionLayer] = None
     ):
         self.client = betfair_client
+        self.executor = executor or shared_execution_layer(betfair_client)
         self.trailing_gap = trailing_gap
         self.commission = commission
         self.positions: Dict[str, BetState] = {}
+        self.book = PositionBook() if HAS_NUMPY else None
     
     def add_position(self, bet: BetState):
         """Aggiungi posizione da monitorare."""
         self.positions[bet.bet_id] = bet
+        if self.book is not None:
+            self.book.add(bet)
         logger.info(f"[TRAILING] Posizione aggiunta: {bet.bet_id} {bet.side}@{bet.price} stake={bet.stake:.2f}")
     
+    def update_position(self, bet: BetState):
+        """Posizione modificata (prezzo, stake, betId): riallinea la riga del book."""
+        if self.book is not None and bet.bet_id in self.positions:
+            self.book.update(bet)
+    
+    def remove_position(self, bet_id: str):
+        """Smetti di monitorare una posizione."""
+        self.positions.pop(bet_id, None)
+        if self.book is not None:
+            self.book.remove(bet_id)
+    
     def calculate_position_profit(
         self,
         bet: BetState,
         live_price: float
     ) -> Tuple[float, float]:
         """
-        Calcola profitto attuale e lay stake per cashout.
+        Calcola profitto attuale e stake di copertura per cashout.
+        
+        live_price: prezzo di chiusura (lay per BACK, back per LAY).
         
         Returns:
-            (current_profit, lay_stake_needed)
+            (current_profit, hedge_stake_needed)
         """
-        if bet.side != 'BACK':
-            logger.debug(f"[TRAILING] {bet.bet_id}: Skip side={bet.side} (solo BACK supportato)")
-            return 0, 0
-        
         if live_price <= 1:
             logger.warning(f"[TRAILING] {bet.bet_id}: live_price={live_price} non valido")
             return 0, 0
         
-        # Profitto se vince al prezzo attuale
-        win_profit = bet.stake * (bet.price - 1)
-        
-        # Lay stake per pareggiare
-        lay_stake = (bet.stake * bet.price) / live_price
+        # Stake di copertura per pareggiare
+        hedge_stake = (bet.stake * bet.price) / live_price
         
-        # Profitto cashout (uniforme)
-        cashout_profit = (bet.stake * bet.price / live_price) - bet.stake
+        # Profitto cashout (uniforme): BACK incassa hedge - stake, LAY l'opposto
+        cashout_profit = hedge_stake - bet.stake
+        if bet.side != 'BACK':
+            cashout_profit = -cashout_profit
         
         if cashout_profit > 0:
             cashout_profit *= (1 - self.commission)
         
-        logger.debug(f"[TRAILING] {bet.bet_id}: live={live_price}, profit={cashout_profit:.2f}, lay_stake={lay_stake:.2f}")
-        return round(cashout_profit, 2), round(lay_stake, 2)
+        logger.debug(f"[TRAILING] {bet.bet_id}: live={live_price}, profit={cashout_profit:.2f}, hedge_stake={hedge_stake:.2f}")
+        return round(cashout_profit, 2), round(hedge_stake, 2)
     
     def check_trailing(
         self,
@@ -642,6 +877,8 @@ class TrailingCashoutEngine:
         # Aggiorna max profit
         if current_profit > bet.max_profit:
             bet.max_profit = current_profit
+            if self.book is not None:
+                self.book.set_peak(bet.bet_id, current_profit)
             logger.debug(f"[TRAILING] {bet.bet_id}: new max={bet.max_profit:.2f}")
         
         # Check trailing
@@ -657,7 +894,7 @@ class TrailingCashoutEngine:
         live_price: float
     ) -> Dict:
         """
-        Esegue cashout per singola posizione.
+        Esegue cashout per singola posizione (LAY per BACK, BACK per LAY).
         """
         result = {
             'success': False,
@@ -666,37 +903,46 @@ class TrailingCashoutEngine:
             'reason': None
         }
         
-        current_profit, lay_stake = self.calculate_position_profit(bet, live_price)
+        if bet.status in (BetStatus.REPLACING, BetStatus.HEDGING):
+            # Replace del follow o cashout in volo: un secondo hedge raddoppierebbe la copertura
+            result['reason'] = "Cashout gia in corso" if bet.status == BetStatus.HEDGING else "Replace in corso"
+            return result
+        
+        current_profit, hedge_stake = self.calculate_position_profit(bet, live_price)
+        hedge_side = 'LAY' if bet.side == 'BACK' else 'BACK'
         
-        if lay_stake < 2:  # Stake minimo Betfair
+        if hedge_stake < 2:  # Stake minimo Betfair
             result['reason'] = "Stake troppo basso"
-            logger.warning(f"[CASHOUT] {bet.bet_id}: lay_stake={lay_stake:.2f} < 2 EUR minimo")
+            logger.warning(f"[CASHOUT] {bet.bet_id}: hedge_stake={hedge_stake:.2f} < 2 EUR minimo")
             return result
         
         bet.status = BetStatus.HEDGING
-        logger.info(f"[CASHOUT] {bet.bet_id}: Eseguo cashout LAY@{live_price} x{lay_stake:.2f}")
+        logger.info(f"[CASHOUT] {bet.bet_id}: Eseguo cashout {hedge_side}@{live_price} x{hedge_stake:.2f}")
         
         try:
             logger.debug(f"[CASHOUT] Chiamata place_bet: market={bet.market_id}, sel={bet.selection_id}")
-            response = self.client.place_bet(
+            response = await self.executor.place_bet(
                 market_id=bet.market_id,
                 selection_id=bet.selection_id,
-                side='LAY',
+                side=hedge_side,
                 price=live_price,
-                size=lay_stake
+                size=hedge_stake
             )
             logger.debug(f"[CASHOUT] Response: {response}")
             
             if response.get('status') == 'SUCCESS':
                 bet.status = BetStatus.CASHED_OUT
                 bet.current_profit = current_profit
+                if self.book is not None:
+                    self.book.remove(bet.bet_id)
                 
                 result['success'] = True
                 result['profit'] = current_profit
-                result['layStake'] = lay_stake
+                result['hedgeSide'] = hedge_side
+                result['layStake'] = hedge_stake
                 result['layPrice'] = live_price
                 
-                logger.info(f"[CASHOUT] SUCCESSO: {bet.bet_id} profit={current_profit:.2f} EUR (LAY@{live_price}x{lay_stake:.2f})")
+                logger.info(f"[CASHOUT] SUCCESSO: {bet.bet_id} profit={current_profit:.2f} EUR ({hedge_side}@{live_price}x{hedge_stake:.2f})")
             else:
                 error_msg = response.get('errorCode', response.get('status', 'UNKNOWN'))
                 result['reason'] = error_msg
@@ -715,20 +961,45 @@ class TrailingCashoutEngine:
     
     async def monitor_all(
         self,
-        live_prices: Dict[int, float]
+        live_prices: Dict[int, object]
     ) -> List[Dict]:
         """
         Monitora tutte le posizioni e esegue cashout se necessario.
+        
+        Args:
+            live_prices: {selectionId: {'back': X, 'lay': Y}} oppure
+                {selectionId: prezzo} (prezzo di chiusura per tutti i lati)
         """
-        results = []
+        if self.book is not None:
+            triggered, active_count = self._scan_vectorized(live_prices)
+        else:
+            triggered, active_count = self._scan_loop(live_prices)
+        
+        # Cashout in parallelo (le chiamate girano nel pool dell'executor)
+        results = list(await asyncio.gather(*triggered)) if triggered else []
+        
+        if results:
+            logger.info(f"[TRAILING MONITOR] Eseguiti {len(results)} cashout su {active_count} posizioni attive")
+        
+        return results
+    
+    @staticmethod
+    def _closing_price(bet: BetState, prices) -> float:
+        """Prezzo di chiusura: lay per BACK, back per LAY."""
+        if isinstance(prices, dict):
+            return prices.get('lay' if bet.side == 'BACK' else 'back') or 0
+        return prices or 0
+    
+    def _scan_loop(self, live_prices: Dict) -> Tuple[List, int]:
+        triggered = []
         active_count = 0
         
         for bet in list(self.positions.values()):
-            if bet.status in [BetStatus.CASHED_OUT, BetStatus.CANCELLED]:
+            if bet.status in CLOSED_BET_STATUSES:
                 continue
             
             active_count += 1
-            live_price = live_prices.get(bet.selection_id)
+            live_price = self._closing_price(bet, live_prices.get(bet.selection_id))
             if not live_price:
                 logger.debug(f"[TRAILING MONITOR] {bet.bet_id}: Nessun prezzo live per sel={bet.selection_id}")
                 continue
@@ -737,13 +1008,38 @@ class TrailingCashoutEngine:
             
             if should_cashout:
                 logger.info(f"[TRAILING MONITOR] {bet.bet_id}: TRIGGER cashout! current={current:.2f}, max={max_p:.2f}")
-                result = await self.execute_cashout(bet, live_price)
-                results.append(result)
+                triggered.append(self.execute_cashout(bet, live_price))
         
-        if results:
-            logger.info(f"[TRAILING MONITOR] Eseguiti {len(results)} cashout su {active_count} posizioni attive")
+        return triggered, active_count
+    
+    def _scan_vectorized(self, live_prices: Dict) -> Tuple[List, int]:
+        book = self.book
+        book.live_back[:book.size] = 0.0
+        book.live_lay[:book.size] = 0.0
+        for selection_id, prices in live_prices.items():
+            if isinstance(prices, dict):
+                book.set_prices(selection_id, prices.get('back'), prices.get('lay'))
+            else:
+                book.set_prices(selection_id, prices, prices)
         
-        return results
+        profit, _, peaked, trigger = book.evaluate(self.trailing_gap, self.commission)
+        
+        # Solo le righe cambiate tornano negli oggetti BetState
+        for row in peaked.tolist():
+            bet = self.positions.get(book.bet_ids[row])
+            if bet is not None:
+                bet.max_profit = float(book.peak[row])
+        
+        triggered = []
+        for row in trigger.tolist():
+            bet = self.positions.get(book.bet_ids[row])
+            if bet is None or bet.status in CLOSED_BET_STATUSES:
+                continue
+            live_price = float(book.live_lay[row] if bet.side == 'BACK' else book.live_back[row])
+            logger.info(f"[TRAILING MONITOR] {bet.bet_id}: TRIGGER cashout! current={profit[row]:.2f}, max={book.peak[row]:.2f}")
+            triggered.append(self.execute_cashout(bet, live_price))
+        
+        return triggered, len(book.rows)
 
 
 # ==============================================================================
@@ -1032,24 +1328,36 @@ class TradingEnginePro:
         self,
         betfair_client,
         telegram_client=None,
-        config: Dict = None
+        config: Dict = None,
+        stream=None
     ):
         self.betfair = betfair_client
         self.telegram = telegram_client
+        # BetfairStream per gli update mercato; default: quello collegato al client
+        self.stream_source = stream
         
         cfg = config or {}
         
+        # Esecuzione async condivisa + monitor lag del loop
+        self.executor = AsyncExecutionLayer(
+            betfair_client,
+            max_workers=cfg.get('execution_workers', EXECUTION_WORKERS)
+        )
+        self.loop_lag = LoopLagMonitor()
+        
         # Engines
         self.auto_follow = AutoFollowEngine(
             betfair_client,
             profit_threshold=cfg.get('profit_threshold', PROFIT_THRESHOLD),
-            cooldown=cfg.get('replace_cooldown', REPLACE_COOLDOWN)
+            cooldown=cfg.get('replace_cooldown', REPLACE_COOLDOWN),
+            executor=self.executor
         )
         
         self.trailing_cashout = TrailingCashoutEngine(
             betfair_client,
             trailing_gap=cfg.get('trailing_gap', TRAILING_GAP),
-            commission=cfg.get('commission', COMMISSION)
+            commission=cfg.get('commission', COMMISSION),
+            executor=self.executor
         )
         
         if telegram_client:
@@ -1066,15 +1374,52 @@ class TradingEnginePro:
         
         # State
         self.positions: Dict[str, BetState] = {}
+        self._index: Dict[Tuple[str, int], Set[str]] = {}
         self.running = False
+        
+        # Stream: coalescing per (mercato, selezione) + rate limit
+        self.stream_interval = cfg.get('stream_interval', STREAM_EVAL_INTERVAL)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stream = None
+        self._pending: Dict[Tuple[str, int], Tuple[float, float]] = {}
+        self._pending_lock = threading.Lock()
+        self._scheduled: Set[Tuple[str, int]] = set()
+        self._inflight: Set[Tuple[str, int]] = set()
+        self._last_eval: Dict[Tuple[str, int], float] = {}
+        self.stream_metrics = {'updates': 0, 'coalesced': 0, 'evaluations': 0}
     
     def add_position(self, bet: BetState):
         """Aggiungi posizione."""
         self.positions[bet.bet_id] = bet
+        self._index.setdefault((bet.market_id, bet.selection_id), set()).add(bet.bet_id)
         self.auto_follow.register(bet)
         self.trailing_cashout.add_position(bet)
         logger.info(f"[ENGINE PRO] Posizione aggiunta: {bet.bet_id} {bet.side}@{bet.price}, totale={len(self.positions)}")
     
+    def remove_position(self, bet_id: str):
+        """Rimuovi posizione (e dall'indice per mercato/selezione)."""
+        bet = self.positions.pop(bet_id, None)
+        if bet is None:
+            return
+        key = (bet.market_id, bet.selection_id)
+        ids = self._index.get(key)
+        if ids is not None:
+            ids.discard(bet_id)
+            if not ids:
+                self._index.pop(key, None)
+        self.auto_follow.states.pop(bet_id, None)
+        self.trailing_cashout.remove_position(bet_id)
+    
+    def positions_for(self, market_id: str, selection_id: int) -> List[BetState]:
+        """Posizioni aperte su (mercato, selezione) - lookup O(1)."""
+        ids = self._index.get((market_id, selection_id))
+        if not ids:
+            return []
+        return [
+            self.positions[b] for b in ids
+            if b in self.positions and self.positions[b].status not in CLOSED_BET_STATUSES
+        ]
+    
     def calculate_dutching(
         self,
         bets: List[Dict],
@@ -1092,6 +1437,8 @@ class TradingEnginePro:
         """
         Processa update mercato.
         
+        Tocca solo le posizioni indicizzate sulle selezioni aggiornate.
+        
         Args:
             market_id: ID mercato
             live_prices: {selectionId: {'back': X, 'lay': Y}}
@@ -1104,34 +1451,24 @@ class TradingEnginePro:
             'broadcasts': []
         }
         
-        positions_checked = 0
-        
-        # 1. Auto-follow per ogni posizione
-        for bet in self.positions.values():
-            if bet.market_id != market_id:
-                continue
-            if bet.status in [BetStatus.CASHED_OUT, BetStatus.CANCELLED]:
-                continue
-            
-            positions_checked += 1
-            prices = live_prices.get(bet.selection_id, {})
+        tasks = []
+        for selection_id, prices in live_prices.items():
             back = prices.get('back', 0)
             lay = prices.get('lay', 0)
-            
-            if back and lay:
-                result = await self.auto_follow.follow(bet, back, lay)
-                results['auto_follow'].append(result)
-                if result.get('success'):
-                    logger.info(f"[ENGINE PRO] Auto-follow eseguito: {bet.bet_id}")
-        
-        # 2. Check trailing cashout
-        lay_prices = {k: v.get('lay', 0) for k, v in live_prices.items()}
-        cashouts = await self.trailing_cashout.monitor_all(lay_prices)
-        results['cashouts'] = cashouts
-        
-        # 3. Broadcast cashouts
-        if self.telegram_broadcast and cashouts:
-            for cashout in cashouts:
+            for bet in self.positions_for(market_id, selection_id):
+                tasks.append(self._process_position(bet, back, lay))
+        positions_checked = len(tasks)
+        
+        # Posizioni elaborate in parallelo: le chiamate API non bloccano il loop
+        for follow, cashout in await asyncio.gather(*tasks):
+            if follow:
+                results['auto_follow'].append(follow)
+            if cashout:
+                results['cashouts'].append(cashout)
+        
+        # Broadcast cashouts
+        if self.telegram_broadcast and results['cashouts']:
+            for cashout in results['cashouts']:
                 if cashout.get('success'):
                     msg = f"Cashout: +{cashout['profit']:.2f} EUR"
                     logger.info(f"[ENGINE PRO] Cashout broadcast: {msg}")
@@ -1147,10 +1484,136 @@ class TradingEnginePro:
         
         return results
     
+    async def _process_position(
+        self,
+        bet: BetState,
+        back: float,
+        lay: float
+    ) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Auto-follow + trailing cashout di una posizione. Returns (follow, cashout)."""
+        follow = None
+        cashout = None
+        
+        # 1. Auto-follow
+        if back and lay:
+            follow = await self.auto_follow.follow(bet, back, lay)
+            if follow.get('success'):
+                # Nuovo prezzo di ingresso anche per la valutazione vettoriale
+                self.trailing_cashout.update_position(bet)
+                logger.info(f"[ENGINE PRO] Auto-follow eseguito: {bet.bet_id}")
+        
+        # 2. Trailing cashout (solo posizioni registrate nel trailing)
+        closing = lay if bet.side == 'BACK' else back
+        if closing and bet.bet_id in self.trailing_cashout.positions and bet.status not in CLOSED_BET_STATUSES:
+            should_cashout, current, max_p = self.trailing_cashout.check_trailing(bet, closing)
+            if should_cashout:
+                logger.info(f"[ENGINE PRO] {bet.bet_id}: TRIGGER cashout! current={current:.2f}, max={max_p:.2f}")
+                cashout = await self.trailing_cashout.execute_cashout(bet, closing)
+        
+        if bet.status in CLOSED_BET_STATUSES:
+            self.remove_position(bet.bet_id)
+        return follow, cashout
+    
+    # ==============================
+    # STREAM
+    # ==============================
+    
+    def attach_stream(self, stream, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Sottoscrive l'engine agli update mercato di BetfairStream.
+        
+        Gli update arrivano sul thread dello stream: vengono coalescati per
+        (mercato, selezione) e passati al loop con call_soon_threadsafe.
+        """
+        if loop is not None:
+            self._loop = loop
+        self.detach_stream()
+        self._stream = stream
+        stream.add_market_listener(self.on_stream_update)
+        logger.info("[ENGINE PRO] Sottoscritto allo stream mercati")
+    
+    def detach_stream(self):
+        """Annulla la sottoscrizione allo stream."""
+        if self._stream is not None:
+            self._stream.remove_market_listener(self.on_stream_update)
+            self._stream = None
+    
+    def on_stream_update(self, update: Dict):
+        """
+        Listener dello stream (thread dello stream).
+        
+        Update senza posizioni sulla selezione: scartati subito.
+        Piu update sulla stessa selezione prima dell'elaborazione: resta
+        solo l'ultimo prezzo (coalescing).
+        """
+        key = (update.get('market_id'), update.get('selection_id'))
+        if key not in self._index or self._loop is None or not self.running:
+            return
+        
+        with self._pending_lock:
+            self.stream_metrics['updates'] += 1
+            self._pending[key] = (update.get('back_price') or 0, update.get('lay_price') or 0)
+            if key in self._scheduled:
+                self.stream_metrics['coalesced'] += 1
+                return
+            self._scheduled.add(key)
+        self._loop.call_soon_threadsafe(self._dispatch_key, key)
+    
+    def _dispatch_key(self, key: Tuple[str, int]):
+        """Avvia l'elaborazione di una selezione (thread del loop)."""
+        if key in self._inflight:
+            return  # riprogrammato da _key_done
+        
+        wait = self._last_eval.get(key, 0) + self.stream_interval - time.monotonic()
+        if wait > 0:
+            self._loop.call_later(wait, self._dispatch_key, key)
+            return
+        
+        with self._pending_lock:
+            prices = self._pending.pop(key, None)
+            self._scheduled.discard(key)
+        if prices is None:
+            return
+        
+        self._inflight.add(key)
+        task = asyncio.ensure_future(self._process_key(key, *prices))
+        task.add_done_callback(lambda _t, k=key: self._key_done(k))
+    
+    def _key_done(self, key: Tuple[str, int]):
+        self._inflight.discard(key)
+        self._last_eval[key] = time.monotonic()
+        with self._pending_lock:
+            again = key in self._pending
+        if again:
+            self._dispatch_key(key)
+        elif key not in self._index:
+            self._last_eval.pop(key, None)
+    
+    async def _process_key(self, key: Tuple[str, int], back: float, lay: float):
+        self.stream_metrics['evaluations'] += 1
+        bets = self.positions_for(*key)
+        outcomes = await asyncio.gather(
+            *(self._process_position(bet, back, lay) for bet in bets),
+            return_exceptions=True
+        )
+        for bet, outcome in zip(bets, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"[ENGINE PRO] Errore update stream {bet.bet_id}: {outcome}")
+    
     async def start(self):
         """Avvia engine."""
         self.running = True
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
         logger.info(f"[ENGINE PRO] Avvio con {len(self.positions)} posizioni")
+        self.executor.start()
+        self.loop_lag.start()
+        
+        stream = self.stream_source or getattr(self.betfair, 'order_stream', None)
+        if stream is not None:
+            self.attach_stream(stream, self._loop)
+        else:
+            logger.info("[ENGINE PRO] Nessuno stream: solo process_market_update")
         
         if self.telegram_broadcast:
             asyncio.create_task(self.telegram_broadcast.worker())
@@ -1162,6 +1625,9 @@ class TradingEnginePro:
         """Ferma engine."""
         logger.info(f"[ENGINE PRO] Stop richiesto, {len(self.positions)} posizioni attive")
         self.running = False
+        self.detach_stream()
+        self.loop_lag.stop()
+        self.executor.shutdown()
         
         if self.telegram_broadcast:
             self.telegram_broadcast.stop()
@@ -1174,6 +1640,9 @@ class TradingEnginePro:
         status = {
             'running': self.running,
             'positions': len(self.positions),
+            'stream': dict(self.stream_metrics),
+            'execution': dict(self.executor.metrics),
+            'loop_lag': self.loop_lag.get_metrics(),
             'telegram_metrics': (
                 self.telegram_broadcast.get_metrics() 
                 if self.telegram_broadcast else None